@@ -1,9 +1,89 @@
-from flask import Flask, render_template, url_for, request, jsonify
+from flask import Flask, render_template, url_for, request, jsonify, session
+from flask import Response, stream_with_context
 from chemistry.chemfig import smiles_mol_to_chemfig, get_name, update_chemfig
+from chemistry.chemfig import update_session_chemfig, conversions, sessions
+from chemistry.chemfig import pdf_job_result, pdf_jobs, live_compiles
+from chemistry.chemfig import bulk_converter, pdf_store, scheduler
+from chemistry.chemfig import form_options
+from chemistry.scheduler import Overloaded
+from chemistry import bulk
+from mol2chemfig import metrics, pdfgen, pubchem
+from mol2chemfig.common import MCFError
+from mol2chemfig.records import iter_records, read_molecule
+import io
 import os
+import subprocess
+import uuid
 
 app = Flask(__name__)
 
+# compile against a format file with the preamble precompiled; 0 disables this
+if os.environ.get('MOL2CHEMFIG_LATEX_FORMAT', '1') != '0':
+    try:
+        pdfgen.build_format()
+    except (OSError, subprocess.SubprocessError) as e:
+        print("Not using a LaTeX format file: %s" % e)
+
+# keep pdflatex processes warm, with the preamble loaded; 0 disables this
+latex_workers = int(os.environ.get('MOL2CHEMFIG_LATEX_WORKERS', 2))
+if latex_workers:
+    pdfgen.start_pool(size=latex_workers)
+# must be shared by all workers, or sessions won't survive a worker change
+app.secret_key = os.environ.get('MOL2CHEMFIG_SECRET_KEY') or os.urandom(24)
+
+metrics.register_stats('conversions', conversions.stats)
+metrics.register_stats('sessions', sessions.stats)
+metrics.register_stats('pdf_jobs', pdf_jobs.stats)
+metrics.register_stats('live_compiles', live_compiles.stats)
+metrics.register_stats('pdf_store', pdf_store.stats)
+metrics.register_stats('pubchem', pubchem.resolver.stats)
+metrics.register_stats('scheduler', scheduler.stats)
+metrics.register_stats(
+    'latex_pool', lambda: pdfgen.POOL.stats() if pdfgen.POOL else None)
+
+
+@app.errorhandler(Overloaded)
+def overloaded(error):
+    return (jsonify(chem_fig = None, pdf_link = 'Server is busy, please retry'),
+            503, {'Retry-After': str(error.retry_after)})
+
+@app.errorhandler(MCFError)
+def invalid_options(error):
+    return jsonify(chem_fig = None, pdf_link = str(error)), 400
+
+@app.before_request
+def start_timing():
+    metrics.begin_request()
+
+@app.after_request
+def server_timing(response):
+    timing = metrics.end_request()
+    if timing:
+        response.headers['Server-Timing'] = timing
+    return response
+
+
+def session_id():
+    '''
+    identifies the user's molecule in the session store
+    '''
+    if 'id' not in session:
+        session['id'] = uuid.uuid4().hex
+    return session['id']
+
+
+def pdf_reply(chemfig, job, svg):
+    '''
+    JSON answer carrying the chemfig code, an svg preview and where
+    to fetch the pdf
+    '''
+    if chemfig is None:
+        # job holds the error message
+        return jsonify(chem_fig = None, pdf_link = job)
+    if job is None:
+        return jsonify(chem_fig = chemfig, svg = svg, pdf_job = None, pdf_link = 'pdf generation foobared')
+    return jsonify(chem_fig = chemfig, svg = svg, pdf_job = job, pdf_url = url_for('pdf_job', job = job))
+
 @app.route('/mol_2_chemfig')
 def home():    
     return render_template('home.html', pdflink = "static/files/welcome.pdf")
@@ -22,52 +102,125 @@ def get_smile():
     name = get_name(chemical)
     return  jsonify(smiles = name)
 
-# Keeps track of the last content in the text area
-last_data = ["text"]
-    
-@app.route("/mol_2_chemfig/smiles_to_chemfig")
+def molecule_lines():
+    '''
+    the lines of the molecule sent by the client: the body of a POST,
+    read as a stream, or else the smiles_mol parameter
+    '''
+    if request.method == 'POST':
+        return (line.decode('utf-8', 'replace') for line in request.stream)
+    return io.StringIO(request.args.get("smiles_mol", ""))
+
+def conversion_options():
+    '''
+    the Options chosen in the form
+    '''
+    return form_options(request.args.get('check', '').split(','),
+                        request.args.get('angle'),
+                        request.args.get('hydrogens'))
+
+def convert_new(lines, options):
+    _format, data = read_molecule(lines)
+    if data is None:
+        return None, "Chemfig cannot be generated", None
+    return smiles_mol_to_chemfig(data, options, session_id=session_id())
+
+@app.route("/mol_2_chemfig/smiles_to_chemfig", methods=['GET', 'POST'])
 def smiles_to_chemfig():
-    smiles_mol = request.args.get("smiles_mol")
-    last_data[0] = smiles_mol
-    check = request.args.getlist('check')
-    check = check[0].split(',')
-    angle = request.args.get('angle')
-    angle = " -a " + angle
-    lst = ' '.join(check) + angle
-    hydrogens = request.args.get("hydrogens")
-    if len(smiles_mol) < 200:
-        chemfig, pdflink = smiles_mol_to_chemfig(lst,'-i direct', "-y {}".format(hydrogens), smiles_mol)
-        return jsonify(chem_fig = chemfig, pdf_link = pdflink)        
-    else:
-         with open('static/files/molecule.mol', 'w') as f:
-             f.write(smiles_mol)
-         mol = 'static/files/molecule.mol'
-         last_data[0] = mol
-         chemfig, pdflink  = smiles_mol_to_chemfig(lst, "-y {}".format(hydrogens), mol)
-         return jsonify(chem_fig = chemfig, pdf_link = pdflink)
-
-@app.route("/mol_2_chemfig/update")
+    return pdf_reply(*convert_new(molecule_lines(), conversion_options()))
+
+@app.route("/mol_2_chemfig/update", methods=['GET', 'POST'])
 def check_update():    
-    check = request.args.getlist('check')
-    check = check[0].split(',')
-    angle = request.args.get('angle')
-    angle = " -a " + angle
-    lst = ' '.join(check) + angle
-    smiles_mol = last_data[0]
-    hydrogens = request.args.get("hydrogens")
-    if 'molecule.mol' not in smiles_mol:
-        chemfig, pdflink = smiles_mol_to_chemfig(lst,'-i direct', "-y {}".format(hydrogens), smiles_mol) 
-        return jsonify(chem_fig = chemfig, pdf_link = pdflink)
-        
-    else:
-        chemfig, pdflink = smiles_mol_to_chemfig(lst, "-y {}".format(hydrogens), smiles_mol)
-        return jsonify(chem_fig = chemfig, pdf_link = pdflink)
+    options = conversion_options()
+    result = update_session_chemfig(session_id(), options)
+    if result is None:
+        # session expired, or handled by another worker - start over
+        # from the molecule the client sent along
+        result = convert_new(molecule_lines(), options)
+    return pdf_reply(*result)
+
+@app.route("/mol_2_chemfig/_stats")
+def stats():
+    return jsonify(conversions = conversions.stats(), sessions = sessions.stats(),
+                   pdf_jobs = pdf_jobs.stats(),
+                   live_compiles = live_compiles.stats(),
+                   pdf_store = pdf_store.stats(),
+                   pubchem = pubchem.resolver.stats(),
+                   scheduler = scheduler.stats(),
+                   latex_pool = pdfgen.POOL.stats() if pdfgen.POOL else None,
+                   metrics = metrics.stats())
+
+@app.route("/mol_2_chemfig/metrics")
+def prometheus_metrics():
+    return Response(metrics.exposition(),
+                    mimetype = 'text/plain; version=0.0.4; charset=utf-8')
+
+# longest a client may block on a pdf job, in seconds
+MAX_PDF_WAIT = 30
+
+@app.route("/mol_2_chemfig/pdf/<job>")
+def pdf_job(job):
+    wait = min(request.args.get('wait', 0, type=float), MAX_PDF_WAIT)
+    result = pdf_job_result(job, timeout=wait)
+    if result is None:
+        return jsonify(status = 'unknown'), 404
+    status, digest = result
+    if digest is None:
+        return jsonify(status = status, pdf_link = None)
+    return jsonify(status = status, pdf_link = url_for('pdf_file', digest = digest))
+
+@app.route("/mol_2_chemfig/pdfs/<digest>.pdf")
+def pdf_file(digest):
+    pdf = pdf_store.get(digest)
+    if pdf is None:
+        return 'PDF expired', 404
+    response = Response(pdf, mimetype = 'application/pdf')
+    # the url names the content, which can thus never change
+    response.set_etag(digest)
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 3600
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
         
+@app.route("/mol_2_chemfig/bulk", methods=['POST'])
+def bulk_convert():
+    '''
+    convert every record of a posted SD file or smiles list. Options
+    are given as in /smiles_to_chemfig. The result is streamed as
+    NDJSON, or with format=zip as an archive of .tex and .pdf files;
+    with pdf=1, NDJSON records refer to a pdf job.
+    '''
+    options = conversion_options()
+    as_zip = request.args.get('format') == 'zip'
+    with_pdf = request.args.get('pdf', type=int) == 1
+
+    convert = bulk_converter(options,
+                             with_jobs = with_pdf and not as_zip,
+                             with_files = with_pdf and as_zip)
+
+    lines = io.TextIOWrapper(request.stream, encoding='utf-8', errors='replace')
+    results = bulk.convert_ordered(convert, iter_records(lines))
+
+    if as_zip:
+        return Response(stream_with_context(bulk.zip_stream(results)),
+                        mimetype = 'application/zip',
+                        headers = {'Content-Disposition': 'attachment; filename=molecules.zip'})
+    return Response(stream_with_context(bulk.ndjson_stream(results)),
+                    mimetype = 'application/x-ndjson')
+
 @app.route("/mol_2_chemfig/update_chemfig")
 def chemfig_update():
     smiles_mol = request.args.get("smiles_mol")
-    pdflink = update_chemfig(smiles_mol)         
-    return jsonify(pdf_link = pdflink)
+    revision = request.args.get("revision", type=int)
+    page = request.args.get("page")
+    job = update_chemfig(smiles_mol, session_id(), revision, page)
+    if job is None:
+        if revision is not None:
+            # a newer revision is already on its way
+            return jsonify(pdf_job = None, revision = revision, superseded = True)
+        return jsonify(pdf_job = None, pdf_link = 'pdf generation foobared')
+    return jsonify(pdf_job = job, revision = revision,
+                   pdf_url = url_for('pdf_job', job = job))
     
 
 if __name__ == '__main__':
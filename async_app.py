@@ -0,0 +1,233 @@
+'''
+asyncio variant of app.py, on Quart. It shares the conversion core,
+caches and sessions with the Flask app, but waits for PubChem and
+pdflatex without holding a thread, so that one process can keep
+hundreds of conversions in flight. Molecule construction is CPU-bound
+and runs on an executor. Run it with an ASGI server, e.g.
+
+    hypercorn async_app:app
+
+Bulk conversion is only offered by the Flask app.
+'''
+from quart import Quart, render_template, url_for, request, jsonify, session
+from quart import Response
+from chemistry.chemfig import smiles_mol_to_chemfig, update_chemfig
+from chemistry.chemfig import update_session_chemfig, conversions, sessions
+from chemistry.chemfig import pdf_job_result_async, pdf_jobs, live_compiles
+from chemistry.chemfig import pdf_store, scheduler, form_options
+from chemistry.scheduler import Overloaded
+from mol2chemfig import metrics, pdfgen, pubchem
+from mol2chemfig.common import MCFError
+from mol2chemfig.records import read_molecule
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import io
+import os
+import subprocess
+import uuid
+
+app = Quart(__name__)
+
+app.secret_key = os.environ.get('MOL2CHEMFIG_SECRET_KEY') or os.urandom(24)
+
+# compile against a format file with the preamble precompiled; 0 disables this
+if os.environ.get('MOL2CHEMFIG_LATEX_FORMAT', '1') != '0':
+    try:
+        pdfgen.build_format()
+    except (OSError, subprocess.SubprocessError) as e:
+        print("Not using a LaTeX format file: %s" % e)
+
+# Molecule construction and other CPU-bound work
+executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=os.cpu_count() or 2, thread_name_prefix='convert')
+
+# longest a client may block on a pdf job, in seconds
+MAX_PDF_WAIT = 30
+
+
+async def run_sync(fn, *args, **kwargs):
+    '''
+    run fn on the executor, in the current context so that its stage
+    timings end up in this request's Server-Timing header
+    '''
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, fn, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(executor, call)
+
+
+def session_id():
+    '''
+    identifies the user's molecule in the session store
+    '''
+    if 'id' not in session:
+        session['id'] = uuid.uuid4().hex
+    return session['id']
+
+
+def pdf_reply(chemfig, job, svg):
+    '''
+    JSON answer carrying the chemfig code, an svg preview and where
+    to fetch the pdf
+    '''
+    if chemfig is None:
+        # job holds the error message
+        return jsonify(chem_fig = None, pdf_link = job)
+    if job is None:
+        return jsonify(chem_fig = chemfig, svg = svg, pdf_job = None, pdf_link = 'pdf generation foobared')
+    return jsonify(chem_fig = chemfig, svg = svg, pdf_job = job, pdf_url = url_for('pdf_job', job = job))
+
+
+def conversion_options():
+    '''
+    the Options chosen in the form
+    '''
+    return form_options(request.args.get('check', '').split(','),
+                        request.args.get('angle'),
+                        request.args.get('hydrogens'))
+
+
+async def molecule_data():
+    '''
+    the molecule sent by the client, as in app.py. PubChem ids are
+    resolved here, so that the executor never waits for the network.
+    '''
+    if request.method == 'POST':
+        text = (await request.get_data()).decode('utf-8', 'replace')
+    else:
+        text = request.args.get("smiles_mol", "")
+
+    kind, data = read_molecule(io.StringIO(text))
+
+    if kind == 'cid':
+        try:
+            data = await pubchem.async_resolver.get_sdf(data)
+        except pubchem.PubChemError:
+            data = None
+
+    return data
+
+
+async def convert_new(options):
+    data = await molecule_data()
+    if data is None:
+        return None, "Chemfig cannot be generated", None
+    return await run_sync(smiles_mol_to_chemfig, data, options,
+                          session_id=session_id(),
+                          loop=asyncio.get_running_loop())
+
+
+@app.errorhandler(Overloaded)
+async def overloaded(error):
+    return (jsonify(chem_fig = None, pdf_link = 'Server is busy, please retry'),
+            503, {'Retry-After': str(error.retry_after)})
+
+@app.errorhandler(MCFError)
+async def invalid_options(error):
+    return jsonify(chem_fig = None, pdf_link = str(error)), 400
+
+@app.before_request
+async def start_timing():
+    metrics.begin_request()
+
+@app.after_request
+async def server_timing(response):
+    timing = metrics.end_request()
+    if timing:
+        response.headers['Server-Timing'] = timing
+    return response
+
+@app.route('/mol_2_chemfig')
+async def home():
+    return await render_template('home.html', pdflink = "static/files/welcome.pdf")
+
+@app.route('/mol_2_chemfig/links')
+async def links():
+    return await render_template("links.html")
+
+@app.route('/mol_2_chemfig/about')
+async def about():
+    return await render_template("about.html")
+
+@app.route("/mol_2_chemfig/_get_smiles")
+async def get_smile():
+    chemical = request.args.get('chemical', '')
+    try:
+        name = await pubchem.async_resolver.name_to_smiles(chemical)
+    except pubchem.PubChemError:
+        name = None
+    return jsonify(smiles = name or "\n")
+
+@app.route("/mol_2_chemfig/smiles_to_chemfig", methods=['GET', 'POST'])
+async def smiles_to_chemfig():
+    return pdf_reply(*await convert_new(conversion_options()))
+
+@app.route("/mol_2_chemfig/update", methods=['GET', 'POST'])
+async def check_update():
+    options = conversion_options()
+    result = await run_sync(update_session_chemfig, session_id(), options,
+                            loop=asyncio.get_running_loop())
+    if result is None:
+        # session expired - start over from the molecule sent along
+        result = await convert_new(options)
+    return pdf_reply(*result)
+
+@app.route("/mol_2_chemfig/_stats")
+async def stats():
+    return jsonify(conversions = conversions.stats(), sessions = sessions.stats(),
+                   pdf_jobs = pdf_jobs.stats(),
+                   live_compiles = live_compiles.stats(),
+                   pdf_store = pdf_store.stats(),
+                   pubchem = pubchem.async_resolver.stats(),
+                   scheduler = scheduler.stats(),
+                   metrics = metrics.stats())
+
+@app.route("/mol_2_chemfig/metrics")
+async def prometheus_metrics():
+    return Response(metrics.exposition(),
+                    mimetype = 'text/plain; version=0.0.4; charset=utf-8')
+
+@app.route("/mol_2_chemfig/pdf/<job>")
+async def pdf_job(job):
+    wait = min(request.args.get('wait', 0, type=float), MAX_PDF_WAIT)
+    result = await pdf_job_result_async(job, timeout=wait)
+    if result is None:
+        return jsonify(status = 'unknown'), 404
+    status, digest = result
+    if digest is None:
+        return jsonify(status = status, pdf_link = None)
+    return jsonify(status = status, pdf_link = url_for('pdf_file', digest = digest))
+
+@app.route("/mol_2_chemfig/pdfs/<digest>.pdf")
+async def pdf_file(digest):
+    pdf = pdf_store.get(digest)
+    if pdf is None:
+        return 'PDF expired', 404
+    response = Response(pdf, mimetype = 'application/pdf')
+    # the url names the content, which can thus never change
+    response.set_etag(digest)
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 3600
+    response.cache_control.immutable = True
+    return await response.make_conditional(request)
+
+@app.route("/mol_2_chemfig/update_chemfig")
+async def chemfig_update():
+    # live compiles are cancelled by killing pdflatex from another
+    # thread, so they keep running on the pdf job threads
+    smiles_mol = request.args.get("smiles_mol")
+    revision = request.args.get("revision", type=int)
+    page = request.args.get("page")
+    job = update_chemfig(smiles_mol, session_id(), revision, page)
+    if job is None:
+        if revision is not None:
+            # a newer revision is already on its way
+            return jsonify(pdf_job = None, revision = revision, superseded = True)
+        return jsonify(pdf_job = None, pdf_link = 'pdf generation foobared')
+    return jsonify(pdf_job = job, revision = revision,
+                   pdf_url = url_for('pdf_job', job = job))
+
+
+if __name__ == '__main__':
+    app.run(debug=True)
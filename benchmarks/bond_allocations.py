@@ -0,0 +1,78 @@
+'''
+count the memory allocated while building the Molecule of a polymer,
+as traced by tracemalloc: the blocks and bytes still held once the
+molecule is built, the peak along the way, and the Atom and Options
+objects alive, which should be one per atom and one in all. Build
+times are taken separately, without tracing, as the best of a few runs.
+
+    python benchmarks/bond_allocations.py --atoms 1000
+'''
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mol2chemfig.atom import Atom
+from mol2chemfig.molecule import Molecule
+from mol2chemfig.options import Options
+
+from synthetic import polymer
+
+
+def count_instances(cls):
+    return sum(1 for obj in gc.get_objects() if isinstance(obj, cls))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--atoms', type=int, nargs='+', default=[1000])
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    print('%8s %10s %10s %10s %10s %8s %8s %10s' % (
+        'atoms', 'bonds', 'blocks', 'held', 'peak',
+        'Atom', 'Options', 'build'))
+
+    for atoms in args.atoms:
+        tkmol, exit_atom = polymer(atoms)
+        options = Options(entry_atom=1, exit_atom=exit_atom)
+
+        times = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            Molecule(options, tkmol)
+            times.append(time.perf_counter() - start)
+
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+
+        mol = Molecule(options, tkmol)
+
+        gc.collect()
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        held = [stat for stat in after.compare_to(before, 'filename')
+                if stat.size_diff > 0]
+
+        print('%8d %10d %10d %7.0f kB %7.0f kB %8d %8d %7.1f ms' % (
+            len(tkmol.atoms),
+            len(mol.bonds),
+            sum(stat.count_diff for stat in held),
+            sum(stat.size_diff for stat in held) / 1024,
+            peak / 1024,
+            count_instances(Atom),
+            count_instances(Options),
+            min(times) * 1000))
+
+        del mol
+
+
+if __name__ == '__main__':
+    main()
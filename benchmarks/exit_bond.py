@@ -0,0 +1,95 @@
+'''
+time the choice of the default exit bond on polymers, whose trees are
+as deep as their chains are long. The scan over the TreeIndex in
+Molecule.default_exit_bond is compared with the parent chain walk it
+replaced, which is only run on the smaller inputs, since it takes
+time in proportion to atoms times depth.
+
+    python benchmarks/exit_bond.py --atoms 1000 10000 50000
+'''
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mol2chemfig.molecule import Molecule
+from mol2chemfig.options import Options
+
+from synthetic import polymer
+
+
+def parent_walk_exit_bond(mol):
+    '''
+    the former default_exit_bond: walk from each bond back up to the
+    entry atom to find its distance
+    '''
+    scored = []
+
+    for bond in mol.treebonds():
+        if bond.to_phantom:
+            continue
+
+        distance = 0
+        the_bond = bond
+
+        while (the_bond is not None and
+               the_bond.end_atom is not mol.entry_atom):
+            distance += 1
+            the_bond = the_bond.parent
+
+        scored.append((distance, len(bond.descendants), bond))
+
+    scored.sort(key=lambda entry: entry[:2])
+    return scored[-1][-1]
+
+
+def index_exit_bond(mol):
+    mol.tree_index = None   # include the walk that builds the index
+    return mol.default_exit_bond()
+
+
+def best_of(runs, fn, *args):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--atoms', type=int, nargs='+',
+                        default=[1000, 10000, 50000])
+    parser.add_argument('--legacy-max', type=int, default=10000,
+                        help='largest input to run the parent walk on')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    print('%8s %8s %12s %14s' % ('atoms', 'depth', 'tree index',
+                                 'parent walk'))
+
+    for atoms in args.atoms:
+        tkmol, exit_atom = polymer(atoms)
+        mol = Molecule(Options(entry_atom=1, exit_atom=exit_atom), tkmol)
+
+        seconds, picked = best_of(args.runs, index_exit_bond, mol)
+
+        legacy = '-'
+        if atoms <= args.legacy_max:
+            legacy_seconds, legacy_picked = best_of(
+                1, parent_walk_exit_bond, mol)
+            legacy = '%11.1f ms' % (legacy_seconds * 1000)
+
+            # both must pick the same bond
+            assert picked is legacy_picked
+
+        print('%8d %8d %9.1f ms %14s' % (
+            len(tkmol.atoms), max(mol.indexTree().depths),
+            seconds * 1000, legacy))
+
+
+if __name__ == '__main__':
+    main()
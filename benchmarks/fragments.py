@@ -0,0 +1,121 @@
+'''
+time fragment detection on inputs of many disconnected fragments, as
+in salts, mixtures and multi-component records. The disjoint-set
+finder in Molecule.molecule_fragments is compared with the pairwise
+scan it replaced, which is only run on the smaller inputs, since it
+is quadratic.
+
+    python benchmarks/fragments.py --atoms 1000 10000 50000
+'''
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mol2chemfig.molecule import Molecule
+
+
+def split_pairs_fragments(atom_pairs):
+    '''
+    the former molecule_fragments: grow each fragment by scanning
+    the remaining pairs until a scan adds nothing
+    '''
+    def split_pairs(pair_list):
+        first, rest = pair_list[0], pair_list[1:]
+        connected_atoms = set(first)
+        connected_pairs = [first]
+
+        while True:
+            unconnected = []
+            for r in rest:
+                s = set(r)
+                if connected_atoms & s:
+                    connected_atoms |= s
+                    connected_pairs.append(r)
+                else:
+                    unconnected.append(r)
+
+            if len(unconnected) == len(rest):
+                return connected_pairs, unconnected
+            rest = unconnected
+
+    fragments = []
+    while atom_pairs:
+        connected, atom_pairs = split_pairs(atom_pairs)
+        fragments.append(connected)
+    return fragments
+
+
+def fragmented_molecule(atoms, fragment_size, orphans, rng):
+    '''
+    a bare Molecule with just the atoms and bonds of many small
+    branched fragments, its bonds in random order, plus some atoms
+    without bonds
+    '''
+    mol = Molecule.__new__(Molecule)
+    mol.atoms = dict.fromkeys(range(atoms))
+    mol.atom_pairs = []
+
+    bonded = atoms - orphans
+    for first in range(0, bonded, fragment_size):
+        last = min(first + fragment_size, bonded)
+        for idx in range(first + 1, last):
+            mol.atom_pairs.append((rng.randrange(first, idx), idx))
+
+    rng.shuffle(mol.atom_pairs)
+    return mol
+
+
+def best_of(runs, fn, *args):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--atoms', type=int, nargs='+',
+                        default=[1000, 10000, 50000])
+    parser.add_argument('--fragment-size', type=int, default=12)
+    parser.add_argument('--orphans', type=float, default=0.05,
+                        help='share of atoms without bonds')
+    parser.add_argument('--legacy-max', type=int, default=5000,
+                        help='largest input to run the pairwise scan on')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    print('%8s %10s %14s %14s' % (
+        'atoms', 'fragments', 'disjoint set', 'pairwise scan'))
+
+    for atoms in args.atoms:
+        mol = fragmented_molecule(
+            atoms, args.fragment_size, int(atoms * args.orphans), rng)
+
+        seconds, (fragments, orphans) = best_of(
+            args.runs, mol.molecule_fragments)
+
+        legacy = '-'
+        if atoms <= args.legacy_max:
+            legacy_seconds, legacy_fragments = best_of(
+                1, split_pairs_fragments, mol.atom_pairs)
+            legacy = '%11.1f ms' % (legacy_seconds * 1000)
+
+            # both must find the same partition
+            found = {frozenset(f) for f in fragments}
+            expected = {frozenset(a for pair in f for a in pair)
+                        for f in legacy_fragments}
+            assert found == expected
+
+        print('%8d %10d %11.1f ms %14s' % (
+            atoms, len(fragments) + len(orphans), seconds * 1000, legacy))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+'''
+time building and rendering the Molecule of a very large polymer: a
+zigzag chain with pendant benzene rings, rendered from one chain end
+to the other. The tree is as deep as the chain is long.
+
+    python benchmarks/large_molecule.py --atoms 20000
+'''
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mol2chemfig.molecule import Molecule
+from mol2chemfig.options import Options
+
+from synthetic import polymer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--atoms', type=int, nargs='+',
+                        default=[1000, 5000, 20000])
+    args = parser.parse_args()
+
+    print('recursion limit %d' % sys.getrecursionlimit())
+    print('%8s %12s %12s %12s %10s' % (
+        'atoms', 'build', 'render', 'format', 'lines'))
+
+    for atoms in args.atoms:
+        tkmol, exit_atom = polymer(atoms)
+        options = Options(entry_atom=1, exit_atom=exit_atom)
+
+        start = time.perf_counter()
+        mol = Molecule(options, tkmol)
+        built = time.perf_counter()
+        mol.render()
+        rendered = time.perf_counter()
+        code = mol.render_user()
+        formatted = time.perf_counter()
+
+        print('%8d %9.1f ms %9.1f ms %9.1f ms %10d' % (
+            len(tkmol.atoms),
+            (built - start) * 1000,
+            (rendered - built) * 1000,
+            (formatted - rendered) * 1000,
+            code.count('\n') + 1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+'''
+wall time per PDF compilation with and without the precompiled
+preamble format. Both run cold pdflatex processes, as the fallback
+path and the async app do; the warm pool is measured separately
+with --pool.
+
+    python benchmarks/latex_format.py --runs 20
+'''
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mol2chemfig import pdfgen
+
+# benzoic acid, as render_server would have it
+CHEMFIG = r'''\chemfig{
+*6(-=-(-[:30]C(=[:90]O)-[:-30]OH)=-=)}'''
+
+
+def time_compiles(runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        pdfgen.render_pdf(CHEMFIG, 6, 4)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def report(label, times):
+    print('%-16s median %7.1f ms   mean %7.1f ms   min %7.1f ms' % (
+        label,
+        statistics.median(times) * 1000,
+        statistics.mean(times) * 1000,
+        min(times) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--pool', action='store_true',
+                        help='also time the warm pool, with the format')
+    args = parser.parse_args()
+
+    # one untimed compile each, so that the page cache is warm
+    pdfgen.render_pdf(CHEMFIG, 6, 4)
+    report('preamble', time_compiles(args.runs))
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        pdfgen.build_format(directory)
+        print('format built in %.1f ms'
+              % ((time.perf_counter() - start) * 1000))
+
+        pdfgen.render_pdf(CHEMFIG, 6, 4)
+        report('format', time_compiles(args.runs))
+
+        if args.pool:
+            pdfgen.start_pool(size=2)
+            report('format + pool', time_compiles(args.runs))
+            pdfgen.POOL.close()
+
+
+if __name__ == '__main__':
+    main()
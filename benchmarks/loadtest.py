@@ -0,0 +1,594 @@
+'''
+load generator for the web endpoints. Simulated users convert
+molecules as they type, toggle options, paste large molfiles, live-edit
+chemfig code and look up names, in a configurable mix. The report
+gives throughput and latency percentiles per endpoint, and per stage
+as read from the Server-Timing headers, and can be written as JSON
+and compared against an earlier run.
+
+Name and CID lookups should not reach the real PubChem. --stand-in
+serves a small canned PubChem on a local port; point the server at
+it before starting it:
+
+    python benchmarks/loadtest.py --stand-in 8901 --serve-only &
+    MOL2CHEMFIG_PUBCHEM_URL=http://127.0.0.1:8901 python app.py
+    python benchmarks/loadtest.py --users 16 --duration 60 \\
+        --output run.json --baseline baseline.json
+'''
+import argparse
+import collections
+import http.client
+import http.server
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mol2chemfig import pubchem
+
+PREFIX = '/mol_2_chemfig'
+
+# what the stand-in knows: name -> (cid, smiles)
+COMPOUNDS = {
+    'benzene': (241, 'C1=CC=CC=C1'),
+    'aspirin': (2244, 'CC(=O)OC1=CC=CC=C1C(=O)O'),
+    'caffeine': (2519, 'CN1C=NC2=C1C(=O)N(C(=O)N2C)C'),
+    'ibuprofen': (3672, 'CC(C)CC1=CC=C(C=C1)C(C)C(=O)O'),
+    'paracetamol': (1983, 'CC(=O)NC1=CC=C(C=C1)O'),
+    'glucose': (5793, 'C(C1C(C(C(C(O1)O)O)O)O)O'),
+    'nicotine': (89594, 'CN1CCCC1C2=CN=CC=C2'),
+    'dopamine': (681, 'C1=CC(=C(C=C1CCN)O)O'),
+}
+BY_CID = {cid: smiles for cid, smiles in COMPOUNDS.values()}
+
+# names the stand-in doesn't know, so that misses are exercised too
+UNKNOWN_NAMES = ('unobtainium', 'phlogiston', 'kryptonite')
+
+# molecules users type in, character by character
+TYPED = [smiles for _cid, smiles in COMPOUNDS.values()]
+
+# the checkboxes of the form, and their defaults
+CHECKS = ('-w', '-n', '-f', '-o', '-c', '-m', '-p', '-q')
+DEFAULT_CHECKS = ('-w',)
+
+ANGLES = ('0.0', '30.0', '90.0')
+
+SCENARIOS = ('typing', 'toggle', 'large', 'names')
+
+
+# -- the PubChem stand-in
+
+def _split_path(template):
+    head, tail = template.split('%s')
+    return head, tail
+
+
+def sdf_record(cid, smiles):
+    '''
+    a minimal SD record, with the properties the mirror importer reads
+    '''
+    return '\n'.join([
+        str(cid),
+        '  loadtest',
+        '',
+        '  0  0  0  0  0  0  0  0  0  0999 V2000',
+        'M  END',
+        '> <PUBCHEM_COMPOUND_CID>',
+        str(cid),
+        '',
+        '> <PUBCHEM_SMILES>',
+        smiles,
+        '',
+        '$$$$',
+        ''])
+
+
+class StandInServer(http.server.ThreadingHTTPServer):
+    '''
+    counts the connections and requests it serves. While throttled
+    is above zero, requests are answered with 503, as PubChem does
+    when it throttles, and each one takes one off.
+    '''
+    daemon_threads = True
+
+    def __init__(self, address, handler):
+        super().__init__(address, handler)
+        self.connections = 0
+        self.requests = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def count_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def count_request(self):
+        '''
+        count a request; returns whether to throttle it
+        '''
+        with self._lock:
+            self.requests += 1
+            if self.throttled > 0:
+                self.throttled -= 1
+                return True
+            return False
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    '''
+    answers the two PUG REST queries that pubchem.py makes
+    '''
+    protocol_version = 'HTTP/1.1'
+    delay = 0.0
+
+    def setup(self):
+        super().setup()
+        self.server.count_connection()
+
+    def do_GET(self):
+        if self.delay:
+            time.sleep(self.delay)
+
+        if self.server.count_request():
+            return self.reply(503, 'Status: 503\n')
+
+        path = urllib.parse.urlsplit(self.path).path
+
+        head, tail = _split_path(pubchem.SMILES_PATH)
+        if path.startswith(head) and path.endswith(tail):
+            name = urllib.parse.unquote(path[len(head):-len(tail)]).lower()
+            if name in COMPOUNDS:
+                return self.reply(200, COMPOUNDS[name][1] + '\n')
+            return self.reply(404, 'Status: 404\n')
+
+        head, tail = _split_path(pubchem.SDF_PATH)
+        if path.startswith(head) and path.endswith(tail):
+            cid = path[len(head):-len(tail)]
+            if cid.isdigit() and int(cid) in BY_CID:
+                return self.reply(200, sdf_record(cid, BY_CID[int(cid)]))
+            return self.reply(404, 'Status: 404\n')
+
+        self.reply(400, 'Status: 400\n')
+
+    def reply(self, status, text):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stand_in(port, delay=0.0):
+    '''
+    serve the stand-in on a daemon thread. Returns the server. With
+    port 0, a free port is picked; the server's url tells which.
+    '''
+    handler = type('Handler', (StandInHandler,), dict(delay=delay))
+    server = StandInServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# -- inputs
+
+def chain_molfile(atoms):
+    '''
+    a V2000 molfile of a zigzag carbon chain with a ring every
+    twelve atoms, as a stand-in for large pasted molfiles
+    '''
+    atoms = min(atoms, 999)     # the counts line has three digits
+    atom_lines = []
+    bond_lines = []
+
+    for i in range(atoms):
+        x = i * 1.299
+        y = 0.75 if i % 2 else 0.0
+        atom_lines.append('%10.4f%10.4f%10.4f C   0  0  0  0  0  0'
+                          '  0  0  0  0  0  0' % (x, y, 0.0))
+        if i:
+            bond_lines.append('%3d%3d  1  0' % (i, i + 1))
+
+    # close small rings along the chain
+    for i in range(0, atoms - 5, 12):
+        bond_lines.append('%3d%3d  1  0' % (i + 1, i + 6))
+
+    return '\n'.join(
+        ['', '  loadtest', '',
+         '%3d%3d  0  0  0  0  0  0  0  0999 V2000'
+         % (len(atom_lines), len(bond_lines))]
+        + atom_lines + bond_lines + ['M  END', ''])
+
+
+# -- simulated users
+
+class User:
+    '''
+    one browser session: a keep-alive connection, a cookie, and the
+    id of the page it edits on
+    '''
+    def __init__(self, host, port, timeout, record):
+        self.connection = http.client.HTTPConnection(
+            host, port, timeout=timeout)
+        self.cookie = None
+        self.record = record
+        self.page = os.urandom(8).hex()
+        self.revision = 0
+
+    def request(self, endpoint, params, body=None):
+        path = PREFIX + endpoint
+        if params:
+            path += '?' + urllib.parse.urlencode(params)
+
+        headers = {}
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        if body is not None:
+            headers['Content-Type'] = 'text/plain; charset=utf-8'
+            body = body.encode('utf-8')
+
+        start = time.perf_counter()
+        try:
+            self.connection.request(
+                'POST' if body is not None else 'GET',
+                path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            response_body = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            self.connection.close()
+            self.record(endpoint, type(e).__name__,
+                        time.perf_counter() - start, None)
+            return None
+        seconds = time.perf_counter() - start
+
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+
+        self.record(endpoint, response.status, seconds,
+                    response.getheader('Server-Timing'))
+
+        if response.status != 200:
+            return None
+        try:
+            return json.loads(response_body)
+        except ValueError:
+            return None
+
+    def options(self, checks=DEFAULT_CHECKS, angle='0.0', hydrogens='keep'):
+        return dict(check=','.join(checks), angle=angle, hydrogens=hydrogens)
+
+    def convert(self, molecule, **options):
+        return self.request('/smiles_to_chemfig',
+                            self.options(**options), molecule)
+
+    def update(self, molecule, **options):
+        return self.request('/update', self.options(**options), molecule)
+
+    def live_edit(self, chemfig):
+        self.revision += 1
+        return self.request('/update_chemfig',
+                            dict(smiles_mol=chemfig, revision=self.revision,
+                                 page=self.page))
+
+    def look_up(self, name):
+        return self.request('/_get_smiles', dict(chemical=name))
+
+    # scenarios
+
+    def typing(self, rng, pause):
+        '''
+        a burst of conversions while a smiles is typed in, then a few
+        live edits of the result
+        '''
+        smiles = rng.choice(TYPED)
+        step = rng.randint(2, 5)
+        reply = None
+        for end in range(step, len(smiles) + step, step):
+            reply = self.convert(smiles[:end])
+            time.sleep(pause * rng.random() / 4)
+
+        chemfig = reply and reply.get('chem_fig')
+        if chemfig:
+            for _ in range(rng.randint(1, 3)):
+                chemfig += ' '
+                self.live_edit(chemfig)
+                time.sleep(pause * rng.random() / 4)
+
+    def toggle(self, rng, pause):
+        '''
+        one conversion, then a series of option changes
+        '''
+        molecule = rng.choice(TYPED)
+        self.convert(molecule)
+
+        checks = set(DEFAULT_CHECKS)
+        for _ in range(rng.randint(3, 8)):
+            checks ^= {rng.choice(CHECKS)}
+            self.update(molecule, checks=sorted(checks),
+                        angle=rng.choice(ANGLES),
+                        hydrogens=rng.choice(('keep', 'keep', 'delete')))
+            time.sleep(pause * rng.random())
+
+    def large(self, rng, pause, atoms):
+        '''
+        a pasted molfile of some hundreds of atoms
+        '''
+        self.convert(chain_molfile(rng.randint(atoms // 2, atoms)))
+
+    def names(self, rng, pause):
+        '''
+        look up a name, and convert what comes back
+        '''
+        if rng.random() < 0.8:
+            name = rng.choice(list(COMPOUNDS))
+        else:
+            name = rng.choice(UNKNOWN_NAMES)
+
+        reply = self.look_up(name)
+        smiles = reply and reply.get('smiles', '').strip()
+        if smiles:
+            self.convert(smiles)
+
+    def close(self):
+        self.connection.close()
+
+
+def parse_mix(text):
+    '''
+    "typing=4,toggle=3" -> [('typing', 4.0), ('toggle', 3.0)]
+    '''
+    mix = []
+    for item in text.split(','):
+        name, _sep, weight = item.partition('=')
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError('unknown scenario %r' % name)
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+# -- results
+
+class Results:
+    '''
+    latencies per endpoint and per Server-Timing stage
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = collections.defaultdict(list)
+        self.statuses = collections.defaultdict(collections.Counter)
+        self.stages = collections.defaultdict(list)
+
+    def record(self, endpoint, status, seconds, server_timing):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][str(status)] += 1
+
+            for name, ms in parse_server_timing(server_timing):
+                self.stages[name].append(ms / 1000)
+
+    def summary(self, elapsed):
+        with self._lock:
+            endpoints = {}
+            for endpoint, latencies in sorted(self.latencies.items()):
+                statuses = dict(self.statuses[endpoint])
+                endpoints[endpoint] = dict(
+                    requests=len(latencies),
+                    errors=sum(n for status, n in statuses.items()
+                               if status != '200'),
+                    statuses=statuses,
+                    throughput=len(latencies) / elapsed,
+                    **latency_summary(latencies))
+
+            stages = {name: dict(count=len(seconds),
+                                 **latency_summary(seconds))
+                      for name, seconds in sorted(self.stages.items())}
+
+        total = sum(e['requests'] for e in endpoints.values())
+        return dict(elapsed=elapsed, requests=total,
+                    throughput=total / elapsed,
+                    endpoints=endpoints, stages=stages)
+
+
+def parse_server_timing(header):
+    '''
+    "load;dur=1.20, tree;dur=3.05" -> [('load', 1.2), ('tree', 3.05)]
+    '''
+    if not header:
+        return []
+
+    timings = []
+    for metric in header.split(','):
+        name, *params = [part.strip() for part in metric.split(';')]
+        for param in params:
+            key, _sep, value = param.partition('=')
+            if key == 'dur':
+                try:
+                    timings.append((name, float(value)))
+                except ValueError:
+                    pass
+    return timings
+
+
+def percentile(ordered, q):
+    '''
+    nearest-rank percentile of an ascending list
+    '''
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(q * len(ordered)))
+    return ordered[rank - 1]
+
+
+def latency_summary(seconds):
+    '''
+    mean and percentiles, in milliseconds
+    '''
+    ordered = sorted(seconds)
+    summary = dict(mean_ms=1000 * sum(ordered) / len(ordered))
+    for q in (0.5, 0.9, 0.95, 0.99, 1.0):
+        name = 'max_ms' if q == 1.0 else 'p%d_ms' % (q * 100)
+        summary[name] = 1000 * percentile(ordered, q)
+    return summary
+
+
+def report(summary, baseline=None):
+    print('%d requests in %.1f s, %.1f requests/s' % (
+        summary['requests'], summary['elapsed'], summary['throughput']))
+
+    print()
+    print('%-20s %7s %6s %7s %8s %8s %8s %8s' % (
+        'endpoint', 'reqs', 'errors', 'req/s', 'p50 ms', 'p95 ms',
+        'p99 ms', 'max ms'))
+    for endpoint, e in summary['endpoints'].items():
+        print('%-20s %7d %6d %7.1f %8.1f %8.1f %8.1f %8.1f' % (
+            endpoint, e['requests'], e['errors'], e['throughput'],
+            e['p50_ms'], e['p95_ms'], e['p99_ms'], e['max_ms']))
+
+    if summary['stages']:
+        print()
+        print('%-20s %7s %8s %8s %8s' % (
+            'stage', 'count', 'p50 ms', 'p95 ms', 'p99 ms'))
+        for name, s in summary['stages'].items():
+            print('%-20s %7d %8.1f %8.1f %8.1f' % (
+                name, s['count'], s['p50_ms'], s['p95_ms'], s['p99_ms']))
+
+    if baseline is not None:
+        print()
+        print('against the baseline (this run / baseline):')
+        print('%-20s %9s %9s' % ('', 'req/s', 'p95'))
+        rows = [('all', summary, baseline)]
+        rows += [(endpoint, e, baseline['endpoints'][endpoint])
+                 for endpoint, e in summary['endpoints'].items()
+                 if endpoint in baseline['endpoints']]
+        for name, now, then in rows:
+            print('%-20s %9s %9s' % (
+                name, ratio(now['throughput'], then['throughput']),
+                ratio(now.get('p95_ms'), then.get('p95_ms'))))
+
+
+def ratio(now, then):
+    if now is None or not then:
+        return '-'
+    return '%.2fx' % (now / then)
+
+
+# -- driver
+
+def run(args, results):
+    url = urllib.parse.urlsplit(args.url)
+    mix = args.mix
+    names = [name for name, _weight in mix]
+    weights = [weight for _name, weight in mix]
+    deadline = time.monotonic() + args.duration
+
+    def user_loop(n):
+        rng = random.Random(args.seed * 1000 + n)
+        while time.monotonic() < deadline:
+            # sessions come and go
+            user = User(url.hostname, url.port or 80, args.timeout,
+                        results.record)
+            for _ in range(rng.randint(1, 4)):
+                if time.monotonic() >= deadline:
+                    break
+                scenario = rng.choices(names, weights)[0]
+                if scenario == 'large':
+                    user.large(rng, args.pause, args.atoms)
+                else:
+                    getattr(user, scenario)(rng, args.pause)
+                time.sleep(args.pause * rng.random())
+            user.close()
+
+    threads = [threading.Thread(target=user_loop, args=(n,), daemon=True)
+               for n in range(args.users)]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+        time.sleep(args.ramp / max(1, args.users))
+    for thread in threads:
+        thread.join()
+
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n\n')[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__.split('\n\n', 1)[1])
+    parser.add_argument('--url', default='http://127.0.0.1:5000',
+                        help='where the app is served')
+    parser.add_argument('--users', type=int, default=8,
+                        help='concurrent simulated users')
+    parser.add_argument('--duration', type=float, default=30,
+                        help='seconds to run for')
+    parser.add_argument('--ramp', type=float, default=2,
+                        help='seconds over which users are started')
+    parser.add_argument('--pause', type=float, default=0.5,
+                        help='mean think time between requests, in seconds')
+    parser.add_argument('--mix', type=parse_mix,
+                        default='typing=4,toggle=3,large=1,names=2',
+                        help='relative weights of the scenarios %s'
+                        % ', '.join(SCENARIOS))
+    parser.add_argument('--atoms', type=int, default=400,
+                        help='largest molfile size, in atoms')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--stand-in', type=int, metavar='PORT',
+                        help='serve the PubChem stand-in on this port')
+    parser.add_argument('--stand-in-delay', type=float, default=0.05,
+                        help='seconds the stand-in takes to answer')
+    parser.add_argument('--serve-only', action='store_true',
+                        help='only serve the stand-in, until interrupted')
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--baseline',
+                        help='compare against results from an earlier run')
+    args = parser.parse_args()
+
+    if args.stand_in is not None:
+        server = start_stand_in(args.stand_in, args.stand_in_delay)
+        print('PubChem stand-in at http://127.0.0.1:%d' % args.stand_in,
+              file=sys.stderr)
+        if args.serve_only:
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                server.shutdown()
+            return
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['summary']
+
+    results = Results()
+    elapsed = run(args, results)
+    summary = results.summary(elapsed)
+
+    report(summary, baseline)
+
+    if args.output:
+        settings = {key: value for key, value in vars(args).items()
+                    if key not in ('output', 'baseline')}
+        with open(args.output, 'w') as f:
+            json.dump(dict(settings=settings, summary=summary), f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
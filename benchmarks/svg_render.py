@@ -0,0 +1,56 @@
+'''
+time the SVG preview of polymers against the chemfig code that the
+PDF is compiled from. The preview is meant to be shown while the PDF
+is being compiled, so it should take a few milliseconds at most for
+molecules of everyday size.
+
+    python benchmarks/svg_render.py --atoms 25 100 1000
+'''
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mol2chemfig.molecule import Molecule
+from mol2chemfig.options import Options
+from mol2chemfig.svg import render_svg
+
+from synthetic import polymer
+
+
+def best_of(runs, fn, *args):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--atoms', type=int, nargs='+',
+                        default=[25, 100, 1000])
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    print('%8s %12s %12s %10s' % ('atoms', 'svg', 'chemfig', 'svg size'))
+
+    for atoms in args.atoms:
+        tkmol, exit_atom = polymer(atoms)
+        mol = Molecule(Options(entry_atom=1, exit_atom=exit_atom), tkmol)
+
+        svg_seconds, svg = best_of(args.runs, render_svg, mol)
+        chemfig_seconds, _ = best_of(args.runs, mol.render_server)
+
+        print('%8d %9.2f ms %9.2f ms %7.1f kB' % (
+            len(tkmol.atoms),
+            svg_seconds * 1000,
+            chemfig_seconds * 1000,
+            len(svg) / 1024))
+
+
+if __name__ == '__main__':
+    main()
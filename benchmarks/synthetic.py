@@ -0,0 +1,153 @@
+'''
+synthetic toolkit molecules of any size for the benchmarks. Molecule
+only reads atoms, bonds and rings from the toolkit molecule, and these
+classes provide just that, with coordinates already laid out, so that
+the benchmarks time mol2chemfig itself rather than the toolkit.
+'''
+import math
+
+
+class SyntheticAtom:
+    def __init__(self, mol, idx, element, x, y, hydrogens, charge=0):
+        self.mol = mol
+        self.idx = idx
+        self.element = element
+        self.x = x
+        self.y = y
+        self.hydrogens = hydrogens
+        self.formal_charge = charge
+
+    def index(self):
+        return self.idx
+
+    def symbol(self):
+        return self.element
+
+    def countImplicitHydrogens(self):
+        return self.hydrogens
+
+    def charge(self):
+        return self.formal_charge
+
+    def radicalElectrons(self):
+        return 0
+
+    def iterateNeighbors(self):
+        return [self.mol.atoms[idx] for idx in self.mol.neighbors[self.idx]]
+
+    def xyz(self):
+        return self.x, self.y, 0.0
+
+
+class SyntheticBond:
+    def __init__(self, mol, start, end, order, stereo=0):
+        self.mol = mol
+        self.start = start
+        self.end = end
+        self.order = order
+        self.stereo = stereo
+
+    def source(self):
+        return self.mol.atoms[self.start]
+
+    def destination(self):
+        return self.mol.atoms[self.end]
+
+    def bondOrder(self):
+        return self.order
+
+    def bondStereo(self):
+        return self.stereo
+
+
+class SyntheticRing:
+    def __init__(self, bonds):
+        self.bonds = bonds
+
+    def iterateBonds(self):
+        return iter(self.bonds)
+
+
+class SyntheticMolecule:
+    def __init__(self):
+        self.atoms = []
+        self.bonds = []
+        self.rings = []
+        self.neighbors = []
+
+    def add_atom(self, element, x, y, hydrogens=0, charge=0):
+        self.atoms.append(SyntheticAtom(
+            self, len(self.atoms), element, x, y, hydrogens, charge))
+        self.neighbors.append([])
+        return len(self.atoms) - 1
+
+    def add_bond(self, start, end, order=1, stereo=0):
+        bond = SyntheticBond(self, start, end, order, stereo)
+        self.bonds.append(bond)
+        self.neighbors[start].append(end)
+        self.neighbors[end].append(start)
+        return bond
+
+    def iterateAtoms(self):
+        return iter(self.atoms)
+
+    def iterateBonds(self):
+        return iter(self.bonds)
+
+    def iterateSSSR(self):
+        return iter(self.rings)
+
+    def countAtoms(self):
+        return len(self.atoms)
+
+    def aromatize(self):
+        pass
+
+    def hasCoord(self):
+        return True
+
+    def layout(self):
+        pass
+
+    def clone(self):
+        return self
+
+
+def polymer(atoms, ring_every=8):
+    '''
+    a zigzag chain with a pendant benzene ring on every ring_every-th
+    chain atom, of about the given number of atoms. The chain ends
+    are the first atom and the returned exit atom, both 1-based.
+    '''
+    mol = SyntheticMolecule()
+    bond = 1.0
+    dx = bond * math.cos(math.pi / 6)
+    dy = bond * math.sin(math.pi / 6)
+
+    chain = []
+    i = 0
+    while len(mol.atoms) < atoms:
+        up = i % 2 == 1
+        idx = mol.add_atom('C', i * dx, dy if up else 0.0, 2)
+        if chain:
+            mol.add_bond(chain[-1], idx)
+        chain.append(idx)
+
+        if up and i % ring_every == 1:
+            # a hexagon above this atom, attached by its lowest corner
+            center_y = dy + 2 * bond
+            ring = []
+            for k in range(6):
+                angle = -math.pi / 2 + k * math.pi / 3
+                ring.append(mol.add_atom(
+                    'C',
+                    i * dx + bond * math.cos(angle),
+                    center_y + bond * math.sin(angle),
+                    0 if k == 0 else 1))
+            mol.add_bond(idx, ring[0])
+            mol.rings.append(SyntheticRing([
+                mol.add_bond(ring[k], ring[(k + 1) % 6], 2 - k % 2)
+                for k in range(6)]))
+        i += 1
+
+    return mol, chain[-1] + 1
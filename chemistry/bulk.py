@@ -0,0 +1,141 @@
+'''
+bulk conversion of uploaded SD files or smiles lists. Records are
+converted in parallel, but only a bounded number of them is in flight
+at any time: the next record is only read once the client has consumed
+the oldest result, so a slow client throttles the conversion instead
+of making results pile up in memory.
+'''
+import collections
+import concurrent.futures
+import io
+import json
+import os
+import subprocess
+import zipfile
+
+from mol2chemfig import pdfgen
+
+# shared by all bulk requests
+executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=os.cpu_count() or 2, thread_name_prefix='bulk')
+
+# records converted ahead of the one the client is waiting for
+WINDOW = 16
+
+
+def convert_ordered(convert, records, window=WINDOW):
+    '''
+    apply convert to each record on the executor and yield the results
+    in input order, keeping at most window records in flight.
+    '''
+    pending = collections.deque()
+
+    for record in records:
+        pending.append(executor.submit(convert, record))
+
+        if len(pending) >= window:
+            yield pending.popleft().result()
+
+    while pending:
+        yield pending.popleft().result()
+
+
+def ndjson_stream(results):
+    '''
+    one JSON object per line and record
+    '''
+    for index, result in enumerate(results):
+        result = dict(result, index=index)
+        result.pop('pdf', None)     # binary; only in zip archives
+        yield (json.dumps(result) + '\n').encode('utf-8')
+
+
+class ChunkWriter(io.RawIOBase):
+    '''
+    unseekable file object that collects what is written to it until
+    it is taken out, so that a zip archive can be sent as it is built.
+    '''
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def zip_stream(results):
+    '''
+    a zip archive with a .tex file and, if present, a .pdf file per
+    record, plus errors.txt listing the records that failed, in whole
+    or only in their pdf.
+    '''
+    writer = ChunkWriter()
+    errors = []
+
+    with zipfile.ZipFile(writer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for index, result in enumerate(results):
+            name = 'molecule-%05d' % (index + 1)
+
+            if result['chemfig'] is None:
+                errors.append('%s: %s\n' % (name, result['error']))
+                continue
+
+            archive.writestr(name + '.tex', result['chemfig'])
+            if result.get('pdf') is not None:
+                archive.writestr(name + '.pdf', result['pdf'])
+            if result['error'] is not None:
+                errors.append('%s: %s\n' % (name, result['error']))
+
+            yield writer.take()
+
+        if errors:
+            archive.writestr('errors.txt', ''.join(errors))
+
+    yield writer.take()
+
+
+def record_converter(conversion, pdf_job=None, with_pdf=False):
+    '''
+    make the per-record conversion function. conversion maps a record
+    to a Conversion, or None on failure; pdf_job, if given, starts
+    a pdf job for a Conversion and returns its id; with_pdf
+    compiles the pdf right away, for inclusion in zip archives.
+    Whatever goes wrong with a record ends up in its error field.
+    '''
+    def convert(record):
+        try:
+            conversion_result = conversion(record)
+        except Exception as e:  # one bad record shouldn't end the stream
+            return dict(chemfig=None, error='%s: %s' % (type(e).__name__, e))
+
+        if conversion_result is None:
+            return dict(chemfig=None, error="Chemfig cannot be generated")
+
+        result = dict(chemfig=conversion_result.chemfig, error=None)
+
+        try:
+            if pdf_job is not None:
+                result['pdf_job'] = pdf_job(conversion_result)
+
+            if with_pdf:
+                result['pdf'] = pdfgen.render_pdf(
+                    conversion_result.server_chemfig,
+                    conversion_result.width,
+                    conversion_result.height)
+
+        except subprocess.CalledProcessError:
+            result['error'] = 'pdf generation foobared'
+        except Exception as e:  # keep the chemfig code, at least
+            result['error'] = '%s: %s' % (type(e).__name__, e)
+
+        return result
+
+    return convert
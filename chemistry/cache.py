@@ -0,0 +1,136 @@
+'''
+bounded in-memory cache for chemfig conversions, so that toggling
+options back and forth in the UI does not rerun the whole pipeline.
+'''
+import collections
+import hashlib
+import threading
+
+
+class LRUCache:
+    '''
+    least recently used cache, bounded both by the number of entries
+    and by the total size of the stored values. The size of a value
+    is obtained from the sizeof callable.
+    '''
+    def __init__(self, max_entries=256, max_bytes=32 * 2 ** 20, sizeof=len):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+
+        self._entries = collections.OrderedDict()   # key -> (value, size)
+        self._lock = threading.Lock()
+
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, _size = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        '''
+        store value under key. Storing a key again updates its size,
+        which is how entries that grow after the fact are accounted for.
+        '''
+        size = self.sizeof(value)
+
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+
+            if size > self.max_bytes:   # would evict everything else
+                return
+
+            self._entries[key] = (value, size)
+            self.nbytes += size
+
+            while (len(self._entries) > self.max_entries
+                   or self.nbytes > self.max_bytes):
+                _key, (_value, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                entries=len(self._entries),
+                bytes=self.nbytes,
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions)
+
+
+class ContentStore(LRUCache):
+    '''
+    LRU cache for immutable content, e.g. PDFs, stored under the
+    hash of the content itself.
+    '''
+    def add(self, content):
+        digest = hashlib.sha256(content).hexdigest()
+        self.put(digest, content)
+        return digest
+
+
+class Conversion:
+    '''
+    cached result of one conversion: the chemfig code as shown to the
+    user, the code and page size used for server-side PDF generation,
+    an SVG preview, and the digest of the PDF in the content store once
+    it has been compiled.
+    '''
+    def __init__(self, chemfig, server_chemfig, width, height, svg=''):
+        self.chemfig = chemfig
+        self.server_chemfig = server_chemfig
+        self.width = width
+        self.height = height
+        self.svg = svg
+        self.pdf_digest = None
+
+    def nbytes(self):
+        return len(self.chemfig) + len(self.server_chemfig) + len(self.svg)
+
+
+def normalize_input(data):
+    '''
+    strip insignificant whitespace from smiles or molfile input,
+    so that trivially different inputs share a cache entry.
+    '''
+    if isinstance(data, bytes):
+        data = data.decode('latin-1')
+
+    lines = [line.rstrip() for line in data.strip().splitlines()]
+    return '\n'.join(lines)
+
+
+def conversion_key(data, options):
+    '''
+    cache key from the normalized input and the Options, whose
+    repr is the same in every process
+    '''
+    digest = hashlib.sha256(normalize_input(data).encode('utf-8'))
+    digest.update(repr(options).encode('utf-8'))
+
+    return digest.hexdigest()
@@ -1,36 +1,389 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-from mol2chemfig.processor import process
+from mol2chemfig.processor import Processor
+from mol2chemfig.common import MCFError
+from mol2chemfig.indigo import IndigoException
 from mol2chemfig import pdfgen
+from mol2chemfig.svg import render_svg
+from mol2chemfig import metrics, pubchem
+from mol2chemfig.options import Options, SWITCHES, structure_options
 
-import base64
-import pubchempy as pcp
+from chemistry.cache import LRUCache, ContentStore, Conversion, conversion_key
+from chemistry.sessions import SessionStore, SessionState
+from chemistry.jobs import PdfJobs, JobsBusy, job_id
+from chemistry.livecompile import LiveCompiles
+from chemistry.scheduler import Scheduler, Lane
+from chemistry import bulk
 
-def smiles_mol_to_chemfig(*args):
-    all_args = ''
-    for i in args:
-        all_args += i + ' '
-    success, result = process(rawargs=all_args, progname='mol2chemfig')
+import asyncio
+import concurrent.futures
+import os
+import threading
+
+# recent conversions, keyed on input and effective options
+conversions = LRUCache(
+    max_entries=512,
+    max_bytes=64 * 2 ** 20,
+    sizeof=Conversion.nbytes)
+
+# the molecule each user is currently working on
+sessions = SessionStore(ttl=1800, max_bytes=256 * 2 ** 20)
+
+# background pdf compilation. Finished jobs are kept for a configurable
+# number of seconds, ten minutes by default
+pdf_jobs = PdfJobs(
+    max_workers=int(os.environ.get('MOL2CHEMFIG_PDF_WORKERS', 2)),
+    max_pending=32,
+    ttl=int(os.environ.get('MOL2CHEMFIG_PDF_JOB_TTL', 600)))
+
+# compiled pdfs, served under their digest
+pdf_store = ContentStore(
+    max_entries=4096,
+    max_bytes=int(os.environ.get('MOL2CHEMFIG_PDF_STORE_BYTES', 128 * 2 ** 20)),
+    sizeof=len)
+
+# page size for chemfig code edited by the user, which we can't measure
+EDITED_DIMENSIONS = (8, 6)
+
+# conversions that miss the cache run in a fast or a heavy lane,
+# depending on their predicted cost; full lanes turn requests away
+scheduler = Scheduler(
+    fast=Lane('fast',
+              workers=int(os.environ.get(
+                  'MOL2CHEMFIG_FAST_WORKERS', 2 * (os.cpu_count() or 2))),
+              max_queue=int(os.environ.get('MOL2CHEMFIG_FAST_QUEUE', 64)),
+              timeout=float(os.environ.get('MOL2CHEMFIG_QUEUE_TIMEOUT', 10))),
+    heavy=Lane('heavy',
+               workers=int(os.environ.get('MOL2CHEMFIG_HEAVY_WORKERS', 2)),
+               max_queue=int(os.environ.get('MOL2CHEMFIG_HEAVY_QUEUE', 8)),
+               timeout=float(os.environ.get('MOL2CHEMFIG_QUEUE_TIMEOUT', 10))),
+    heavy_seconds=float(os.environ.get('MOL2CHEMFIG_HEAVY_SECONDS', 0.25)))
+
+
+# rerendering modifies the session's Molecule. It is quick and holds
+# the GIL throughout, so one lock for all sessions costs next to nothing.
+rerender_lock = threading.Lock()
+
+
+def mol_conversion(mol):
+    '''
+    the Conversion of a Molecule as it is currently rendered
+    '''
+    width, height = mol.dimensions()
+    conversion = Conversion(
+        mol.render_user(), mol.render_server(), width, height,
+        svg=render_svg(mol))
+
+    return conversion
+
+
+def run_conversion(processor, tkmol=None):
+    '''
+    the part of the pipeline that the cache saves us. Returns the
+    Conversion, the toolkit molecule and the parsed Molecule.
+    '''
+    if tkmol is None:
+        tkmol = processor.load()
+
+    mol = processor.get_mol(tkmol)
+    return mol_conversion(mol), tkmol, mol
+
+
+def rerender_conversion(mol, options):
+    '''
+    the Conversion of an existing Molecule under new presentation
+    options, without parsing or layout
+    '''
+    with rerender_lock:
+        mol.rerender(options)
+        return mol_conversion(mol)
+
+
+def form_options(checks, angle=None, hydrogens=None):
+    '''
+    Options from the web form: the command line switches of the
+    checked boxes, the rotation angle and what to do with hydrogens.
+    Raises MCFError on anything the form can't have sent.
+    '''
+    values = dict(rotate=angle or 0.0, hydrogens=hydrogens or 'keep')
+
+    for check in checks:
+        switch = check.strip().lstrip('-')
+        if not switch:
+            continue
+        if switch not in SWITCHES:
+            raise MCFError('Unknown option -%s' % switch)
+        values[SWITCHES[switch]] = True
+
+    return Options(**values)
+
+
+def cached_conversion(options, state=None, data=None, schedule=True):
+    '''
+    run the conversion pipeline with the given Options, or fetch its
+    result from the cache. The input is either passed as data, or
+    the session state of an earlier conversion is passed in; then its
+    input and toolkit molecule are reused, and if only presentation
+    options changed, its Molecule is just rendered again.
+    Unless schedule is false, the pipeline runs under admission
+    control, and may raise Overloaded.
+
+    Returns the Conversion and the updated session state, or a
+    pair of Nones if the input can't be converted.
+    '''
+    if state is not None:
+        data = state.data
+
+    try:
+        processor = Processor(data, options)
+        key = conversion_key(processor.data, options)
+
+        conversion = conversions.get(key)
+        if conversion is None:
+            metrics.count('conversion_cache_miss')
+            tkmol = state.tkmol if state is not None else None
+            mol = state.mol if state is not None else None
+
+            if mol is not None and structure_options(mol.options) \
+                    == structure_options(options):
+                metrics.count('conversion_rerender')
+                conversion = rerender_conversion(mol, options)
+            elif schedule:
+                conversion, tkmol, mol = scheduler.run(
+                    processor.data, run_conversion, processor, tkmol)
+            else:
+                conversion, tkmol, mol = run_conversion(processor, tkmol)
+            conversions.put(key, conversion)
+
+            state = SessionState(processor.data, tkmol, mol)
 
-    if success:
-        pdfsuccess, pdfresult = pdfgen.pdfgen(result)        
-        if pdfsuccess:
-            encoded = base64.encodestring(pdfresult)
-            pdflink = "data:application/pdf;base64,{}".format(encoded)
         else:
-            pdflink = 'pdf generation foobared'            
-    try:    
-        outcome = result.render_user()
-        return outcome, pdflink 
-    except AttributeError:
+            metrics.count('conversion_cache_hit')
+            if state is None:
+                state = SessionState(processor.data)
+
+    except (MCFError, IndigoException):
+        metrics.count('conversion_error')
+        return None, None
+
+    return conversion, state
+
+
+def compile_pdf(chemfig, width, height, ticket=None):
+    '''
+    pdf job body: compile and file the pdf in the content store.
+    Returns its digest.
+    '''
+    return pdf_store.add(pdfgen.render_pdf(chemfig, width, height, ticket))
+
+
+# only the newest revision of live-edited code is compiled
+live_compiles = LiveCompiles(pdf_jobs, compile_pdf)
+
+
+def compile_conversion(conversion):
+    '''
+    pdf job body for a cached conversion, which remembers the digest
+    '''
+    conversion.pdf_digest = compile_pdf(
+        conversion.server_chemfig, conversion.width, conversion.height)
+    return conversion.pdf_digest
+
+
+async def compile_conversion_async(conversion):
+    '''
+    compile_conversion for event loops
+    '''
+    pdf = await pdfgen.render_pdf_async(
+        conversion.server_chemfig, conversion.width, conversion.height)
+    conversion.pdf_digest = pdf_store.add(pdf)
+    return conversion.pdf_digest
+
+
+def evicted(future):
+    '''
+    whether a finished pdf job's pdf has since been dropped from
+    pdf_store
+    '''
+    if future.cancelled() or future.exception() is not None:
+        return False
+    return future.result() not in pdf_store
+
+
+def conversion_pdf_job(conversion, loop=None):
+    '''
+    start compiling the PDF for a conversion, unless it is still in
+    the content store. If an event loop is given, the compilation runs
+    there rather than on a thread. Returns the job id, or None if the
+    queue is full.
+    '''
+    job = job_id(conversion.server_chemfig, conversion.width, conversion.height)
+
+    digest = conversion.pdf_digest
+    if digest is not None and digest in pdf_store:
+        return pdf_jobs.finished(job, digest)
+
+    # the job may still be around after its pdf was evicted
+    pdf_jobs.forget(job, evicted)
+
+    try:
+        if loop is not None:
+            return pdf_jobs.submit_coroutine(
+                job, loop, compile_conversion_async, conversion)
+        return pdf_jobs.submit(job, compile_conversion, conversion)
+    except JobsBusy:
+        return None
+
+
+def job_status(future):
+    '''
+    the status ('pending', 'done', 'failed' or 'superseded') and, if
+    done, the digest of a pdf job's future
+    '''
+    if not future.done():
+        return 'pending', None
+    if future.cancelled():
+        return 'superseded', None
+
+    error = future.exception()
+    if isinstance(error, pdfgen.CompileCancelled):
+        return 'superseded', None
+    if error is not None:
+        # LaTeX failed, or pdflatex could not be run at all; either
+        # way, render_pdf has counted it
+        return 'failed', None
+
+    digest = future.result()
+    if digest not in pdf_store:     # evicted in the meantime
+        return 'failed', None
+
+    return 'done', digest
+
+
+def pdf_job_result(job, timeout=0):
+    '''
+    wait up to timeout seconds for a pdf job. Returns the status
+    ('pending', 'done' or 'failed') and, once done, the digest of
+    the pdf in pdf_store. Jobs replaced by a newer revision of
+    live-edited code have the status 'superseded'. Returns None
+    if the job is unknown or has expired.
+    '''
+    future = pdf_jobs.get(job)
+    if future is None:
+        return None
+
+    concurrent.futures.wait([future], timeout)
+    return job_status(future)
+
+
+async def pdf_job_result_async(job, timeout=0):
+    '''
+    pdf_job_result for event loops
+    '''
+    future = pdf_jobs.get(job)
+    if future is None:
+        return None
+
+    if not future.done() and timeout:
+        waiter = asyncio.wrap_future(future)
+        # the outcome is read from the future itself; don't let asyncio
+        # complain that the waiter's exception was never retrieved
+        waiter.add_done_callback(lambda w: w.cancelled() or w.exception())
+        await asyncio.wait([waiter], timeout=timeout)
+    return job_status(future)
+
+
+def smiles_mol_to_chemfig(data, options, session_id=None, loop=None):
+    '''
+    convert new input with the given Options. If a session id is
+    given, the parsed molecule is remembered for subsequent option
+    updates in that session. With an event loop, the pdf is compiled
+    there.
+
+    Returns the chemfig code, the id of the pdf job and an svg
+    preview, or None, an error message and None.
+    '''
+    conversion, state = cached_conversion(options, data=data)
+
+    if conversion is None:
+        error = "Chemfig cannot be generated"
+        return None, error, None
+
+    if session_id is not None:
+        sessions.put(session_id, state)
+
+    job = conversion_pdf_job(conversion, loop)
+    return conversion.chemfig, job, conversion.svg
+
+
+def update_session_chemfig(session_id, options, loop=None):
+    '''
+    convert the current molecule of a session again with new options.
+    Returns the same as smiles_mol_to_chemfig, or None if the session
+    has no current molecule.
+    '''
+    state = sessions.get(session_id)
+    if state is None:
+        return None
+
+    conversion, state = cached_conversion(options, state=state)
+
+    if conversion is None:
         error = "Chemfig cannot be generated"
-        return None, error
+        return None, error, None
+
+    sessions.put(session_id, state)
+
+    job = conversion_pdf_job(conversion, loop)
+    return conversion.chemfig, job, conversion.svg
+
+
+def bulk_converter(options, with_jobs=False, with_files=False):
+    '''
+    conversion function for the records of a bulk request, which
+    all share the same Options. With with_jobs, each result
+    refers to a pdf job; with with_files, it carries the pdf itself.
+    '''
+    def conversion(record):
+        # bulk requests are already bounded by their own executor
+        conversion, _state = cached_conversion(
+            options, data=record, schedule=False)
+        return conversion
+
+    return bulk.record_converter(
+        conversion,
+        pdf_job=conversion_pdf_job if with_jobs else None,
+        with_pdf=with_files)
+
+
+def update_chemfig(chemfig, session_id=None, revision=None, page=None):
+    '''
+    start compiling chemfig code edited by the user. Revisions are
+    counted per page, which identifies one load of the editor in the
+    session. Returns the id of the pdf job, or None if the queue is
+    full or a newer revision from the same page has already been
+    submitted.
+    '''
+    width, height = EDITED_DIMENSIONS
+
+    try:
+        if session_id is not None and revision is not None:
+            return live_compiles.submit(
+                (session_id, page), revision, chemfig, width, height)
+
+        job = job_id(chemfig, width, height)
+        pdf_jobs.forget(job, evicted)
+        return pdf_jobs.submit(job, compile_pdf, chemfig, width, height)
+
+    except JobsBusy:
+        return None
 
 
 def get_name(name):
-    chemical_name = pcp.get_compounds(name, 'name')
     try:
-        return chemical_name[0].isomeric_smiles
-    except IndexError:
-        return "\n"
+        smiles = pubchem.resolver.name_to_smiles(name)
+    except pubchem.PubChemError:
+        smiles = None
+
+    return smiles or "\n"
@@ -0,0 +1,151 @@
+'''
+background PDF compilation, so that the chemfig code can be returned
+right away and the PDF fetched separately once it is ready.
+'''
+import asyncio
+import concurrent.futures
+import hashlib
+import threading
+import time
+
+from mol2chemfig.pdfgen import CompileCancelled
+
+
+class JobsBusy(Exception):
+    '''
+    too many jobs waiting for compilation
+    '''
+    pass
+
+
+def job_id(*parts):
+    '''
+    jobs are identified by their content, so that identical requests
+    share one compilation.
+    '''
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:32]
+
+
+class PdfJobs:
+    '''
+    runs compilations on a bounded pool of threads and keeps their
+    futures around for ttl seconds after submission.
+    '''
+    def __init__(self, max_workers=2, max_pending=32, ttl=600):
+        self.max_pending = max_pending
+        self.ttl = ttl
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='pdfgen')
+
+        self._jobs = {}     # job id -> (future, submission time)
+        self._lock = threading.Lock()
+
+    def submit(self, job, fn, *args):
+        '''
+        schedule fn(*args) under the given job id, unless a job with
+        that id already exists. Raises JobsBusy if the queue is full.
+        '''
+        return self._start(job, self._executor.submit, fn, *args)
+
+    def submit_coroutine(self, job, loop, fn, *args):
+        '''
+        like submit, but run the coroutine fn(*args) on an event loop
+        instead of a thread. May be called from any thread.
+        '''
+        def start():
+            return asyncio.run_coroutine_threadsafe(fn(*args), loop)
+
+        return self._start(job, start)
+
+    def _start(self, job, start, *args):
+        with self._lock:
+            self._expire(time.monotonic())
+
+            if job in self._jobs and not self._cancelled(job):
+                return job
+
+            pending = sum(
+                not future.done() for future, _ in self._jobs.values())
+            if pending >= self.max_pending:
+                raise JobsBusy()
+
+            future = start(*args)
+            self._jobs[job] = (future, time.monotonic())
+
+        return job
+
+    def finished(self, job, result):
+        '''
+        register a job whose result is already known, e.g. from a cache
+        '''
+        future = concurrent.futures.Future()
+        future.set_result(result)
+
+        with self._lock:
+            self._jobs.setdefault(job, (future, time.monotonic()))
+
+        return job
+
+    def get(self, job):
+        '''
+        return the future for a job, or None if it is unknown or expired
+        '''
+        with self._lock:
+            self._expire(time.monotonic())
+            entry = self._jobs.get(job)
+
+        if entry is None:
+            return None
+        return entry[0]
+
+    def forget(self, job, stale):
+        '''
+        drop a finished job if stale(future) says that its result is
+        no longer any good, so that the job can be submitted anew
+        '''
+        with self._lock:
+            entry = self._jobs.get(job)
+
+            if entry is not None and entry[0].done() and stale(entry[0]):
+                del self._jobs[job]
+
+    def cancel(self, job):
+        '''
+        drop a job that has not started yet. Returns False if it is
+        already running or done; running jobs are cancelled via their
+        CompileTicket instead.
+        '''
+        future = self.get(job)
+        return future is not None and future.cancel()
+
+    def _cancelled(self, job):
+        '''
+        cancelled jobs don't count as results and may be submitted again
+        '''
+        future, _ = self._jobs[job]
+
+        if future.cancelled():
+            return True
+        return future.done() and isinstance(
+            future.exception(), CompileCancelled)
+
+    def _expire(self, now):
+        expired = [job for job, (future, submitted) in self._jobs.items()
+                   if future.done() and now - submitted > self.ttl]
+
+        for job in expired:
+            del self._jobs[job]
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def stats(self):
+        with self._lock:
+            pending = sum(
+                not future.done() for future, _ in self._jobs.values())
+            return dict(jobs=len(self._jobs), pending=pending)
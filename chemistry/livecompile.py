@@ -0,0 +1,85 @@
+'''
+coalescing of the compilations triggered while a user edits chemfig
+code. Only the newest revision of each editor is worth compiling, so
+a new revision cancels the one before it, whether it is still queued
+or pdflatex is already running.
+
+Revisions are numbered by the page they are edited on, and start over
+when it is reloaded. An editor is therefore a page load in a session,
+not the session alone; otherwise a reloaded page, or a second tab,
+would have its revisions dropped as older than the first one's.
+'''
+import threading
+import time
+
+from mol2chemfig import pdfgen
+from chemistry.jobs import job_id
+
+
+class LiveCompiles:
+    '''
+    tracks the newest revision and its compile job per editor, which
+    may be any hashable key. Jobs run compile(chemfig, width, height,
+    ticket). Editors without activity for ttl seconds are forgotten.
+    '''
+    def __init__(self, jobs, compile, ttl=600):
+        self.jobs = jobs
+        self.compile = compile
+        self.ttl = ttl
+
+        # editor -> (revision, job id, ticket, time of submission)
+        self._editors = {}
+        self._lock = threading.Lock()
+
+        self.submitted = 0
+        self.superseded = 0
+        self.stale = 0
+
+    def submit(self, editor, revision, chemfig, width, height):
+        '''
+        compile a revision of an editor's code. Returns the job id, or
+        None if a newer revision has already been submitted. May raise
+        JobsBusy.
+        '''
+        now = time.monotonic()
+
+        with self._lock:
+            self._expire(now)
+
+            previous = self._editors.get(editor)
+            if previous is not None:
+                if revision <= previous[0]:
+                    self.stale += 1
+                    return None
+
+                _revision, previous_job, previous_ticket, _ = previous
+                if not self.jobs.cancel(previous_job):
+                    previous_ticket.cancel()
+                self.superseded += 1
+
+            ticket = pdfgen.CompileTicket()
+            job = job_id('live', editor, revision, chemfig, width, height)
+
+            self.jobs.submit(
+                job, self.compile, chemfig, width, height, ticket)
+            self._editors[editor] = (revision, job, ticket, now)
+            self.submitted += 1
+
+        return job
+
+    def _expire(self, now):
+        expired = [editor
+                   for editor, (_, _, _, submitted)
+                   in self._editors.items()
+                   if now - submitted > self.ttl]
+
+        for editor in expired:
+            del self._editors[editor]
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                editors=len(self._editors),
+                submitted=self.submitted,
+                superseded=self.superseded,
+                stale=self.stale)
@@ -0,0 +1,183 @@
+'''
+cost-aware admission control for conversions. The cost of each
+conversion is predicted from the size of its input and the measured
+cost of earlier inputs of similar size. Cheap ones run in the fast
+lane, expensive ones in a small heavy lane, so that a few large
+molecules cannot occupy every worker. When a lane's queue is full,
+requests are turned away with a hint on when to retry.
+'''
+import contextlib
+import math
+import threading
+import time
+
+from mol2chemfig import metrics
+from mol2chemfig.records import molecule_size
+
+# seconds per unit of size, before anything has been measured
+DEFAULT_SECONDS_PER_UNIT = 0.002
+# weight of each new measurement in the running means
+SMOOTHING = 0.2
+
+
+class Overloaded(Exception):
+    '''
+    a lane is full; retry_after is a guess in seconds
+    '''
+    def __init__(self, lane, retry_after):
+        super().__init__('%s lane is full' % lane)
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+def input_size(data):
+    '''
+    a single number for how much work an input is. Rings count
+    extra, since they go through ring annotation and aromatization.
+    '''
+    atoms, bonds, rings = molecule_size(data)
+    return atoms + bonds + 4 * rings
+
+
+class CostModel:
+    '''
+    running mean of the seconds taken, per power-of-two size class
+    '''
+    def __init__(self):
+        self._means = {}    # size class -> seconds
+        self._lock = threading.Lock()
+
+    def predict(self, size):
+        with self._lock:
+            mean = self._means.get(size.bit_length())
+
+        if mean is None:
+            return size * DEFAULT_SECONDS_PER_UNIT
+        return mean
+
+    def record(self, size, seconds):
+        size_class = size.bit_length()
+
+        with self._lock:
+            mean = self._means.get(size_class)
+            if mean is None:
+                self._means[size_class] = seconds
+            else:
+                self._means[size_class] = mean + SMOOTHING * (seconds - mean)
+
+    def stats(self):
+        with self._lock:
+            return {'size_%d' % 2 ** size_class: mean
+                    for size_class, mean in sorted(self._means.items())}
+
+
+class Lane:
+    '''
+    at most workers conversions at a time, and at most max_queue
+    waiting for their turn, for no longer than timeout seconds
+    '''
+    def __init__(self, name, workers, max_queue, timeout):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+
+        self._slots = threading.Semaphore(workers)
+        self._lock = threading.Lock()
+
+        self.waiting = 0
+        self.running = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.mean_seconds = None
+
+    def retry_after(self):
+        '''
+        seconds until the current queue should have drained
+        '''
+        mean = self.mean_seconds or 1.0
+        return max(1, math.ceil((self.waiting + 1) * mean / self.workers))
+
+    @contextlib.contextmanager
+    def slot(self):
+        with self._lock:
+            if self.running >= self.workers and self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded(self.name, self.retry_after())
+            self.waiting += 1
+
+        start = time.perf_counter()
+        acquired = self._slots.acquire(timeout=self.timeout)
+        waited = time.perf_counter() - start
+
+        with self._lock:
+            self.waiting -= 1
+            if not acquired:
+                self.timeouts += 1
+                raise Overloaded(self.name, self.retry_after())
+            self.running += 1
+            self.admitted += 1
+
+        metrics.observe('queue_wait_' + self.name, waited)
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self.running -= 1
+                if self.mean_seconds is None:
+                    self.mean_seconds = seconds
+                else:
+                    self.mean_seconds += SMOOTHING * (
+                        seconds - self.mean_seconds)
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                workers=self.workers,
+                waiting=self.waiting,
+                running=self.running,
+                admitted=self.admitted,
+                rejected=self.rejected,
+                timeouts=self.timeouts,
+                mean_seconds=self.mean_seconds)
+
+
+class Scheduler:
+    '''
+    runs each conversion in the lane its predicted cost calls for.
+    Predictions above heavy_seconds go to the heavy lane.
+    '''
+    def __init__(self, fast, heavy, heavy_seconds=0.25):
+        self.fast = fast
+        self.heavy = heavy
+        self.heavy_seconds = heavy_seconds
+        self.costs = CostModel()
+
+    def lane(self, size):
+        if self.costs.predict(size) > self.heavy_seconds:
+            return self.heavy
+        return self.fast
+
+    def run(self, data, fn, *args):
+        '''
+        call fn(*args) in the lane for data. May raise Overloaded.
+        '''
+        size = input_size(data)
+
+        with self.lane(size).slot():
+            start = time.perf_counter()
+            result = fn(*args)
+            self.costs.record(size, time.perf_counter() - start)
+
+        return result
+
+    def stats(self):
+        return dict(
+            fast=self.fast.stats(),
+            heavy=self.heavy.stats(),
+            costs=self.costs.stats())
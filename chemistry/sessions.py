@@ -0,0 +1,119 @@
+'''
+per-session store for the molecule a user is currently working on,
+so that option updates can reuse the parsed input instead of starting
+over, and concurrent users no longer overwrite each other's molecule.
+'''
+import collections
+import threading
+import time
+
+# rough memory cost of one atom in the toolkit molecule and the
+# Molecule tree, including its bonds. Only used for budgeting.
+ATOM_BYTES = 4096
+
+
+class SessionState:
+    '''
+    the current molecule of one session: the raw input data, the
+    toolkit molecule as loaded from it, and the Molecule built from it
+    with the most recent options. The latter two may be None if the
+    conversion was answered from the cache.
+    '''
+    def __init__(self, data, tkmol=None, mol=None):
+        self.data = data
+        self.tkmol = tkmol
+        self.mol = mol
+
+    def nbytes(self):
+        size = len(self.data)
+
+        if self.tkmol is not None:
+            size += self.tkmol.countAtoms() * ATOM_BYTES
+        if self.mol is not None:
+            size += len(self.mol.atoms) * ATOM_BYTES
+
+        return size
+
+
+class SessionStore:
+    '''
+    maps session ids to SessionState objects. Sessions expire after
+    ttl seconds without use; if the total size exceeds max_bytes, the
+    least recently used sessions are dropped first.
+    '''
+    def __init__(self, ttl=1800, max_bytes=256 * 2 ** 20):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        # session id -> (state, size, last use), oldest first
+        self._sessions = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        self.nbytes = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, session_id):
+        now = time.monotonic()
+
+        with self._lock:
+            self._expire(now)
+
+            try:
+                state, size, _last_use = self._sessions.pop(session_id)
+            except KeyError:
+                return None
+
+            self._sessions[session_id] = (state, size, now)
+            return state
+
+    def put(self, session_id, state):
+        now = time.monotonic()
+        size = state.nbytes()
+
+        with self._lock:
+            self._drop(session_id)
+            self._expire(now)
+
+            self._sessions[session_id] = (state, size, now)
+            self.nbytes += size
+
+            while self.nbytes > self.max_bytes and len(self._sessions) > 1:
+                oldest = next(iter(self._sessions))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def discard(self, session_id):
+        with self._lock:
+            self._drop(session_id)
+
+    def _drop(self, session_id):
+        entry = self._sessions.pop(session_id, None)
+        if entry is not None:
+            self.nbytes -= entry[1]
+
+    def _expire(self, now):
+        '''
+        drop sessions unused for longer than ttl. Sessions are ordered
+        by last use, so we can stop at the first one that is still live.
+        '''
+        while self._sessions:
+            session_id, (_state, _size, last_use) = \
+                next(iter(self._sessions.items()))
+
+            if now - last_use <= self.ttl:
+                break
+
+            self._drop(session_id)
+            self.expirations += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                sessions=len(self._sessions),
+                bytes=self.nbytes,
+                expirations=self.expirations,
+                evictions=self.evictions)
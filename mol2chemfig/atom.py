@@ -13,6 +13,13 @@ class Atom:
     wrapper around toolkit atom object, augmented with coordinates
     helper class for molecule.Molecule
     '''
+    __slots__ = (
+        'options', 'idx', 'x', 'y', 'element', 'hydrogens', 'charge',
+        'radical', 'neighbors', 'bond_angles', 'marker',
+        # set by score_angles and render
+        'first_quadrant', 'second_quadrant', 'charge_angle',
+        'string_pos', 'phantom', 'phantom_pos', 'explicit')
+
     explicit_characters = set(string.ascii_uppercase + string.digits)
 
     # 80 degrees have to remain free on either side
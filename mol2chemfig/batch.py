@@ -0,0 +1,184 @@
+'''
+convert every record of an SD file or smiles list, spread over a pool
+of processes. The chemfig code is written in input order, either as
+one .tex file per record or as a single file of \\definesubmol blocks.
+Records that cannot be converted are reported and skipped:
+
+    python -m mol2chemfig.batch molecules.sdf --out-dir tex \\
+        --options="--aromatic-circles=1 --wrap-chemfig=1"
+    python -m mol2chemfig.batch molecules.smi --submol molecules.tex
+
+Records are sent to the workers in chunks, and only a few chunks per
+worker are in flight at any time, so that input of any size is
+converted in bounded memory.
+'''
+import argparse
+import collections
+import concurrent.futures
+import itertools
+import os
+import sys
+
+from mol2chemfig.common import MCFError
+from mol2chemfig.indigo import IndigoException
+from mol2chemfig.mirror import open_dump
+from mol2chemfig.options import Options, getParser
+from mol2chemfig.processor import convert
+from mol2chemfig.records import iter_records
+
+# records per task sent to a worker
+CHUNKSIZE = 16
+
+# chunks in flight per worker
+WINDOW = 4
+
+
+def convert_record(record, options):
+    '''
+    the chemfig code for one record, and None; or None and the reason
+    the record could not be converted
+    '''
+    try:
+        return convert(record, options).render_user(), None
+
+    except (MCFError, IndigoException) as e:
+        return None, str(e) or type(e).__name__
+
+    except Exception as e:  # one bad record shouldn't end the batch
+        return None, '%s: %s' % (type(e).__name__, e)
+
+
+def convert_chunk(chunk, options, submol_prefix=None):
+    '''
+    worker task: convert the (index, record) pairs of a chunk. With
+    a submol prefix, each record becomes a submol named after it
+    and its position in the input.
+    '''
+    results = []
+
+    for index, record in chunk:
+        record_options = options
+        if submol_prefix is not None:
+            record_options = options.replace(
+                submol_name='%s%d' % (submol_prefix, index + 1))
+
+        code, error = convert_record(record, record_options)
+        results.append((index, code, error))
+
+    return results
+
+
+def chunked(items, size):
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def convert_ordered(executor, records, options, submol_prefix=None,
+                    chunksize=CHUNKSIZE, window=WINDOW):
+    '''
+    convert records on the executor and yield (index, code, error)
+    for each, in input order, with at most window chunks in flight
+    '''
+    pending = collections.deque()
+
+    for chunk in chunked(enumerate(records), chunksize):
+        pending.append(executor.submit(
+            convert_chunk, chunk, options, submol_prefix))
+
+        if len(pending) >= window:
+            yield from pending.popleft().result()
+
+    while pending:
+        yield from pending.popleft().result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m mol2chemfig.batch',
+        description='convert all molecules of an SD file or smiles list')
+
+    parser.add_argument('input',
+                        help='SD or smiles file, optionally gzipped; '
+                             '- for standard input')
+    parser.add_argument('--options', default='',
+                        help='mol2chemfig options for every record, '
+                             'given as --options="..."')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='worker processes (default: one per core)')
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE,
+                        help='records per task sent to a worker')
+
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument('--out-dir',
+                        help='write one PREFIX-NNNNN.tex file per record '
+                             'into this directory')
+    output.add_argument('--submol',
+                        help='write all records into this file as '
+                             'submols named PREFIX1, PREFIX2, ...; '
+                             '- for standard output')
+
+    parser.add_argument('--prefix', default='molecule',
+                        help='file or submol name prefix')
+
+    args = parser.parse_args(argv)
+
+    try:
+        options = Options.from_namespace(
+            getParser().parse_args(args.options.split()))
+        if args.submol is not None:
+            # check that the prefix makes valid submol names
+            options.replace(submol_name=args.prefix + '1')
+    except MCFError as e:
+        parser.error(str(e))
+
+    if args.input == '-':
+        lines = sys.stdin
+    else:
+        lines = open_dump(args.input)
+
+    if args.out_dir is not None:
+        os.makedirs(args.out_dir, exist_ok=True)
+        submol_prefix = None
+        out = None
+    else:
+        submol_prefix = args.prefix
+        out = sys.stdout if args.submol == '-' else open(args.submol, 'w')
+
+    converted = failed = 0
+
+    with concurrent.futures.ProcessPoolExecutor(args.workers) as executor:
+        results = convert_ordered(
+            executor, iter_records(lines), options, submol_prefix,
+            chunksize=args.chunksize, window=WINDOW * args.workers)
+
+        for index, code, error in results:
+            if code is None:
+                failed += 1
+                print('record %d: %s' % (index + 1, error), file=sys.stderr)
+                continue
+
+            converted += 1
+
+            if out is not None:
+                out.write(code + '\n\n')
+            else:
+                path = os.path.join(
+                    args.out_dir, '%s-%05d.tex' % (args.prefix, index + 1))
+                with open(path, 'w') as f:
+                    f.write(code + '\n')
+
+    if out is not None and out is not sys.stdout:
+        out.close()
+    if lines is not sys.stdin:
+        lines.close()
+
+    print('%d converted, %d failed' % (converted, failed), file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,6 @@
 import copy
 import math
+import types
 
 import mol2chemfig.chemfig_mappings as cfm
 from mol2chemfig.indigo import Indigo
@@ -21,6 +22,18 @@ bond_mapping = {
     Indigo.EITHER: 'either'
 }
 
+# stereo bond types read the other way round
+inverted_types = {
+    'upto': 'upfrom',
+    'downto': 'downfrom',
+    'upfrom': 'upto',
+    'downfrom': 'downto'
+}
+
+# bonds share these until they are given styles of their own
+no_styles = frozenset()
+no_values = types.MappingProxyType({})
+
 
 def compare_positions(x1, y1, x2, y2):
     '''
@@ -67,38 +80,29 @@ class Bond:
     On instantiation, the bond is not part of a hierarchy yet, so
     we can assign a parent. This has to occur later. So, initially
     we just know the start and the end atom.
-    '''
-    # flag for bond that is the last descendant of
-    # the exit bond - needed in rare case in
-    # cases for bond formatting.
-    is_last = False
-
-    # flag for bonds that should render their end atoms
-    # as phantoms: Ring closures and cross bonds
-    to_phantom = False
 
-    is_trunk = False  # by default, bonds are not part of the trunk
-    parent = None     # will be assigned when bonds are added to the tree.
-
-    # only significant in double bonds in rings that are
-    # not drawn with aromatic circles
-    clockwise = 0
+    Molecules hold thousands of bonds, so bonds keep their attributes
+    in slots rather than in a dict each.
+    '''
+    __slots__ = (
+        'options', 'start_atom', 'end_atom', 'bond_type', 'length',
+        'angle', 'marker',
+        # tree node state, set by _init_node
+        'parent', 'descendants', 'tikz_styles', 'tikz_values',
+        'is_last', 'to_phantom', 'is_trunk', 'clockwise', 'undecorated')
 
     def __init__(self,
                  options,
                  start_atom,
                  end_atom,
                  bond_type=None,
-                 stereo=0):
+                 stereo=0,
+                 dimensions=None):
 
-        self.options = options
+        self._init_node(options)
         self.start_atom = start_atom
         self.end_atom = end_atom
 
-        # special styles that get rendered via tikz
-        self.tikz_styles = set()
-        self.tikz_values = {}
-
         if stereo in (Indigo.UP, Indigo.DOWN):
             if self.options.flip_vertical != self.options.flip_horizontal:
                 stereo = Indigo.UP + Indigo.DOWN - stereo
@@ -112,11 +116,12 @@ class Bond:
             # or else keep passed-in string specifier
             self.bond_type = bond_mapping.get(bond_type, bond_type)
 
-        # bonds now are also the nodes in the molecule tree. These two
-        # attributes must be set later, when the tree is created.
-        self.descendants = []
+        # the molecule measures all its bonds at once and passes
+        # in length and angle; bonds made later measure themselves
+        if dimensions is None:
+            dimensions = self.bond_dimensions()
 
-        self.length, angle = self.bond_dimensions()
+        self.length, angle = dimensions
         # length is adjusted and rounded later, after all is parsed
 
         # apply molecule rotation
@@ -133,6 +138,39 @@ class Bond:
         else:
             self.marker = ""
 
+    def _init_node(self, options):
+        '''
+        set up the bond as a node of the molecule tree, not yet linked
+        to a parent or descendants; that happens when the tree is
+        created.
+        '''
+        self.options = options
+        self.parent = None
+        self.descendants = []
+
+        # special styles that get rendered via tikz
+        self.tikz_styles = no_styles
+        self.tikz_values = no_values
+
+        # flag for bond that is the last descendant of
+        # the exit bond - needed in rare case in
+        # cases for bond formatting.
+        self.is_last = False
+
+        # flag for bonds that should render their end atoms
+        # as phantoms: Ring closures and cross bonds
+        self.to_phantom = False
+
+        self.is_trunk = False  # by default, bonds are not part of the trunk
+
+        # only significant in double bonds in rings that are
+        # not drawn with aromatic circles
+        self.clockwise = 0
+
+        # type and tikz settings from before bond_to_chemfig decorated
+        # a fancy bond, if it did; see undecorate
+        self.undecorated = None
+
     def bond_dimensions(self):
         '''
         determine bond angle and distance between two atoms
@@ -144,22 +182,16 @@ class Bond:
             self.end_atom.y
         )
 
-    def is_clockwise(self, center_x, center_y):
+    def is_clockwise(self, center_angle):
         '''
         determine whether the bond will be drawn clockwise
-        or counterclockwise relative to center
+        or counterclockwise relative to center, given the
+        angle from the end atom to the center
         '''
         # assign only once
         if self.clockwise:
             return
 
-        _, center_angle = compare_positions(
-            self.end_atom.x,
-            self.end_atom.y,
-            center_x,
-            center_y
-        )
-
         # bond is already rotated at this stage, so we need to
         # rotate the ring center also
         center_angle += self.options.rotate
@@ -176,20 +208,19 @@ class Bond:
         '''
         return copy.copy(self)
 
-    def invert(self):
+    @property
+    def reverse_angle(self):
         '''
-        draw a bond backwards.
+        the angle of the bond drawn backwards
         '''
-        c = copy.deepcopy(self)
-        c.start_atom, c.end_atom = self.end_atom, self.start_atom
-        c.angle = (c.angle + 180) % 360
+        return (self.angle + 180) % 360
 
-        if self.bond_type == 'upto':
-            c.bond_type = 'upfrom'
-        elif self.bond_type == 'downto':
-            c.bond_type = 'downfrom'
-
-        return c
+    def invert(self):
+        '''
+        draw a bond backwards. The inverted bond is a view that shares
+        the atoms and the angle with this one.
+        '''
+        return InvertedBond(self)
 
     def set_link(self):
         '''
@@ -197,8 +228,8 @@ class Bond:
         any other tikz styles, and removes the marker.
         '''
         self.bond_type = "link"
-        self.tikz_styles = set()
-        self.tikz_values = {}
+        self.tikz_styles = no_styles
+        self.tikz_values = no_values
         self.marker = ""
 
     def set_cross(self, last=False):
@@ -214,8 +245,8 @@ class Bond:
         end_angle = min(end_angles.values())
         end = max(10, self.cotan100(end_angle))
 
-        self.tikz_styles.add("cross")
-        self.tikz_values.update(dict(bgstart=start, bgend=end))
+        self.tikz_styles = self.tikz_styles | {"cross"}
+        self.tikz_values = dict(self.tikz_values, bgstart=start, bgend=end)
 
         self.is_last = last
 
@@ -396,7 +427,7 @@ class Bond:
         if self.start_atom.explicit:
             start = 0
         else:
-            start_angles = self.upstream_angles().values()
+            start_angles = list(self.upstream_angles().values())
             if start_angles[0] is not None:
                 start = self.cotan100(0.5 * min(start_angles))
             else:
@@ -405,7 +436,7 @@ class Bond:
         if self.end_atom.explicit:
             end = 0
         else:
-            end_angles = self.downstream_angles().values()
+            end_angles = list(self.downstream_angles().values())
             if end_angles[0] is not None:
                 end = self.cotan100(0.5 * min(end_angles))
             else:
@@ -427,23 +458,27 @@ class Bond:
         if self.options.fancy_bonds \
            and self.bond_type in ('double', 'triple'):
 
+            undecorated = (self.bond_type, self.tikz_styles, self.tikz_values)
+
             if self.bond_type == 'double':
                 fd = self.fancy_double()
 
                 if fd is not None:
                     side, start, end = fd
 
-                    self.tikz_styles.add("double")
-                    self.tikz_styles.add(side)
-                    self.tikz_values.update(dict(start=start, end=end))
+                    self.tikz_styles = self.tikz_styles | {"double", side}
+                    self.tikz_values = dict(
+                        self.tikz_values, start=start, end=end)
                     self.bond_type = 'decorated'
+                    self.undecorated = undecorated
 
             elif self.bond_type == 'triple':
-                self.tikz_styles.add('triple')
+                self.tikz_styles = self.tikz_styles | {'triple'}
                 start, end = self.fancy_triple()
 
-                self.tikz_values.update(dict(start=start, end=end))
+                self.tikz_values = dict(self.tikz_values, start=start, end=end)
                 self.bond_type = 'decorated'
+                self.undecorated = undecorated
 
         code = cfm.format_bond(
             self.options,
@@ -462,6 +497,18 @@ class Bond:
 
         return code
 
+    def undecorate(self):
+        '''
+        undo the fancy bond decoration of bond_to_chemfig. Its choice
+        of side and shortening depends on which atoms were rendered
+        explicitly, so it must be made afresh when rendering again
+        with other options.
+        '''
+        if self.undecorated is not None:
+            self.bond_type, self.tikz_styles, self.tikz_values = \
+                self.undecorated
+            self.undecorated = None
+
     def indent(self, level, bond_code, atom_code='', comment_code=''):
         stuff = ' ' * self.options.indent * level \
                      + bond_code.rjust(cfm.BOND_CODE_WIDTH) \
@@ -486,6 +533,85 @@ class Bond:
         return self.indent(level, bond_code, atom_code, comment_code)
 
 
+class InvertedBond(Bond):
+    '''
+    a bond drawn from its end atom to its start atom.
+
+    The molecule keeps each bond in both directions. Rather than a
+    copy, the reverse direction is a view of the original bond: the
+    atoms are swapped and the angle is turned around. Type, length
+    and marker are copied when the view is made, with wedges pointing
+    the other way, so that linking, scaling or decorating one
+    direction leaves the other one alone.
+
+    The tree attributes (parent, descendants, styles, flags) belong
+    to the view itself, since only one direction of a bond ever
+    becomes part of the tree.
+    '''
+    __slots__ = ('bond',)
+
+    # the state of the view that clone passes on
+    node_attributes = (
+        'options', 'bond_type', 'length', 'marker',
+        'parent', 'descendants', 'tikz_styles', 'tikz_values',
+        'is_last', 'to_phantom', 'is_trunk', 'clockwise', 'undecorated')
+
+    def __init__(self, bond):
+        self._init_node(bond.options)
+        self.bond = bond
+
+        self.bond_type = inverted_types.get(bond.bond_type, bond.bond_type)
+        self.length = bond.length
+        self.marker = bond.marker
+
+    @property
+    def start_atom(self):
+        return self.bond.end_atom
+
+    @property
+    def end_atom(self):
+        return self.bond.start_atom
+
+    @property
+    def angle(self):
+        return self.bond.reverse_angle
+
+    @property
+    def reverse_angle(self):
+        return self.bond.angle
+
+    def clone(self):
+        '''
+        a plain bond in this direction, detached from the original
+        '''
+        c = copy.copy(self.bond)
+        for name in self.node_attributes:
+            setattr(c, name, getattr(self, name))
+
+        c.start_atom, c.end_atom = self.start_atom, self.end_atom
+        c.angle = self.angle
+        return c
+
+    def invert(self):
+        return self.bond
+
+
+class BondMap(dict):
+    '''
+    the bonds of a molecule, keyed by (start, end) atom indexes.
+    Only one direction of each bond is stored; the other one is made
+    from it, with Bond.invert, when it is first looked up. Most bonds
+    are only ever looked up in the direction the tree takes them.
+    '''
+    __slots__ = ()
+
+    def __missing__(self, key):
+        start, end = key
+        bond = dict.__getitem__(self, (end, start)).invert()
+        self[key] = bond
+        return bond
+
+
 class DummyFirstBond(Bond):
     '''
     semi-dummy class that only takes an endatom, wich is the
@@ -495,11 +621,12 @@ class DummyFirstBond(Bond):
     the molecule class.
     '''
 
+    __slots__ = ()
+
     def __init__(self, options, end_atom):
-        self.options = options
+        self._init_node(options)
         self.end_atom = end_atom
         self.angle = None
-        self.descendants = []
         self.length = None
 
     def bond_to_chemfig(self):
@@ -511,11 +638,12 @@ class AromaticRingBond(Bond):
     A gross hack to render the circle inside an aromatic ring
     as a node in the regular bond hierarchy.
     '''
-    descendants = []
+    __slots__ = ('parent_angle', 'radius')
+
     scale = 1.5             # 1.5 corresponds to chemfig's ring size
 
     def __init__(self,  options, parent, angle, length, inner_r):
-        self.options = options
+        self._init_node(options)
         self.angle = cfm.num_round(angle, 1) % 360
         if parent is not None:
             self.parent_angle = parent.angle
@@ -6,7 +6,7 @@ the TeX syntax defined by the chemfig package.
 '''
 
 import textwrap
-import mol2chemfig.common as common
+from mol2chemfig import metrics
 
 
 BOND_CODE_WIDTH = 50        # space for bonds - generous upfront, will be trimmed at the end
@@ -461,6 +461,7 @@ def strip_output(output_list):
     return chunked
 
 
+@metrics.timed('format')
 def format_output(options, output_list):
     '''
     optionally wrap the translated output into a command,
@@ -1,9 +1,7 @@
-import urllib.request
+from mol2chemfig import pubchem
 
 program = "mol2chemfig"
 version = "2.0.0"
-# pubchem url for retrieving sdf for numerical IDs
-PUBCHEM_URL_TEMPLATE = r"http://pubchem.ncbi.nlm.nih.gov/summary/summary.cgi?cid=%s&disopt=DisplaySDF"
 
 
 class MCFError(Exception):
@@ -14,7 +12,15 @@ class MCFError(Exception):
 
 
 def get_pubchem_sdf(pubchem_id: int):
-    return urllib.request.urlopen(PUBCHEM_URL_TEMPLATE % pubchem_id).read()
+    try:
+        sdf = pubchem.resolver.get_sdf(pubchem_id)
+    except pubchem.PubChemError:
+        raise MCFError("PubChem is not reachable right now")
+
+    if sdf is None:
+        raise MCFError("No PubChem compound with id %s" % pubchem_id)
+
+    return sdf
 
 
 HEADER = """
@@ -0,0 +1,76 @@
+'''
+bond and ring geometry for a whole molecule at once. Where
+bond.compare_positions measures one pair of points at a time, these
+functions take coordinate arrays and measure all bonds, or all ring
+atoms, in one vectorized pass.
+
+Angles are in degrees and follow compare_positions: they run from
+above -90 up to 270, and a point straight above or below, or on top
+of, the other one is at 90 or 270 degrees.
+'''
+import numpy
+
+
+def compare_positions(x1, y1, x2, y2):
+    '''
+    distances and angles from the points x1, y1 to the points
+    x2, y2, all given as arrays
+    '''
+    xdiff = x2 - x1
+    ydiff = y2 - y1
+
+    lengths = numpy.hypot(xdiff, ydiff)
+    angles = numpy.degrees(numpy.arctan2(ydiff, xdiff))
+
+    # arctan2 runs from -180 to 180 degrees
+    angles[angles <= -90] += 360
+
+    # arctan2 puts points on top of each other at 0 degrees
+    vertical = xdiff == 0
+    angles[vertical] = numpy.where(ydiff[vertical] < 0, 270.0, 90.0)
+
+    return lengths, angles
+
+
+def bond_geometry(coordinates, starts, ends):
+    '''
+    lengths and angles of the bonds from the atoms in rows starts of
+    the coordinate array to those in rows ends
+    '''
+    start = coordinates[starts]
+    end = coordinates[ends]
+
+    return compare_positions(start[:, 0], start[:, 1], end[:, 0], end[:, 1])
+
+
+def ring_geometry(coordinates, rings):
+    '''
+    the center of each ring, given as a list of the coordinate rows
+    of its atoms, and the distance and angle from each ring atom to
+    that center. Returns a list with one (center_x, center_y,
+    distances, angles) tuple per ring, the latter two as lists in
+    the order of the ring's atoms.
+    '''
+    if not rings:
+        return []
+
+    sizes = numpy.array([len(ring) for ring in rings])
+    rows = numpy.concatenate([numpy.asarray(ring, dtype=int)
+                              for ring in rings])
+    ring_of_atom = numpy.repeat(numpy.arange(len(rings)), sizes)
+
+    x = coordinates[rows, 0]
+    y = coordinates[rows, 1]
+
+    center_x = numpy.bincount(ring_of_atom, weights=x) / sizes
+    center_y = numpy.bincount(ring_of_atom, weights=y) / sizes
+
+    distances, angles = compare_positions(
+        x, y, center_x[ring_of_atom], center_y[ring_of_atom])
+
+    bounds = numpy.cumsum(sizes)[:-1]
+
+    return list(zip(center_x.tolist(),
+                    center_y.tolist(),
+                    [d.tolist() for d in numpy.split(distances, bounds)],
+                    [a.tolist() for a in numpy.split(angles, bounds)]))
@@ -0,0 +1,303 @@
+'''
+a pool of pdflatex processes that have already loaded the preamble
+and are waiting for the molecule to compile.
+
+pdftex only completes a PDF file at the end of a run, so a process
+can't emit more than one PDF. Instead, each worker is started ahead of
+time: it reads the preamble, then blocks on a \\read from its stdin.
+A job writes the document body into the worker's directory and sends
+the file name over the pipe; the worker inputs it, ships out the page
+and exits, and a replacement is warmed up in the background. TeX
+startup, format and package loading are thereby moved off the request
+path.
+'''
+import concurrent.futures
+import os
+import queue
+import selectors
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+DRIVER_TEX = 'driver.tex'
+JOB_TEX = 'job.tex'
+JOB_NAME = 'molecule'
+
+# printed by TeX when it reaches the \read below, i.e. when it is warm
+READY_PROMPT = rb'\mcfjob='
+
+# a worker that fails to start is retried after RETRY_DELAY seconds,
+# doubling up to MAX_RETRY_DELAY. After MAX_START_FAILURES failures in
+# a row, the pool gives up and compile fails right away.
+RETRY_DELAY = 0.5
+MAX_RETRY_DELAY = 30
+MAX_START_FAILURES = 5
+
+# how often a waiting compile checks whether the pool has given up
+POLL_INTERVAL = 0.1
+
+driver_template = r'''%(preamble)s
+{\endlinechar=-1 \global\read16 to \mcfjob}
+\nonstopmode
+\input{\mcfjob}
+'''
+
+
+class PoolUnavailable(Exception):
+    '''
+    no warm worker became available in time, or the pool has given
+    up starting workers
+    '''
+    pass
+
+
+class LatexWorker:
+    '''
+    one pdflatex process, running in its own directory, that
+    compiles exactly one job.
+    '''
+    def __init__(self, preamble, files, command='pdflatex', options=(),
+                 env=None):
+        self.directory = tempfile.mkdtemp(prefix='mcf-latex-')
+        self.ready = False
+
+        files = dict(files)
+        files[DRIVER_TEX] = driver_template % dict(preamble=preamble)
+
+        for name, contents in files.items():
+            with open(os.path.join(self.directory, name), 'w') as f:
+                f.write(contents)
+
+        # scrollmode, since nonstopmode forbids reading from the terminal
+        self.process = subprocess.Popen(
+            (command, '-interaction=scrollmode', *options,
+             '-jobname=' + JOB_NAME, DRIVER_TEX),
+            cwd=self.directory,
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT)
+
+    def wait_ready(self, timeout):
+        '''
+        consume terminal output until TeX prompts for the job. Returns
+        False if the process died or took longer than timeout seconds.
+        '''
+        deadline = time.monotonic() + timeout
+        seen = b''
+
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.process.stdout, selectors.EVENT_READ)
+
+            while READY_PROMPT not in seen:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not selector.select(remaining):
+                    return False
+
+                chunk = os.read(self.process.stdout.fileno(), 4096)
+                if not chunk:   # process exited
+                    return False
+
+                # keep just enough to spot a prompt split across reads
+                seen = seen[-len(READY_PROMPT):] + chunk
+
+        self.ready = True
+        return True
+
+    def healthy(self):
+        return self.ready and self.process.poll() is None
+
+    def run(self, body, timeout, ticket=None):
+        '''
+        compile the document body and return the PDF. A ticket,
+        if given, may kill the process to cancel the compilation.
+        '''
+        with open(os.path.join(self.directory, JOB_TEX), 'w') as f:
+            f.write(body)
+
+        if ticket is not None:
+            ticket.attach(self.process)
+
+        try:
+            output, _ = self.process.communicate(
+                (JOB_TEX + '\n').encode('ascii'), timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.kill()
+            raise subprocess.CalledProcessError(
+                -1, self.process.args, 'pdflatex timed out')
+
+        target = os.path.join(self.directory, JOB_NAME + '.pdf')
+
+        if self.process.returncode != 0 or not os.path.exists(target):
+            if ticket is not None:
+                ticket.check()
+            raise subprocess.CalledProcessError(
+                self.process.returncode, self.process.args, output)
+
+        with open(target, 'rb') as f:
+            return f.read()
+
+    def kill(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+    def close(self):
+        self.kill()
+        for stream in (self.process.stdin, self.process.stdout):
+            if stream is not None and not stream.closed:
+                stream.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class LatexPool:
+    '''
+    keeps size warm workers ready. Each compilation takes one worker
+    and starts a replacement; workers that die while idle are replaced
+    when they are picked up. Workers that fail to start are retried
+    with backoff, until too many failures in a row mark the pool as
+    dead. Extra pdflatex options and an environment for the workers
+    may be given.
+    '''
+    def __init__(self, preamble, files, size=2, timeout=30,
+                 command='pdflatex', options=(), env=None):
+        self.preamble = preamble
+        self.files = files
+        self.size = size
+        self.timeout = timeout
+        self.command = command
+        self.options = options
+        self.env = env
+
+        self._idle = queue.Queue()
+        self._spawner = concurrent.futures.ThreadPoolExecutor(
+            max_workers=size, thread_name_prefix='latexpool')
+        self._closed = threading.Event()
+        self._lock = threading.Lock()
+        self._start_failures = 0    # in a row
+
+        self.dead = False
+        self.jobs = 0
+        self.restarts = 0
+        self.failures = 0
+
+        for _ in range(size):
+            self._spawn()
+
+    def _spawn(self):
+        if not self._closed.is_set() and not self.dead:
+            self._spawner.submit(self._start_worker)
+
+    def _start_worker(self):
+        delay = RETRY_DELAY
+
+        while not self._closed.is_set():
+            try:
+                worker = LatexWorker(self.preamble, self.files, self.command,
+                                     self.options, self.env)
+            except FileNotFoundError:   # pdflatex missing; won't appear
+                self._start_failed(fatal=True)
+                return
+            except OSError:     # out of resources, for now
+                worker = None
+
+            if worker is not None and worker.wait_ready(self.timeout):
+                with self._lock:
+                    self._start_failures = 0
+                if self._closed.is_set():
+                    worker.close()
+                else:
+                    self._idle.put(worker)
+                return
+
+            if worker is not None:
+                worker.close()
+
+            if not self._start_failed():
+                return
+
+            # woken early by close
+            self._closed.wait(delay)
+            delay = min(delay * 2, MAX_RETRY_DELAY)
+
+    def _start_failed(self, fatal=False):
+        '''
+        count a worker that didn't come up. Returns whether to retry.
+        '''
+        with self._lock:
+            self.failures += 1
+            self._start_failures += 1
+
+            if fatal or self._start_failures >= MAX_START_FAILURES:
+                self.dead = True
+
+            return not self.dead
+
+    def _acquire(self):
+        '''
+        return a healthy idle worker, replacing dead ones
+        '''
+        deadline = time.monotonic() + self.timeout
+
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if self.dead:   # no more workers coming
+                    worker = self._idle.get_nowait()
+                else:
+                    worker = self._idle.get(
+                        timeout=max(min(remaining, POLL_INTERVAL), 0))
+            except queue.Empty:
+                if self.dead or remaining <= 0:
+                    raise PoolUnavailable()
+                continue
+
+            if worker.healthy():
+                return worker
+
+            worker.close()
+            with self._lock:
+                self.restarts += 1
+            self._spawn()
+
+    def compile(self, body, ticket=None):
+        '''
+        compile a document body, to be read after the preamble,
+        and return the PDF.
+        '''
+        worker = self._acquire()
+
+        with self._lock:
+            self.jobs += 1
+
+        try:
+            return worker.run(body, self.timeout, ticket)
+        except subprocess.CalledProcessError:
+            with self._lock:
+                self.failures += 1
+            raise
+        finally:
+            worker.close()
+            self._spawn()
+
+    def close(self):
+        self._closed.set()
+        self._spawner.shutdown(wait=True)
+
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                size=self.size,
+                dead=self.dead,
+                idle=self._idle.qsize(),
+                jobs=self.jobs,
+                restarts=self.restarts,
+                failures=self.failures)
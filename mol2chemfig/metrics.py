@@ -0,0 +1,262 @@
+'''
+latency histograms and event counters for the stages of a conversion,
+exposed in the Prometheus text format, and a per-request record of
+the time spent in each stage, for Server-Timing headers.
+
+Set MOL2CHEMFIG_METRICS=0 to switch this off; stage() and timed()
+then only cost a function call. The time spent on bookkeeping is
+itself counted, so the overhead can be read off the metrics.
+'''
+import bisect
+import collections
+import contextlib
+import contextvars
+import functools
+import math
+import os
+import threading
+import time
+
+ENABLED = os.environ.get('MOL2CHEMFIG_METRICS', '1') != '0'
+
+PREFIX = 'mol2chemfig'
+
+# upper bounds of the latency buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    '''
+    counts of observations per bucket, plus their number and sum
+    '''
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)    # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        '''
+        estimate a quantile by interpolating within its bucket.
+        Beyond the last bucket, its upper bound is returned.
+        '''
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        cumulative = 0
+        lower = 0.0
+
+        for upper, n in zip(self.buckets + (math.inf,), self.counts):
+            if n and cumulative + n >= rank:
+                if upper == math.inf:
+                    return lower
+                return lower + (upper - lower) * (rank - cumulative) / n
+            cumulative += n
+            lower = upper
+
+        return lower
+
+    def copy(self):
+        other = Histogram(self.buckets)
+        other.counts = list(self.counts)
+        other.count = self.count
+        other.sum = self.sum
+        return other
+
+
+_lock = threading.Lock()
+_histograms = collections.OrderedDict()   # stage -> Histogram
+_events = collections.Counter()
+_stats = []                               # (name, stats function)
+_overhead = 0.0
+
+# stage timings of the current request, as a list of (stage, seconds)
+_request = contextvars.ContextVar('mol2chemfig_request', default=None)
+
+
+def observe(name, seconds):
+    '''
+    record that a stage took this long
+    '''
+    if not ENABLED:
+        return
+
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+    timings = _request.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+def count(event, n=1):
+    '''
+    count an event, such as a cache hit or a failed compilation
+    '''
+    if ENABLED:
+        with _lock:
+            _events[event] += n
+
+
+@contextlib.contextmanager
+def _stage(name):
+    global _overhead
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stop = time.perf_counter()
+        observe(name, stop - start)
+        spent = time.perf_counter() - stop
+        with _lock:
+            _overhead += spent
+
+
+def stage(name):
+    '''
+    context manager timing the enclosed code as a stage
+    '''
+    if ENABLED:
+        return _stage(name)
+    return contextlib.nullcontext()
+
+
+def timed(name):
+    '''
+    decorator timing each call of a function as a stage
+    '''
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _stage(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def register_stats(name, stats):
+    '''
+    export the numbers returned by a stats() function as gauges
+    '''
+    _stats.append((name, stats))
+
+
+def begin_request():
+    '''
+    start recording stage timings for the current request
+    '''
+    if ENABLED:
+        _request.set([])
+
+
+def end_request():
+    '''
+    stop recording, and return the timings in the format of a
+    Server-Timing header, or None if there are none
+    '''
+    timings = _request.get()
+    _request.set(None)
+
+    if not timings:
+        return None
+
+    # a stage may run more than once in a request
+    totals = collections.OrderedDict()
+    for name, seconds in timings:
+        totals[name] = totals.get(name, 0.0) + seconds
+
+    return ', '.join('%s;dur=%.2f' % (name, seconds * 1000)
+                     for name, seconds in totals.items())
+
+
+def _flatten(stats, prefix=''):
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, prefix + key + '_')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield prefix + key, value
+
+
+def _snapshot():
+    with _lock:
+        histograms = [(name, histogram.copy())
+                      for name, histogram in _histograms.items()]
+        return histograms, dict(_events), _overhead
+
+
+def stats():
+    '''
+    count and estimated quantiles of each stage, in seconds
+    '''
+    histograms, events, overhead = _snapshot()
+
+    stages = {}
+    for name, histogram in histograms:
+        stages[name] = dict(count=histogram.count, sum=histogram.sum)
+        for q in QUANTILES:
+            stages[name]['p%d' % (q * 100)] = histogram.quantile(q)
+
+    return dict(enabled=ENABLED, stages=stages, events=events,
+                overhead=overhead)
+
+
+def exposition():
+    '''
+    all metrics in the Prometheus text format
+    '''
+    histograms, events, overhead = _snapshot()
+    lines = []
+
+    name = PREFIX + '_stage_seconds'
+    lines.append('# HELP %s Time spent in each stage of a conversion.' % name)
+    lines.append('# TYPE %s histogram' % name)
+    for stage_name, histogram in histograms:
+        cumulative = 0
+        for upper, n in zip(histogram.buckets + ('+Inf',), histogram.counts):
+            cumulative += n
+            lines.append('%s_bucket{stage="%s",le="%s"} %d'
+                         % (name, stage_name, upper, cumulative))
+        lines.append('%s_sum{stage="%s"} %r'
+                     % (name, stage_name, histogram.sum))
+        lines.append('%s_count{stage="%s"} %d'
+                     % (name, stage_name, histogram.count))
+
+    name = PREFIX + '_events_total'
+    lines.append('# HELP %s Cache hits, errors and other events.' % name)
+    lines.append('# TYPE %s counter' % name)
+    for event, n in sorted(events.items()):
+        lines.append('%s{event="%s"} %d' % (name, event, n))
+
+    name = PREFIX + '_metrics_overhead_seconds_total'
+    lines.append('# HELP %s Time spent recording metrics.' % name)
+    lines.append('# TYPE %s counter' % name)
+    lines.append('%s %r' % (name, overhead))
+
+    for stats_name, stats_fn in _stats:
+        values = stats_fn()
+        if values is None:
+            continue
+        name = '%s_%s' % (PREFIX, stats_name)
+        lines.append('# TYPE %s gauge' % name)
+        for key, value in _flatten(values):
+            lines.append('%s{stat="%s"} %r' % (name, key, value))
+
+    return '\n'.join(lines) + '\n'
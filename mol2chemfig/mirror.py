@@ -0,0 +1,240 @@
+'''
+local mirror of the parts of PubChem that we look up: the SD file and
+isomeric smiles of each compound, and the names that point to them.
+The mirror is an SQLite file with zlib-compressed molblocks, filled
+from PubChem's FTP dumps:
+
+    python -m mol2chemfig.mirror pubchem.db \\
+        --sdf Compound_000000001_000500000.sdf.gz \\
+        --smiles CID-SMILES.gz --synonyms CID-Synonym-filtered.gz
+
+Dumps are read line by line and written in batches, so that files
+of any size are imported in bounded memory. Importing again adds to
+the mirror or updates it.
+'''
+import argparse
+import gzip
+import itertools
+import sqlite3
+import threading
+import zlib
+
+from mol2chemfig.records import iter_sdf_records
+
+# rows per transaction while importing
+BATCH = 10000
+
+# data items of PubChem SD files; newer dumps name the smiles PUBCHEM_SMILES
+CID_ITEM = 'PUBCHEM_COMPOUND_CID'
+SMILES_ITEMS = ('PUBCHEM_SMILES', 'PUBCHEM_OPENEYE_ISO_SMILES')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS compound (
+    cid INTEGER PRIMARY KEY,
+    sdf BLOB,
+    smiles TEXT
+);
+CREATE TABLE IF NOT EXISTS synonym (
+    name TEXT PRIMARY KEY,
+    cid INTEGER NOT NULL
+) WITHOUT ROWID;
+'''
+
+
+def open_dump(path):
+    '''
+    open a dump for reading lines, uncompressing it on the fly if needed
+    '''
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, encoding='utf-8', errors='replace')
+
+
+def parse_sdf_record(record):
+    '''
+    split a PubChem SD record into its CID, its molblock and
+    its isomeric smiles. Returns None if there is no CID.
+    '''
+    molblock, _, data = record.partition('M  END')
+    molblock += 'M  END\n'
+
+    items = {}
+    name = None
+    for line in data.splitlines():
+        if line.startswith('>'):
+            name = line[line.find('<') + 1:line.rfind('>')]
+        elif name is not None and line.strip():
+            items.setdefault(name, line.strip())
+
+    try:
+        cid = int(items[CID_ITEM])
+    except (KeyError, ValueError):
+        return None
+
+    smiles = None
+    for item in SMILES_ITEMS:
+        if item in items:
+            smiles = items[item]
+            break
+
+    return cid, molblock, smiles
+
+
+def iter_tab_pairs(lines):
+    '''
+    yield (cid, value) from tab-separated CID-xxx dumps
+    '''
+    for line in lines:
+        cid, _, value = line.rstrip('\n').partition('\t')
+        value = value.strip()
+        if value and cid.isdigit():
+            yield int(cid), value
+
+
+class PubChemMirror:
+    '''
+    lookups in, and imports into, a mirror file. Lookups may come
+    from any thread; each thread gets its own read-only connection.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+        self._lock = threading.Lock()   # for the counters
+        self.hits = 0
+        self.misses = 0
+
+    def _reader(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                'file:%s?mode=ro' % self.path, uri=True)
+            self._local.connection = connection
+        return connection
+
+    def _lookup(self, query, key):
+        row = self._reader().execute(query, (key,)).fetchone()
+
+        found = row is not None and row[0] is not None
+
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        return row[0] if found else None
+
+    def get_sdf(self, cid):
+        '''
+        the molblock of a compound, or None if it isn't mirrored
+        '''
+        sdf = self._lookup('SELECT sdf FROM compound WHERE cid = ?', int(cid))
+        return None if sdf is None else zlib.decompress(sdf)
+
+    def name_to_smiles(self, name):
+        '''
+        isomeric smiles of the compound a name refers to, or None
+        '''
+        return self._lookup(
+            'SELECT smiles FROM synonym JOIN compound USING (cid) '
+            'WHERE name = ?', name.strip().lower())
+
+    def stats(self):
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses)
+
+    # importing
+
+    def _writer(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute('PRAGMA journal_mode = WAL')
+        connection.execute('PRAGMA synchronous = OFF')
+        connection.executescript(SCHEMA)
+        return connection
+
+    def _import(self, statement, rows):
+        '''
+        run statement for all rows, one transaction per batch.
+        Returns the number of rows.
+        '''
+        rows = iter(rows)
+        count = 0
+
+        connection = self._writer()
+        try:
+            while True:
+                batch = list(itertools.islice(rows, BATCH))
+                if not batch:
+                    break
+                with connection:
+                    connection.executemany(statement, batch)
+                count += len(batch)
+        finally:
+            connection.close()
+
+        return count
+
+    def import_sdf(self, lines):
+        '''
+        import the molblocks, and smiles if present, of a PubChem SD file
+        '''
+        def rows():
+            for record in iter_sdf_records(lines):
+                parsed = parse_sdf_record(record)
+                if parsed is not None:
+                    cid, molblock, smiles = parsed
+                    yield cid, zlib.compress(molblock.encode('utf-8')), smiles
+
+        return self._import(
+            'INSERT INTO compound (cid, sdf, smiles) VALUES (?, ?, ?) '
+            'ON CONFLICT (cid) DO UPDATE SET sdf = excluded.sdf, '
+            'smiles = coalesce(excluded.smiles, smiles)', rows())
+
+    def import_smiles(self, lines):
+        '''
+        import a CID-SMILES dump
+        '''
+        return self._import(
+            'INSERT INTO compound (cid, smiles) VALUES (?, ?) '
+            'ON CONFLICT (cid) DO UPDATE SET smiles = excluded.smiles',
+            iter_tab_pairs(lines))
+
+    def import_synonyms(self, lines):
+        '''
+        import a CID-Synonym dump. A name that belongs to several
+        compounds keeps the first one listed, the lowest CID, which
+        is also the one PubChem would return first.
+        '''
+        rows = ((name.lower(), cid) for cid, name in iter_tab_pairs(lines))
+
+        return self._import(
+            'INSERT OR IGNORE INTO synonym (name, cid) VALUES (?, ?)', rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m mol2chemfig.mirror',
+        description='import PubChem dumps into a local mirror')
+
+    parser.add_argument('database', help='mirror file; created if missing')
+    parser.add_argument('--sdf', nargs='+', default=[],
+                        help='Compound_*.sdf(.gz) files')
+    parser.add_argument('--smiles', nargs='+', default=[],
+                        help='CID-SMILES(.gz) files')
+    parser.add_argument('--synonyms', nargs='+', default=[],
+                        help='CID-Synonym-filtered(.gz) files')
+
+    args = parser.parse_args(argv)
+    mirror = PubChemMirror(args.database)
+
+    for paths, load in ((args.sdf, mirror.import_sdf),
+                        (args.smiles, mirror.import_smiles),
+                        (args.synonyms, mirror.import_synonyms)):
+        for path in paths:
+            with open_dump(path) as f:
+                print('%s: %d rows' % (path, load(f)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,86 +1,112 @@
 import collections
 import math
 
+import numpy
+
 # TODO(meawoppl) Import tidy
 import mol2chemfig.chemfig_mappings as cfm
 from mol2chemfig.common import MCFError
+from mol2chemfig import metrics
+from mol2chemfig.options import structure_options
 
 from mol2chemfig.atom import Atom
 from mol2chemfig.bond import \
-    Bond, DummyFirstBond, AromaticRingBond, compare_positions
+    Bond, BondMap, DummyFirstBond, AromaticRingBond
+from mol2chemfig import geometry
 
 from mol2chemfig.indigo import IndigoException
 
 
+class TreeIndex:
+    '''
+    the bonds of a molecule tree, flattened in pre-order, with the
+    depth of each bond below the root. Both are found in a single
+    walk over the tree.
+    '''
+    __slots__ = ('bonds', 'depths')
+
+    def __init__(self, root):
+        self.bonds = []
+        self.depths = []
+
+        stack = [(root, 0)]
+
+        while stack:
+            bond, depth = stack.pop()
+
+            self.bonds.append(bond)
+            self.depths.append(depth)
+
+            for descendant in reversed(bond.descendants):
+                stack.append((descendant, depth + 1))
+
+
 class Molecule:
     bond_scale = 1.0        # can be overridden by user option
     exit_bond = None        # first bond that connects to the exit atom
+    tree_index = None       # cached TreeIndex; reset when the tree changes
 
     def __init__(self, options, tkmol):
         self.options = options
         self.tkmol = tkmol
 
-        self.atoms = self.parseAtoms()
-
-        # now it's time to flip and flop the coordinates
-        for atom in self.atoms.values():
-            if self.options.flip_horizontal:
-                atom.x = -atom.x
-            if self.options.flip_vertical:
-                atom.y = -atom.y
+        with metrics.stage('tree'):
+            self.atoms = self.parseAtoms()
+            self.bonds, self.atom_pairs = self.parseBonds()
 
-        self.bonds, self.atom_pairs = self.parseBonds()
+            # work out the angles for each atom - this is used for
+            # positioning of implicit hydrogens and charges.
 
-        # work out the angles for each atom - this is used for
-        # positioning of implicit hydrogens and charges.
+            for connection, bond in self.bonds.items():
+                first_idx, last_idx = connection
+                self.atoms[first_idx].bond_angles.append(bond.angle)
+                self.atoms[last_idx].bond_angles.append(bond.reverse_angle)
 
-        for connection, bond in self.bonds.items():
-            first_idx, _last_idx = connection
-            self.atoms[first_idx].bond_angles.append(bond.angle)
+            # this would be the place to work out the placement of the second
+            # and third strokes.
 
-        # this would be the place to work out the placement of the second
-        # and third strokes.
+            # connect fragments, if any, with invisible bonds. By doing this
+            # AFTER assigning bond angles, we prevent these invisible bonds
+            # from interfering with placement of hydrogens or charges.
+            self.connect_fragments()  # connect fragments or isolated atoms
 
-        # connect fragments, if any, with invisible bonds. By doing this
-        # AFTER assigning bond angles, we prevent these invisible bonds
-        # from interfering with placement of hydrogens or charges.
-        self.connect_fragments()  # connect fragments or isolated atoms
+            # arrange the bonds into a tree
+            self.seen_atoms = set()
+            self.seen_bonds = set()
 
-        # arrange the bonds into a tree
-        self.seen_atoms = set()
-        self.seen_bonds = set()
+            self.entry_atom, self.exit_atom = self.pickFirstLastAtoms()
+            self.root = self.parseTree(
+                start_atom=None, end_atom=self.entry_atom)
 
-        self.entry_atom, self.exit_atom = self.pickFirstLastAtoms()
-        self.root = self.parseTree(start_atom=None, end_atom=self.entry_atom)
+            if len(self.atoms) > 1:
+                if self.exit_atom is None:  # pick a default exit atom
+                    self.exit_bond = self.default_exit_bond()
+                    self.exit_atom = self.exit_bond.end_atom
 
-        if len(self.atoms) > 1:
-            if self.exit_atom is None:  # pick a default exit atom if needed
-                self.exit_bond = self.default_exit_bond()
-                self.exit_atom = self.exit_bond.end_atom
+                # flag all atoms between the entry atom and the exit atom -
+                # these will be part of the trunk, others will be rendered
+                # as branches
+                if self.entry_atom is not self.exit_atom:
+                    flagged_bond = self.exit_bond
 
-            # flag all atoms between the entry atom and the exit atom - these
-            # will be part of the trunk, others will be rendered as branches
-            if self.entry_atom is not self.exit_atom:
-                flagged_bond = self.exit_bond
+                    while flagged_bond.end_atom is not self.entry_atom:
+                        flagged_bond.is_trunk = True
+                        flagged_bond = flagged_bond.parent
 
-                while flagged_bond.end_atom is not self.entry_atom:
-                    flagged_bond.is_trunk = True
-                    flagged_bond = flagged_bond.parent
+                # process cross bonds
+                if self.options.cross_bond is not None:
+                    self.process_cross_bonds()
 
-            # process cross bonds
-            if self.options.cross_bond is not None:
-                self.process_cross_bonds()
+                # adjust bond lengths
+                self.scaleBonds()
 
-            # adjust bond lengths
-            self.scaleBonds()
+                # modify bonds in rings
+                self.annotateRings()
 
-            # modify bonds in rings
-            self.annotateRings()
-
-        # let each atom work out its preferred quadrant for placing
-        # hydrogens or charges
-        for atom in self.atoms.values():
-            atom.score_angles()
+            # let each atom work out its preferred quadrant for placing
+            # hydrogens or charges
+            for atom in self.atoms.values():
+                atom.score_angles()
 
         # finally, render the thing and cache the result.
         self._rendered = self.render()
@@ -97,7 +123,6 @@ class Molecule:
         bond.set_link()
 
         self.bonds[(x, y)] = bond
-        self.bonds[(y, x)] = bond.invert()
 
         start_atom.neighbors.append(y)
         end_atom.neighbors.append(x)
@@ -107,104 +132,82 @@ class Molecule:
         connect multiple fragments, using link bonds across their
         last and first atoms, respectively.
         '''
-        fragments = self.molecule_fragments()
-
-        if len(fragments) > 1:
+        fragments, orphans = self.molecule_fragments()
 
-            for head, tail in zip(fragments[:-1], fragments[1:]):
-                head_last = head[-1][-1]
-                tail_first = tail[0][0]
-
-                self.link_atoms(head_last, tail_first)
+        for head, tail in zip(fragments[:-1], fragments[1:]):
+            self.link_atoms(head[-1], tail[0])
 
         # now look for orphaned single atoms
-        atoms = set(self.atoms.keys())
-
-        bonded = set()
-        for pair in self.atom_pairs:
-            bonded.update(pair)
-
-        unbonded = list(atoms - bonded)
-
-        if unbonded:
+        if orphans:
             if fragments:
-                anchor = fragments[-1][-1][-1]
+                anchor = fragments[-1][-1]
             else:
                 # several atoms, but no bonds
-                anchor, unbonded = unbonded[0], unbonded[1:]
+                anchor, orphans = orphans[0], orphans[1:]
 
-            for atom in unbonded:
+            for atom in orphans:
                 self.link_atoms(anchor, atom)
 
     def molecule_fragments(self):
         '''
-        identify unconnected fragments in the molecule.
-        used by connect_fragments
-        '''
-        def split_pairs(pair_list):
-            '''
-            break up pair_list into one list that contains all pairs
-            that are connected, directly or indirectly,  to the first
-            pair in the list, and another list containing the rest.
-            '''
-            first, rest = pair_list[0], pair_list[1:]
-            connected_atoms = set(first)
-
-            connected_pairs = [first]
-
-            while True:
-                unconnected = []
-
-                for r in rest:
-                    s = set(r)
-
-                    if connected_atoms & s:
-                        connected_atoms |= s
-                        connected_pairs.append(r)
-                    else:
-                        unconnected.append(r)
+        identify unconnected fragments in the molecule, using a
+        disjoint set over the atoms. Returns the fragments, as lists
+        of atom indexes, and the indexes of atoms without any bonds.
+        Fragments, and the atoms within them, are ordered by their
+        first appearance in the bonds. Used by connect_fragments.
+        '''
+        parent = {idx: idx for idx in self.atoms}
+        size = dict.fromkeys(self.atoms, 1)
+
+        def find(idx):
+            # path halving: point every other node to its grandparent
+            while parent[idx] != idx:
+                parent[idx] = parent[parent[idx]]
+                idx = parent[idx]
+            return idx
+
+        for start, end in self.atom_pairs:
+            start, end = find(start), find(end)
+            if start == end:
+                continue
+            if size[start] < size[end]:
+                start, end = end, start
+            parent[end] = start
+            size[start] += size[end]
 
-                if len(unconnected) == len(rest):
-                    # no new pairs found in this loop iteration
-                    return connected_pairs, unconnected
-                else:
-                    rest = unconnected
+        fragments = collections.OrderedDict()   # root -> atom indexes
+        bonded = set()
 
-        fragments = []
+        for pair in self.atom_pairs:
+            for idx in pair:
+                if idx not in bonded:
+                    bonded.add(idx)
+                    fragments.setdefault(find(idx), []).append(idx)
 
-        atom_pairs = self.atom_pairs[:]
+        orphans = sorted(idx for idx in self.atoms if idx not in bonded)
 
-        if len(atom_pairs) == 0:
-            return []
-        elif len(atom_pairs) == 1:
-            return [atom_pairs]
+        return list(fragments.values()), orphans
 
-        while True:
-            connected, rest = split_pairs(atom_pairs)
-            fragments.append(connected)
+    def indexTree(self):
+        '''
+        return the TreeIndex of the molecule tree, walking the tree
+        only if it has changed since the last call
+        '''
+        if self.tree_index is None:
+            self.tree_index = TreeIndex(self.root)
 
-            if not rest:
-                return fragments
-            else:
-                atom_pairs = rest
+        return self.tree_index
 
     def treebonds(self, root=False):
         '''
-        return a list with all bonds in the molecule tree
+        return a list with all bonds in the molecule tree, in pre-order
         '''
-        allbonds = []
-
-        def recurse(rt):
-            allbonds.append(rt)
-            for d in rt.descendants:
-                recurse(d)
-
-        recurse(self.root)
+        allbonds = self.indexTree().bonds
 
         if not root:
-            allbonds = allbonds[1:]
+            return allbonds[1:]
 
-        return allbonds
+        return list(allbonds)
 
     def process_cross_bonds(self):
         '''
@@ -272,31 +275,31 @@ class Molecule:
                 # the starting point of the elevated bond
                 self.exit_bond.descendants.append(bond_copy)
 
+            self.tree_index = None
+
     def default_exit_bond(self):
         '''
         pick the bond and atom that is at the greatest distance from
         the entry atom along the parsed molecule tree. This
-        must be one of the leaf atoms, obviously.
+        must be one of the leaf atoms, obviously. Among bonds equally
+        far out, the one with the most descendants wins, and after
+        that the last one in pre-order.
         '''
-        scored = []
+        index = self.indexTree()
+        picked = picked_score = None
 
-        for bond in self.treebonds():
+        # the root bond ends in the entry atom, so the depth of every
+        # other bond is its distance from the entry atom
+        for bond, distance in zip(index.bonds[1:], index.depths[1:]):
             if bond.to_phantom:   # don't pick phantom atoms as exit
                 continue
 
-            distance = 0
-
-            the_bond = bond
+            score = (distance, len(bond.descendants))
 
-            while (the_bond is not None and
-                   the_bond.end_atom is not self.entry_atom):
-                distance += 1
-                the_bond = the_bond.parent
+            if picked is None or score >= picked_score:
+                picked, picked_score = bond, score
 
-            scored.append((distance, len(bond.descendants), bond))
-
-        scored.sort()
-        return scored[-1][-1]
+        return picked
 
     def pickFirstLastAtoms(self):
         '''
@@ -312,8 +315,8 @@ class Molecule:
 
         else:
             # pick a default atom with few neighbors
-            atoms = self.atoms.values()
-            atoms.sort(key=lambda atom: len(atom.neighbors))
+            atoms = sorted(self.atoms.values(),
+                           key=lambda atom: len(atom.neighbors))
             entry_atom = atoms[0]
 
         if self.options.exit_atom is not None:
@@ -328,10 +331,13 @@ class Molecule:
 
     def parseAtoms(self):
         '''
-        Read some attributes from the toolkit atom object
+        Read some attributes from the toolkit atom object. The
+        coordinates of all atoms are also kept in one array,
+        self.coordinates, with one x, y row per atom in the order
+        of the returned dict.
         '''
-        # wrap all atoms and supply coordinates
-        wrapped_atoms = {}
+        records = []
+        coordinates = []
 
         for ra in self.tkmol.iterateAtoms():
             idx = ra.index()
@@ -350,6 +356,25 @@ class Molecule:
             neighbors = [na.index() for na in ra.iterateNeighbors()]
 
             x, y, _z = ra.xyz()
+            coordinates.append((x, y))
+
+            records.append(
+                (idx, element, hydrogens, charge, radical, neighbors))
+
+        self.coordinates = numpy.array(coordinates, dtype=float)
+        self.coordinates.shape = (len(records), 2)
+
+        # now it's time to flip and flop the coordinates
+        if self.options.flip_horizontal:
+            self.coordinates[:, 0] *= -1
+        if self.options.flip_vertical:
+            self.coordinates[:, 1] *= -1
+
+        # wrap all atoms and supply coordinates
+        wrapped_atoms = {}
+
+        for record, (x, y) in zip(records, self.coordinates.tolist()):
+            idx, element, hydrogens, charge, radical, neighbors = record
 
             wrapped_atoms[idx] = Atom(self.options,
                                       idx,
@@ -362,13 +387,21 @@ class Molecule:
 
         return wrapped_atoms
 
+    def atom_rows(self):
+        '''
+        map atom indexes to their rows in self.coordinates
+        '''
+        return {idx: row for row, idx in enumerate(self.atoms)}
+
     def parseBonds(self):
         '''
         read some bond attributes
         '''
-        bonds = {}        # dictionary with bond objects, both orientations
+        bonds = BondMap()  # bond objects, looked up in either orientation
         atom_pairs = []   # atom index pairs only, unique
 
+        records = []
+
         for bond in self.tkmol.iterateBonds():
             # start, end, bond_type, stereo = numbers
             start = bond.source().index()
@@ -378,23 +411,37 @@ class Molecule:
             bond_type = bond.bondOrder()
             stereo = bond.bondStereo()
 
+            records.append((start, end, bond_type, stereo))
+
+        # measure all bonds in one go
+        rows = self.atom_rows()
+        lengths, angles = geometry.bond_geometry(
+            self.coordinates,
+            [rows[record[0]] for record in records],
+            [rows[record[1]] for record in records])
+
+        dimensions = zip(lengths.tolist(), angles.tolist())
+
+        for (start, end, bond_type, stereo), dims in zip(records, dimensions):
             start_atom = self.atoms[start]
             end_atom = self.atoms[end]
 
-            bond = Bond(self.options, start_atom, end_atom, bond_type, stereo)
+            bond = Bond(self.options, start_atom, end_atom, bond_type, stereo,
+                        dimensions=dims)
 
-            # we store both orientations of the bond, since we don't know yet
-            # which way it will be used
-            bonds[(start, end)] = bond
-            bonds[(end, start)] = bond.invert()
-
-            atom_pairs.append((start, end))
+            # we don't know yet which way the bond will be used; the
+            # other orientation is made when it is first looked up
+            pair = (start, end)
+            bonds[pair] = bond
+            atom_pairs.append(pair)
 
         return bonds, atom_pairs
 
-    def parseTree(self, start_atom, end_atom):
+    def _treeBond(self, start_atom, end_atom):
         '''
-        recurse over atoms in molecule to create a tree of bonds
+        helper for parseTree: flag the bond from start_atom to end_atom
+        and its end atom as known. Returns the bond, or None if it is
+        already in the tree, and whether to descend from its end atom.
         '''
         end_idx = end_atom.idx
 
@@ -405,11 +452,12 @@ class Molecule:
         else:
             start_idx = start_atom.idx
 
-            # guard against reentrant bonds. Can those even still happen?
-            # apparently they can, even if I don't really understand how.
-            if ((start_idx, end_idx) in self.seen_bonds
-                    or (end_idx, start_idx) in self.seen_bonds):
-                return None
+            # guard against reentrant bonds, i.e. ring bonds that were
+            # already added from their other end. Each atom is only
+            # descended from once, so the bond can't be known in this
+            # orientation.
+            if (end_idx, start_idx) in self.seen_bonds:
+                return None, False
 
             # if we get here, the bond is not in the tree yet
             bond = self.bonds[(start_idx, end_idx)]
@@ -421,7 +469,7 @@ class Molecule:
             # with phantom atoms
             if end_idx in self.seen_atoms:
                 bond.to_phantom = True
-                return bond
+                return bond, False
 
         # flag end atom as known
         self.seen_atoms.add(end_idx)
@@ -429,19 +477,47 @@ class Molecule:
         if end_atom is self.exit_atom:
             self.exit_bond = bond
 
-        # recurse over the neighbors of the end atom
-        for ni in end_atom.neighbors:
-            if start_atom and ni == start_idx:  # don't recurse backwards
-                continue
+        return bond, True
+
+    def parseTree(self, start_atom, end_atom):
+        '''
+        walk depth first over atoms in molecule to create a tree of
+        bonds. The walk keeps its own stack, so that the size of the
+        molecule is not limited by the recursion limit.
+        '''
+        root, _descend = self._treeBond(start_atom, end_atom)
 
-            next_atom = self.atoms[ni]
-            next_bond = self.parseTree(end_atom, next_atom)
+        if start_atom is None:
+            start_idx = None
+        else:
+            start_idx = start_atom.idx
+
+        # bond, its end atom, the atom it came from, neighbors left
+        stack = [(root, end_atom, start_idx, iter(end_atom.neighbors))]
 
-            if next_bond is not None:
-                next_bond.parent = bond
-                bond.descendants.append(next_bond)
+        while stack:
+            bond, atom, from_idx, neighbors = stack[-1]
 
-        return bond
+            for ni in neighbors:
+                if ni == from_idx:  # don't walk backwards
+                    continue
+
+                next_atom = self.atoms[ni]
+                next_bond, descend = self._treeBond(atom, next_atom)
+
+                if next_bond is not None:
+                    next_bond.parent = bond
+                    bond.descendants.append(next_bond)
+
+                    if descend:
+                        stack.append((next_bond, next_atom, atom.idx,
+                                      iter(next_atom.neighbors)))
+                        break
+            else:
+                # all neighbors done
+                stack.pop()
+
+        return root
 
     def _getBond(self, tkbond):
         '''
@@ -457,7 +533,7 @@ class Molecule:
         # the bond must be going the other way ...
         return self.bonds[(end_idx, start_idx)]
 
-    def aromatizeRing(self, ring, center_x, center_y):
+    def aromatizeRing(self, ring, center_positions):
         '''
         render a ring that is aromatic and is a regular polygon
         '''
@@ -472,7 +548,7 @@ class Molecule:
         # so we'll just use the last one from the loop
         atom = bond.end_atom
 
-        outer_r, angle = compare_positions(atom.x, atom.y, center_x, center_y)
+        outer_r, angle = center_positions[atom.idx]
         # angle is based on raw coordinates - adjust for user-set rotation
         angle += self.options.rotate
 
@@ -485,25 +561,23 @@ class Molecule:
 
         arb = AromaticRingBond(self.options, bond, angle, outer_r, inner_r)
         bond.descendants.append(arb)
+        self.tree_index = None
 
-    def annotateRing(self, ring, is_aromatic):
+    def annotateRing(self, ring, is_aromatic, center_positions):
         '''
-        determine center, symmetry and aromatic character of ring
+        determine symmetry and aromatic character of ring
         I wonder if indigo would tell us directly about these ...
 
         annotate double bonds in rings, or alternatively decorate
-        ring with aromatic circle.
+        ring with aromatic circle. center_positions maps each ring
+        atom's index to its distance and angle to the ring center.
         '''
-        atoms = set()
         bond_lengths = []
         bonds = []
 
         for tkbond in ring.iterateBonds():
             bond = self._getBond(tkbond)
             bonds.append(bond)
-
-            atoms.add(self.atoms[bond.start_atom.idx])
-            atoms.add(self.atoms[bond.end_atom.idx])
             bond_lengths.append(bond.length)
 
         if len(bonds) > 8:  # large rings may foul things up, so we skip them.
@@ -512,21 +586,11 @@ class Molecule:
         bl_max = max(bond_lengths)
         bl_spread = (bl_max - min(bond_lengths)) / bl_max
 
-        # determine ring center
-        center_x = sum([atom.x for atom in atoms]) / len(atoms)
-        center_y = sum([atom.y for atom in atoms]) / len(atoms)
-
-        # compare distances from center. Also remember atoms and bond
-        # angles; if the ring ends up being aromatized, we flag those
-        # angles as occupied (by the fancy circle inside the ring).
-        atom_angles = []
-        center_distances = []
-
-        for atom in atoms:
-            length, angle = compare_positions(
-                atom.x, atom.y, center_x, center_y)
-            center_distances.append(length)
-            atom_angles.append((atom, angle))
+        # compare distances from center. If the ring ends up being
+        # aromatized, we flag the atoms' angles to the center as
+        # occupied (by the fancy circle inside the ring).
+        center_distances = [
+            distance for distance, _angle in center_positions.values()]
 
         cd_max = max(center_distances)
         cd_spread = (cd_max - min(center_distances)) / cd_max
@@ -536,17 +600,33 @@ class Molecule:
 
         if is_aromatic and is_symmetric and self.options.aromatic_circles:
             # ring meets all requirements to be displayed with circle inside
-            self.aromatizeRing(ring, center_x, center_y)
+            self.aromatizeRing(ring, center_positions)
 
             # flag bond angles as occupied
-            for atom, angle in atom_angles:
-                atom.bond_angles.append(angle)
+            for idx, (_distance, angle) in center_positions.items():
+                self.atoms[idx].bond_angles.append(angle)
 
         else:
             # flag orientation individual bonds - will influence
             # rendering of double bonds
             for bond in bonds:
-                bond.is_clockwise(center_x, center_y)
+                _distance, angle = center_positions[bond.end_atom.idx]
+                bond.is_clockwise(angle)
+
+    def _ringAtoms(self, ring):
+        '''
+        helper for annotateRings: the indexes of the atoms in a
+        toolkit ring, in the order the ring's bonds name them
+        '''
+        atoms = []
+
+        for tkbond in ring.iterateBonds():
+            for idx in (tkbond.source().index(),
+                        tkbond.destination().index()):
+                if idx not in atoms:
+                    atoms.append(idx)
+
+        return atoms
 
     def annotateRings(self):
         '''
@@ -565,32 +645,54 @@ class Molecule:
             all_rings.append((is_aromatic, ring))
 
         # prefer aromatic rings to nonaromatic ones, so that double bonds on
-        # fused rings go preferably into aromatic rings
-        all_rings.sort()
+        # fused rings go preferably into aromatic rings. Only compare the
+        # flags; toolkit rings can't be ordered.
+        all_rings.sort(key=lambda entry: entry[0])
+
+        # measure the distances and angles from all ring atoms to
+        # their ring centers in one go
+        rows = self.atom_rows()
+        ring_atoms = [self._ringAtoms(ring) for _, ring in all_rings]
+        ring_geometry = geometry.ring_geometry(
+            self.coordinates,
+            [[rows[idx] for idx in atoms] for atoms in ring_atoms])
+
+        rings = zip(all_rings, ring_atoms, ring_geometry)
 
-        for is_aromatic, ring in reversed(all_rings):
-            self.annotateRing(ring, is_aromatic)
+        for (is_aromatic, ring), atoms, measured in reversed(list(rings)):
+            _center_x, _center_y, distances, angles = measured
+            center_positions = dict(zip(atoms, zip(distances, angles)))
+
+            self.annotateRing(ring, is_aromatic, center_positions)
 
     def scaleBonds(self):
         '''
         scale bonds according to user options
         '''
+        bonds = self.treebonds()
+        lengths = numpy.array([bond.length for bond in bonds], dtype=float)
+
         if self.options.bond_scale == 'keep':
             pass
 
         elif self.options.bond_scale == 'normalize':
-            lengths = [bond.length for bond in self.treebonds()]
-            lengths = [round(l, self.options.bond_round) for l in lengths]
-            lengths = collections.Counter(lengths)
+            # Python's round, not numpy's, which may round the other
+            # way and so pick a different most common length
+            rounded = [round(l, self.options.bond_round)
+                       for l in lengths.tolist()]
+            rounded = collections.Counter(rounded)
             self.bond_scale = \
-                self.options.bond_stretch / lengths.most_common()
+                self.options.bond_stretch / rounded.most_common()[0][0]
 
         elif self.options.bond_scale == 'scale':
             self.bond_scale = self.options.bond_stretch
 
-        for bond in self.treebonds():
-            bond.length = self.bond_scale * bond.length
+        lengths *= self.bond_scale
 
+        for bond, length in zip(bonds, lengths.tolist()):
+            bond.length = length
+
+    @metrics.timed('render')
     def render(self):
         '''
         render molecule to chemfig
@@ -600,6 +702,33 @@ class Molecule:
 
         return output
 
+    def rerender(self, options):
+        '''
+        render the molecule again with new presentation options,
+        reusing the parsed tree. The structure options must be the
+        ones the molecule was built with. Rendering modifies the
+        molecule, so callers sharing it between threads must lock.
+        '''
+        if structure_options(options) != structure_options(self.options):
+            raise ValueError('structure options differ, '
+                             'the molecule must be built anew')
+
+        self.options = options
+
+        for atom in self.atoms.values():
+            atom.options = options
+
+        # link bonds, cross bond copies and aromatic circles are
+        # only found in the tree, which is also where fancy bonds
+        # were decorated
+        for bond in self.bonds.values():
+            bond.options = options
+        for bond in self.treebonds(root=True):
+            bond.options = options
+            bond.undecorate()
+
+        self._rendered = self.render()
+
     def render_user(self):
         '''
         returns code formatted according to user options
@@ -611,48 +740,68 @@ class Molecule:
         returns code formatted for server-side PDF generation
         '''
         # override some options
-        params = dict(self.options)
-        params['submol_name'] = None
-        # params['terse'] = False  # why?
-        params['chemfig_command'] = True
+        params = self.options.replace(
+            submol_name=None,
+            # terse=False,  # why?
+            chemfig_command=True)
 
         return cfm.format_output(params, self._rendered)
 
-    def _renderBranches(self, output, level, bonds):
+    def _renderBranches(self, level, bonds):
         '''
-        Render a list of branching bonds indented and inside
-        enclosing brackets.
+        work items for _render that render a list of branching
+        bonds indented and inside enclosing brackets.
         '''
         branch_indent = self.options.indent
+        items = []
 
         for bond in bonds:
             padding = level * branch_indent + cfm.BOND_CODE_WIDTH
-            output.append("(".rjust(padding))
-            self._render(output, bond, level)
-            output.append(")".rjust(padding))
+            items.append(("(".rjust(padding), level))
+            items.append((bond, level))
+            items.append((")".rjust(padding), level))
+
+        return items
 
     def _render(self, output, bond, level):
         '''
-        Recursively render the molecule.
+        render the molecule from bond downwards. Work items - bonds
+        still to render, or brackets - are kept on a stack rather
+        than in recursive calls.
         '''
-        output.append(bond.render(level))
-        branches = bond.descendants
+        stack = [(bond, level)]
 
-        if bond is self.exit_bond:
-            # wrap all downstream bonds in branch
-            self._renderBranches(output, level+1, branches)
+        while stack:
+            item, level = stack.pop()
+
+            if isinstance(item, str):
+                output.append(item)
+                continue
+
+            output.append(item.render(level))
+            # copy, so that rendering leaves the tree intact
+            branches = list(item.descendants)
+
+            if item is self.exit_bond:
+                # wrap all downstream bonds in branch
+                items = self._renderBranches(level + 1, branches)
+
+            elif branches:
+                # prioritize bonds on the trunk from entry to exit
+                for i, branch in enumerate(branches):
+                    if branch.is_trunk:
+                        first = branches.pop(i)
+                        break
+                else:
+                    first = branches.pop(0)
+
+                items = self._renderBranches(level + 1, branches)
+                items.append((first, level))
 
-        elif branches:
-            # prioritize bonds on the trunk from entry to exit
-            for i, branch in enumerate(branches):
-                if branch.is_trunk:
-                    first = branches.pop(i)
-                    break
             else:
-                first = branches.pop(0)
+                continue
 
-            self._renderBranches(output, level + 1, branches)
-            self._render(output, first, level)
+            stack.extend(reversed(items))
 
     def dimensions(self):
         '''
@@ -664,30 +813,19 @@ class Molecule:
         It is only used for server side PDF generation,
         but maybe someone will have another use for it.
         '''
-        minx = maxx = miny = maxy = None
-
         alpha = self.options.rotate
         alpha *= math.pi/180
 
         sinalpha = math.sin(alpha)
         cosalpha = math.cos(alpha)
 
-        for atom in self.atoms.values():
-            x, y = atom.x, atom.y
-
-            xt = x * cosalpha - y * sinalpha
-            yt = x * sinalpha + y * cosalpha
-
-            if minx is None or xt < minx:
-                minx = xt
-            if maxx is None or xt > maxx:
-                maxx = xt
-            if miny is None or yt < miny:
-                miny = yt
-            if maxy is None or yt > maxy:
-                maxy = yt
-
-        xsize = (maxx - minx) * self.bond_scale
-        ysize = (maxy - miny) * self.bond_scale
+        x = self.coordinates[:, 0]
+        y = self.coordinates[:, 1]
+
+        xt = x * cosalpha - y * sinalpha
+        yt = x * sinalpha + y * cosalpha
+
+        xsize = float(xt.max() - xt.min()) * self.bond_scale
+        ysize = float(yt.max() - yt.min()) * self.bond_scale
 
         return xsize, ysize
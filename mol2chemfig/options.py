@@ -1,14 +1,234 @@
 '''
-option declarations. The options will be used to update the
-settings dict in module common.
+option declarations: the Options of a conversion, and the command
+line parser that fills them in for the command line tools.
 '''
 import argparse
+import collections.abc
+import re
+
 import mol2chemfig.common
+from mol2chemfig.common import MCFError
+
+# options that shape the parsed molecule tree: changing any of these
+# means building a new Molecule
+STRUCTURE_OPTIONS = (
+    'strict', 'recalculate_coordinates', 'hydrogens',
+    'rotate', 'flip_horizontal', 'flip_vertical', 'aromatic_circles',
+    'fancy_bonds', 'markers', 'bond_scale', 'bond_stretch', 'bond_round',
+    'entry_atom', 'exit_atom', 'cross_bond', 'quadrant_tolerance')
+
+# options that are only read while rendering the tree to chemfig code,
+# and can be changed with Molecule.rerender
+PRESENTATION_OPTIONS = (
+    'terse', 'indent', 'submol_name', 'chemfig_command',
+    'relative_angles', 'angle_round', 'atom_numbers', 'show_carbons',
+    'show_methyls')
+
+
+def structure_options(options):
+    '''
+    the values of the structure options, for comparison
+    '''
+    return tuple(getattr(options, name, None) for name in STRUCTURE_OPTIONS)
+
+
+# the command line switches of on/off options, which the web form's
+# checkboxes send along
+SWITCHES = {
+    'z': 'terse',
+    'r': 'strict',
+    'u': 'recalculate_coordinates',
+    'v': 'relative_angles',
+    'p': 'flip_horizontal',
+    'q': 'flip_vertical',
+    'c': 'show_carbons',
+    'm': 'show_methyls',
+    'o': 'aromatic_circles',
+    'f': 'fancy_bonds',
+    'n': 'atom_numbers',
+    'w': 'chemfig_command',
+}
+
+# names end up in chemfig code, and thus in pdflatex input
+NAME = re.compile(r'[A-Za-z0-9]+')
+
+
+def boolean(value):
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value in ('1', 'true', 'yes', 'on'):
+            return True
+        if value in ('', '0', 'false', 'no', 'off'):
+            return False
+        raise ValueError(value)
+    if value not in (None, False, True, 0, 1):
+        raise ValueError(value)
+    return bool(value)
+
+
+def number(kind, minimum=None):
+    def convert(value):
+        if isinstance(value, bool):
+            raise ValueError(value)
+        value = kind(value)
+        if minimum is not None and value < minimum:
+            raise ValueError(value)
+        return value
+    return convert
+
+
+def choice(*choices):
+    def convert(value):
+        if value not in choices:
+            raise ValueError(value)
+        return value
+    return convert
+
+
+def optional(convert):
+    def convert_optional(value):
+        if value is None or value == '':
+            return None
+        return convert(value)
+    return convert_optional
+
+
+def name(value):
+    if not isinstance(value, str) or not NAME.fullmatch(value):
+        raise ValueError(value)
+    return value
+
+
+def cross_bonds(value):
+    '''
+    "4-8,12-13" or [(4, 8), (12, 13)] -> ((4, 8), (12, 13))
+    '''
+    if isinstance(value, str):
+        value = [pair.split('-') for pair in value.split(',')]
+
+    bonds = []
+    for start, end in value:
+        bonds.append((number(int, 1)(start), number(int, 1)(end)))
+    return tuple(bonds)
+
+
+# name -> (default, conversion); the defaults are the command line's
+FIELDS = collections.OrderedDict([
+    ('terse', (False, boolean)),
+    ('strict', (True, boolean)),
+    ('indent', (4, number(int, 0))),
+    ('recalculate_coordinates', (True, boolean)),
+    ('rotate', (0.0, number(float))),
+    ('relative_angles', (False, boolean)),
+    ('flip_horizontal', (False, boolean)),
+    ('flip_vertical', (False, boolean)),
+    ('show_carbons', (False, boolean)),
+    ('show_methyls', (False, boolean)),
+    ('hydrogens', ('keep', choice('keep', 'add', 'delete'))),
+    ('aromatic_circles', (False, boolean)),
+    ('fancy_bonds', (False, boolean)),
+    ('markers', (None, optional(name))),
+    ('atom_numbers', (False, boolean)),
+    ('bond_scale', ('normalize', choice('normalize', 'keep', 'scale'))),
+    ('bond_stretch', (1.0, number(float))),
+    ('chemfig_command', (False, boolean)),
+    ('submol_name', (None, optional(name))),
+    ('entry_atom', (None, optional(number(int, 1)))),
+    ('exit_atom', (None, optional(number(int, 1)))),
+    ('cross_bond', (None, optional(cross_bonds))),
+    ('bond_round', (3, number(int, 0))),
+    ('angle_round', (1, number(int, 0))),
+    ('quadrant_tolerance', (0.1, number(float, 0))),
+])
+
+
+class Options(collections.abc.Mapping):
+    '''
+    the settings of one conversion. Values are checked and normalized
+    on construction; unknown names or bad values raise MCFError.
+    Options are immutable and hashable, and their repr is stable
+    across processes, so it can serve as a cache key. They can also be
+    read like a dict.
+    '''
+    __slots__ = tuple(FIELDS)
+
+    def __init__(self, **values):
+        unknown = set(values) - set(FIELDS)
+        if unknown:
+            raise MCFError('Unknown option %s' % ', '.join(sorted(unknown)))
+
+        for field, (default, convert) in FIELDS.items():
+            value = values.get(field, default)
+            try:
+                value = convert(value)
+            except (ValueError, TypeError):
+                raise MCFError('Invalid value for option %s: %r'
+                               % (field, value))
+            object.__setattr__(self, field, value)
+
+    @classmethod
+    def from_dict(cls, values):
+        '''
+        Options from a dict; names may be spelt with dashes, as on
+        the command line
+        '''
+        return cls(**{key.replace('-', '_'): value
+                      for key, value in values.items()})
+
+    @classmethod
+    def from_namespace(cls, args):
+        '''
+        Options from parsed command line arguments
+        '''
+        return cls(**{field: getattr(args, field) for field in FIELDS
+                      if getattr(args, field, None) is not None})
+
+    def replace(self, **changes):
+        '''
+        a copy with some values changed
+        '''
+        return type(self)(**dict(self, **changes))
+
+    def __setattr__(self, field, value):
+        raise AttributeError('Options are immutable')
+
+    def __delattr__(self, field):
+        raise AttributeError('Options are immutable')
+
+    def __getitem__(self, field):
+        if field not in FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def _values(self):
+        return tuple(getattr(self, field) for field in FIELDS)
+
+    def __eq__(self, other):
+        if isinstance(other, Options):
+            return self._values() == other._values()
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self._values())
+
+    def __repr__(self):
+        return 'Options(%s)' % ', '.join(
+            '%s=%r' % (field, getattr(self, field)) for field in FIELDS)
+
+    def __reduce__(self):
+        return type(self).from_dict, (dict(self),)
 
 
 def getParser():
     '''
-    make sure the parser is created anew on each request
+    the parser of the command line tools, which turn the parsed
+    arguments into Options with Options.from_namespace
     '''
     parser = argparse.ArgumentParser(
         description=mol2chemfig.common.HEADER,
@@ -16,6 +236,7 @@ def getParser():
 
     parser.add_argument(
         "--i", "--input",
+        dest="input",
         default="file",
         type=str,
         choices="direct file pubchem".split(),
@@ -27,12 +248,14 @@ def getParser():
 
     parser.add_argument(
         "--z", "--terse",
+        dest="terse",
         type=bool,
         default=False,
         help="Remove all whitespace and comments from the output.")
 
     parser.add_argument(
         "--r", "--strict",
+        dest="strict",
         default=True,
         type=bool,
         help="""Abide by Indigo's chemical structure validation.
@@ -43,6 +266,7 @@ def getParser():
 
     parser.add_argument(
         "--d", "--indent",
+        dest="indent",
         default=4,
         type=int,
         help="""Number of spaces to use for indenting molecule
@@ -52,6 +276,7 @@ def getParser():
 
     parser.add_argument(
         "--u", "--recalculate-coordinates",
+        dest="recalculate_coordinates",
         default=True,
         type=bool,
         help="""Discard existing coordinate and calculate new
@@ -61,44 +286,49 @@ def getParser():
     # rotate?!!
     parser.add_argument(
         "--a", "--angle",
+        dest="rotate",
         type=float,
         default=0.0,
         help="Rotate molecule counterclockwise by this angle")
 
     parser.add_argument(
         "--v", "--relative-angles",
+        dest="relative_angles",
         type=bool,
         default=False,
         help="Use relative bond angles")
 
-    # key="flip_horizontal"  
     parser.add_argument(
         "--p", "--flip",
+        dest="flip_horizontal",
         type=bool,
         default=False,
         help="Flip the structure horizontally")
 
-    # key="flip_vertical"
     parser.add_argument(
         "--q", "--flop",
+        dest="flip_vertical",
         type=bool,
         default=False,
         help="Flip the structure vertically")
 
     parser.add_argument(
         "--c", "--show-carbons",
+        dest="show_carbons",
         type=bool,
         default=False,
         help="Show element symbol for carbon atoms")
 
     parser.add_argument(
         "--m", "--show-methyls",
+        dest="show_methyls",
         type=bool,
         help='''Show element symbols for methyl groups
                      (implied if show-carbons is True)''')
 
     parser.add_argument(
         "--y", "--hydrogens",
+        dest="hydrogens",
         default="keep",
         choices="keep add delete".split(),
         help="""How to deal with explicit hydrogen atoms.
@@ -109,18 +339,21 @@ def getParser():
 
     parser.add_argument(
         "--o", "--aromatic-circles",
+        dest="aromatic_circles",
         type=bool,
         default=False,
         help="Draw circles instead of double bonds inside aromatic rings")
 
     parser.add_argument(
         "--f", "--fancy-bonds",
+        dest="fancy_bonds",
         type=bool,
         default=False,
         help="Draw fancier double and triple bonds")
 
     parser.add_argument(
         "--g", "--markers",
+        dest="markers",
         type=str,
         help="""Give each atom and each bond a unique
                 marker that can be used for attaching
@@ -130,6 +363,7 @@ def getParser():
 
     parser.add_argument(
         "--n", "--atom-numbers",
+        dest="atom_numbers",
         type=bool,
         default=False,
         help="""Show the molfile number of each atom next to it.
@@ -138,6 +372,7 @@ def getParser():
 
     parser.add_argument(
         "--s", "--bond-scale",
+        dest="bond_scale",
         type=str,
         default="normalize",
         choices="normalize keep scale".split(),
@@ -146,32 +381,36 @@ def getParser():
 
     parser.add_argument(
         "--t", "--bond-stretch",
+        dest="bond_stretch",
         type=float,
         default=1.0,
         help="""Used as scaling factor (with --bond-scale=scale)
                 or average (with --bond-scale=normalize) for bond
                 lengths""")
 
-    # key="chemfig_command",
     parser.add_argument(
         "--w", "--wrap-chemfig",
+        dest="chemfig_command",
         type=bool,
         help=r"Wrap generated code into \chemfig{...} command")
 
     parser.add_argument(
         "--l", "--submol-name",
+        dest="submol_name",
         type=str,
         help=r"""If a name is given, wrap generated code into
                       chemfig \definesubmol{name}{...} command""")
 
     parser.add_argument(
         "--e", "--entry-atom",
+        dest="entry_atom",
         default=None,
         help="""Number of first atom to be rendered. Relevant only
                      if generated code is to be used as sub-molecule""")
 
     parser.add_argument(
         "--x", "--exit-atom",
+        dest="exit_atom",
         default=None,
         help="""Number of last atom to be rendered. Relevant only
                      if generated code is to be used as sub-molecule""")
@@ -179,6 +418,7 @@ def getParser():
     # NOTE(meawoppl) - likely broken as ported
     parser.add_argument(
         "--k", "--cross-bond",
+        dest="cross_bond",
         default=None,
         help="""Specify bonds that should be drawn on top of others
                 they cross over. Give the start and the end atoms.
@@ -189,8 +429,9 @@ def getParser():
         "target",
         metavar="TARGET",
         type=str,
-        required=True,
-        help="A filename or smiles input based on --i")
+        nargs="?",
+        help="""A filename or smiles input based on --i. May be
+                omitted if the input is supplied by the caller""")
 
     # NOTE(meawoppl) - PORTED FROM HARDCODED.  Don't reccomend changing
     parser.add_argument(
@@ -2,89 +2,377 @@
 generate a pdf from a parsed mol2chemfig molecule.
 return the result in a string.
 '''
+import asyncio
+import hashlib
 import os
 import subprocess
 import tempfile
+import threading
+
+from mol2chemfig import metrics
+from mol2chemfig.latexpool import LatexPool, PoolUnavailable
 
 MOLQ_TEX = 'molecule.tex'
 MOLQ_PDF = 'molecule.pdf'
 
-THIS_DIR, _ = os.path.split(os.path.dirname(os.path.abspath(__file__)))
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
 
 STYLE_FILE_NAME = 'mol2chemfig.sty'
+ATOMSEP = 16        # chemfig bond length in points
+PAGE_PADDING = 28   # room around the molecule for atom labels, in points
+LATEX_TIMEOUT = 30  # seconds, for compilations outside of the pool
+
 with open(os.path.join(THIS_DIR, STYLE_FILE_NAME)) as f:
     STYLE_FILE_CONTENTS = f.read()
 
+# warm pdflatex workers, if started; see start_pool
+POOL = None
+
+# where format files with the precompiled preamble are kept
+FORMAT_DIR = os.environ.get(
+    'MOL2CHEMFIG_FORMAT_DIR',
+    os.path.join(tempfile.gettempdir(), 'mol2chemfig-formats'))
+
+# name and directory of the format file, once built; see build_format
+FORMAT = None
+
+# exercises atom labels, charges and bonds, to load all fonts
+WARM_UP_CHEMFIG = r'\chemfig{H_3N^{\mcfplus}-[:30]C(=[:90]O)-[:-30]O^{\mcfminus}}'
+
+
+class CompileCancelled(Exception):
+    '''
+    the compilation was cancelled through its ticket
+    '''
+    pass
+
+
+class CompileTicket:
+    '''
+    handle for cancelling a compilation from another thread. The
+    compiling code attaches its pdflatex process, which cancel kills.
+    '''
+    def __init__(self):
+        self.cancelled = False
+        self._process = None
+        self._lock = threading.Lock()
+
+    def attach(self, process):
+        with self._lock:
+            self._process = process
+            if self.cancelled:
+                process.kill()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            if self._process is not None and self._process.poll() is None:
+                self._process.kill()
+
+    def check(self):
+        if self.cancelled:
+            raise CompileCancelled()
+
+
+def _write_files(tempdir, files):
+    for name, contents in files.items():
+        with open(os.path.join(tempdir, name), "w") as f:
+            f.write(contents)
+
+
+def _read_pdf(tempdir, source, latex_call, returncode, output):
+    if returncode != 0:
+        print("Failed Running Latex: " + ' '.join(latex_call))
+        print(output)
+        raise subprocess.CalledProcessError(returncode, latex_call, output)
+
+    target = source.replace(".tex", ".pdf")
+    with open(os.path.join(tempdir, target), 'rb') as f:
+        return f.read()
 
-class DirCtx:
-    def __init__(self, todir: str):
-        self._to = todir
 
-    def __enter__(self):
-        self._previous = os.getcwd()
-        os.chdir(self._to)
+def latex_options():
+    '''
+    extra pdflatex arguments, and the environment, needed to compile
+    against the format file, if there is one
+    '''
+    if FORMAT is None:
+        return (), None
 
-    def __exit__(self, *args):
-        os.chdir(self._previous)
+    name, directory = FORMAT
+    # the trailing separator keeps the default search path
+    return ('-fmt=' + name,), dict(os.environ,
+                                   TEXFORMATS=directory + os.pathsep)
 
 
-def call_latex(source: str, files={}) -> bytes:
+def document_preamble():
+    '''
+    what goes before the body of a document: the whole preamble, or
+    only \\begin{document} if the rest is in the format file
+    '''
+    if FORMAT is None:
+        return preamble
+    return begin_document
+
+
+def build_format(directory=FORMAT_DIR, timeout=120):
+    '''
+    dump the fixed part of the preamble into a format file, which
+    pdflatex loads much faster than it reads the packages, and
+    compile against it from now on. The file name carries a hash of
+    the preamble, the style file and the pdflatex version, so that
+    a format is rebuilt whenever any of these change.
+    '''
+    global FORMAT
+
+    version = subprocess.run(
+        ("pdflatex", "--version"), stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE, check=True).stdout.split(b'\n')[0]
+
+    digest = hashlib.sha256(version)
+    digest.update(format_preamble.encode('utf-8'))
+    digest.update(STYLE_FILE_CONTENTS.encode('utf-8'))
+    name = 'mol2chemfig-' + digest.hexdigest()[:16]
+    path = os.path.join(directory, name + '.fmt')
+
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+
+        # build next to the target, so that it can be moved into place
+        # atomically while other processes may be looking for it
+        with tempfile.TemporaryDirectory(dir=directory) as tempdir:
+            _write_files(tempdir, {
+                STYLE_FILE_NAME: STYLE_FILE_CONTENTS,
+                'format.tex': format_preamble + '\\dump\n'})
+
+            format_call = ("pdflatex", "-ini", "-interaction=nonstopmode",
+                           "-jobname=" + name, "&pdflatex", "format.tex")
+            subprocess.run(
+                format_call, cwd=tempdir, stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                check=True, timeout=timeout)
+
+            os.replace(os.path.join(tempdir, name + '.fmt'), path)
+
+    FORMAT = (name, directory)
+    return path
+
+
+def call_latex(source: str, files={}, ticket=None,
+               timeout=LATEX_TIMEOUT) -> bytes:
     assert source in files
 
     with tempfile.TemporaryDirectory() as tempdir:
-        with DirCtx(tempdir):
-            for name, contents in files.items():
-                with open(name, "w") as f:
-                    f.write(contents)
+        _write_files(tempdir, files)
+
+        options, env = latex_options()
+
+        # run inside tempdir without chdir, which would affect all threads
+        latex_call = ("pdflatex", "-interaction=nonstopmode", *options, source)
+        process = subprocess.Popen(
+            latex_call, cwd=tempdir, env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+        if ticket is not None:
+            ticket.attach(process)
+
+        try:
+            output, _ = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            raise subprocess.CalledProcessError(
+                process.returncode, latex_call, b'timed out')
+
+        if process.returncode != 0 and ticket is not None:
+            ticket.check()
+
+        return _read_pdf(
+            tempdir, source, latex_call, process.returncode, output)
+
+
+async def call_latex_async(source: str, files={},
+                           timeout=LATEX_TIMEOUT) -> bytes:
+    '''
+    like call_latex, but without tying up a thread while pdflatex runs.
+    Cancelling the awaiting task kills pdflatex.
+    '''
+    assert source in files
 
-            latex_call = ("pdflatex" "-interaction=nonstopmode", source)
-            try:
-                subprocess.check_call(latex_call)
-            except subprocess.CalledProcessError as e:
-                print("Failed Running Latex: " + latex_call)
-                print(e.output)
-                raise
-            
-            target = source.replace(".tex", ".pdf")
-            with open(target, 'rb') as f:
-                return f.read()
-
-
-def pdfgen(mol):
     with tempfile.TemporaryDirectory() as tempdir:
-        chemfig = mol.render_server()
-        width, height = mol.dimensions()
+        _write_files(tempdir, files)
+
+        options, env = latex_options()
+
+        latex_call = ("pdflatex", "-interaction=nonstopmode", *options, source)
+        process = await asyncio.create_subprocess_exec(
+            *latex_call, cwd=tempdir, env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+        try:
+            output, _ = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise subprocess.CalledProcessError(
+                process.returncode, latex_call, b'timed out')
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            raise
+
+        return _read_pdf(
+            tempdir, source, latex_call, process.returncode, output)
+
+
+def start_pool(size=2, timeout=30, warm_up=True):
+    '''
+    start warm pdflatex workers that render_pdf will use from now on.
+    The warm-up compile loads fonts and primes the page cache. If a
+    format file is wanted, build_format must be called first.
+    '''
+    global POOL
+
+    if POOL is not None:
+        POOL.close()
+
+    options, env = latex_options()
+
+    POOL = LatexPool(
+        document_preamble(),
+        {STYLE_FILE_NAME: STYLE_FILE_CONTENTS},
+        size=size,
+        timeout=timeout,
+        options=options,
+        env=env)
+
+    if warm_up:
+        try:
+            render_pdf(WARM_UP_CHEMFIG, 1, 1)
+        except (OSError, subprocess.SubprocessError):
+            pass    # the workers are restarted, or the pool gave up
+
+    return POOL
+
+
+def page_size(width, height, atomsep=ATOMSEP):
+    '''
+    convert molecule dimensions from Molecule.dimensions, which are
+    in units of the chemfig bond length, into a page size in points.
+    '''
+    return (round(width * atomsep) + PAGE_PADDING,
+            round(height * atomsep) + PAGE_PADDING)
 
-        atomsep = 16
 
-        latex = latex_template.format(
-            width=width, height=height, atomsep=atomsep, chemfig=chemfig)
+def page_body(chemfig, width, height):
+    '''
+    the document body that puts chemfig code on a page of its own size
+    '''
+    width, height = page_size(width, height)
+    return body_template % dict(width=width, height=height, chemfig=chemfig)
+
+
+@metrics.timed('latex')
+def render_pdf(chemfig: str, width: float, height: float,
+               ticket=None) -> bytes:
+    '''
+    compile server-side chemfig code, as returned by
+    Molecule.render_server, into a PDF. Molecules that are
+    already rendered can thus skip the whole parsing stage.
+
+    If a CompileTicket is given, cancelling it aborts the
+    compilation with CompileCancelled.
+    '''
+    if ticket is not None:
+        ticket.check()
+
+    body = page_body(chemfig, width, height)
+
+    try:
+        if POOL is not None:
+            try:
+                return POOL.compile(body, ticket)
+            except PoolUnavailable:
+                pass    # no worker came up in time; compile the slow way
 
         return call_latex(
             MOLQ_TEX,
-            files={STYLE_FILE_NAME: STYLE_FILE_CONTENTS, MOLQ_TEX: latex})
+            files={STYLE_FILE_NAME: STYLE_FILE_CONTENTS,
+                   MOLQ_TEX: document_preamble() + body},
+            ticket=ticket)
+
+    except subprocess.CalledProcessError:
+        metrics.count('latex_failure')
+        raise
+    except CompileCancelled:
+        raise
+    except Exception:
+        # e.g. pdflatex missing, or no room for its temporary files
+        metrics.count('pdf_error')
+        raise
+
 
+async def render_pdf_async(chemfig: str, width: float, height: float,
+                           timeout=LATEX_TIMEOUT) -> bytes:
+    '''
+    render_pdf for event loops. Always runs a fresh pdflatex, since
+    the warm workers of the pool are driven synchronously.
+    '''
+    body = page_body(chemfig, width, height)
 
-latex_template = r'''
+    with metrics.stage('latex'):
+        try:
+            return await call_latex_async(
+                MOLQ_TEX,
+                files={STYLE_FILE_NAME: STYLE_FILE_CONTENTS,
+                       MOLQ_TEX: document_preamble() + body},
+                timeout=timeout)
+
+        except subprocess.CalledProcessError:
+            metrics.count('latex_failure')
+            raise
+        except Exception:
+            metrics.count('pdf_error')
+            raise
+
+
+def pdfgen(mol) -> bytes:
+    width, height = mol.dimensions()
+    return render_pdf(mol.render_server(), width, height)
+
+
+# everything before \begin{document} is the same for all molecules,
+# and can thus be dumped into a format file
+format_preamble = r'''
 \documentclass{minimal}
 \usepackage{xcolor, mol2chemfig}
-\usepackage[margin=(margin)spt,papersize={{width}pt, {height}pt}]{geometry}
 
 \usepackage[helvet]{sfmath}
 \setcrambond{2.5pt}{0.4pt}{1.0pt}
 \setbondoffset{1pt}
 \setdoublesep{2pt}
-\setatomsep{{atomsep}pt}
+\setatomsep{%(atomsep)spt}
 \renewcommand{\printatom}[1]{\fontsize{8pt}{10pt}\selectfont{\ensuremath{\mathsf{#1}}}}
 
 \setlength{\parindent}{0pt}
 \setlength{\fboxsep}{0pt}
-\begin{document}
-\vspace*{\fill}
-\vspace{-8pt}
-\begin{center}
-{chemfig}
-\end{center}
-\vspace*{\fill}
+''' % dict(atomsep=ATOMSEP)
+
+begin_document = '\\begin{document}\n'
+
+preamble = format_preamble + begin_document
+
+# the page size is set here with pdftex primitives rather than in the
+# preamble, and the molecule is shipped out centered on it directly.
+body_template = r'''
+\pdfpagewidth=%(width)spt
+\pdfpageheight=%(height)spt
+\hoffset=-1in
+\voffset=-1in
+\shipout\vbox to \pdfpageheight{\vss\hbox to \pdfpagewidth{\hss
+%(chemfig)s%%
+\hss}\vss}
 \end{document}
 '''
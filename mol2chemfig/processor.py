@@ -4,6 +4,10 @@ import mol2chemfig.common
 import mol2chemfig.options
 import mol2chemfig.molecule
 
+from mol2chemfig import metrics
+
+from mol2chemfig.common import MCFError
+from mol2chemfig.options import Options
 from mol2chemfig.indigo import Indigo, IndigoException
 
 
@@ -11,48 +15,100 @@ class Processor:
     '''
     parses input and invokes backend, returns result
     '''
-    def __init__(self):
+    def __init__(self, data, options):
+        self.options = options
+
+        # Check to see if the input is pubchemId
+        try:
+            pubchem_id = int(data)
+            data = mol2chemfig.common.get_pubchem_sdf(pubchem_id)
+        except ValueError:
+            pubchem_id = None
+
+        self.data = data
+
+    @classmethod
+    def from_args(cls, rawargs=None, progname=None):
+        '''
+        a Processor for a command line. rawargs of None means sys.argv.
+        '''
         parser = mol2chemfig.options.getParser()
+        if progname is not None:
+            parser.prog = progname
 
-        # data obtained from the proper source go here
-        self.data_string = None
+        # plain whitespace splitting keeps backslashes in smiles intact
+        if rawargs is not None:
+            rawargs = rawargs.split()
+        args = parser.parse_args(rawargs)
 
-        # parse options and arguments
-        self.args = parser.parse_args()
+        # optional in the parser, since batch options come without it
+        if args.target is None:
+            raise MCFError('no input given')
 
-        if self.args.input == 'file':
-            with open(self.args.target) as f:
-                self.data = f.read()
+        if args.input == 'file':
+            with open(args.target) as f:
+                data = f.read()
         else:
-            self.data = self.args.target
+            data = args.target
 
-        # Check to see if the input is pubchemId
-        try:
-            pubchem_id = int(self.data)
-            self.data = mol2chemfig.common.get_pubchem_sdf(pubchem_id)
-        except ValueError:
-            pubchem_id = None
+        return cls(data, Options.from_namespace(args))
 
-    def get_mol(self):
+    @metrics.timed('load')
+    def load(self):
         '''
-        turn the input into a toolkit molecule according to user settings
+        turn the input into a toolkit molecule, before any processing
 
         indigo is supposed to read transparently, so we can do away with
         the format setting, basically. If it's numeric, we ask pubchem,
         if it isn't, we consider it a molecule.
         '''
-        tkmol = Indigo().loadMolecule(self.data)
+        return Indigo().loadMolecule(self.data)
 
-        if self.args.hydrogens == 'add':
-            tkmol.unfoldHydrogens()
-            tkmol.layout()  # needed to give coordinates to added Hs
+    def get_mol(self, tkmol=None):
+        '''
+        process the toolkit molecule according to user settings and
+        build the Molecule. A previously loaded toolkit molecule may
+        be passed in; it is copied, since processing modifies it.
+        '''
+        if tkmol is None:
+            tkmol = self.load()
+        else:
+            tkmol = tkmol.clone()
+
+        with metrics.stage('layout'):
+            if self.options.hydrogens == 'add':
+                tkmol.unfoldHydrogens()
+                tkmol.layout()  # needed to give coordinates to added Hs
 
-        elif self.args.hydrogens == 'delete':
-            tkmol.foldHydrogens()
+            elif self.options.hydrogens == 'delete':
+                tkmol.foldHydrogens()
 
-        if not tkmol.hasCoord() or self.args.recalculate_coordinates:
-            tkmol.layout()
+            if not tkmol.hasCoord() or self.options.recalculate_coordinates:
+                tkmol.layout()
 
-        mol = mol2chemfig.molecule.Molecule(self.args, tkmol)
+        mol = mol2chemfig.molecule.Molecule(self.options, tkmol)
 
         return mol
+
+
+def convert(data, options, tkmol=None):
+    '''
+    build the Molecule for input data - a smiles, a molblock or a
+    PubChem id - with the given Options. A toolkit molecule already
+    loaded from the data may be passed in, to save loading it again.
+    '''
+    return Processor(data, options).get_mol(tkmol)
+
+
+def process(rawargs=None, progname=None):
+    '''
+    convenience wrapper around Processor. Returns a tuple
+    (success, result), where result is either the parsed
+    molecule or an error message.
+    '''
+    try:
+        mol = Processor.from_args(rawargs, progname).get_mol()
+    except (MCFError, IndigoException) as e:
+        return False, str(e)
+
+    return True, mol
@@ -0,0 +1,497 @@
+'''
+PubChem lookups over PUG REST, with persistent connections, strict
+timeouts, retries and caching of both hits and misses. Lookups may
+instead be answered from a local mirror (see mirror.py), with the
+remote service as an optional fallback.
+'''
+import asyncio
+import collections
+import http.client
+import os
+import queue
+import random
+import ssl
+import threading
+import time
+import urllib.parse
+
+from mol2chemfig.mirror import PubChemMirror
+
+PUBCHEM_URL = os.environ.get(
+    'MOL2CHEMFIG_PUBCHEM_URL', 'https://pubchem.ncbi.nlm.nih.gov')
+
+# path of a local mirror; if set, PubChem itself is only asked
+# for what the mirror lacks when MOL2CHEMFIG_PUBCHEM_FALLBACK=1
+PUBCHEM_MIRROR = os.environ.get('MOL2CHEMFIG_PUBCHEM_MIRROR')
+PUBCHEM_FALLBACK = os.environ.get('MOL2CHEMFIG_PUBCHEM_FALLBACK') == '1'
+
+SDF_PATH = '/rest/pug/compound/cid/%s/SDF'
+SMILES_PATH = '/rest/pug/compound/name/%s/property/IsomericSMILES/TXT'
+
+# worth another try; PubChem answers 503 when it throttles us
+RETRY_STATUS = (500, 502, 503, 504)
+# the compound doesn't exist, or the query makes no sense
+MISS_STATUS = (400, 404)
+
+
+class PubChemError(Exception):
+    '''
+    PubChem could not be reached, or kept failing
+    '''
+    pass
+
+
+class ConnectionPool:
+    '''
+    keep-alive HTTP connections to one host, reused across requests
+    and threads. At most size idle connections are kept.
+    '''
+    def __init__(self, base_url, size=4, timeout=5.0):
+        url = urllib.parse.urlsplit(base_url)
+
+        if url.scheme == 'https':
+            self._connection_class = http.client.HTTPSConnection
+        else:
+            self._connection_class = http.client.HTTPConnection
+
+        self.host = url.netloc
+        self.prefix = url.path.rstrip('/')
+        self.timeout = timeout
+
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self.opened += 1
+            return self._connection_class(self.host, timeout=self.timeout)
+
+    def _release(self, connection):
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def get(self, path):
+        '''
+        GET path and return status and body. Raises OSError or
+        http.client.HTTPException on network trouble.
+        '''
+        connection = self._acquire()
+
+        try:
+            connection.request('GET', self.prefix + path)
+            response = connection.getresponse()
+            body = response.read()
+        except Exception:
+            connection.close()
+            raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(connection)
+
+        return response.status, body
+
+
+class AsyncConnectionPool:
+    '''
+    ConnectionPool for event loops, on asyncio streams. Speaks just
+    enough HTTP/1.1 for PUG REST. Must only be used from one loop.
+    '''
+    def __init__(self, base_url, size=4, timeout=5.0):
+        url = urllib.parse.urlsplit(base_url)
+
+        if url.scheme == 'https':
+            self.ssl = ssl.create_default_context()
+        else:
+            self.ssl = None
+
+        self.host = url.netloc
+        self.hostname = url.hostname
+        self.port = url.port or (443 if self.ssl else 80)
+        self.prefix = url.path.rstrip('/')
+        self.timeout = timeout
+        self.size = size
+
+        self._idle = []     # (reader, writer)
+        self.opened = 0
+
+    async def _acquire(self):
+        if self._idle:
+            return self._idle.pop()
+
+        self.opened += 1
+        # raises asyncio.TimeoutError, as a stalled exchange does
+        return await asyncio.wait_for(
+            asyncio.open_connection(self.hostname, self.port, ssl=self.ssl),
+            self.timeout)
+
+    def _release(self, connection):
+        if len(self._idle) < self.size:
+            self._idle.append(connection)
+        else:
+            connection[1].close()
+
+    async def _exchange(self, reader, writer, path):
+        request = ('GET %s HTTP/1.1\r\nHost: %s\r\n'
+                   'Accept-Encoding: identity\r\n\r\n'
+                   % (self.prefix + path, self.host))
+        writer.write(request.encode('latin-1'))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:     # the server closed an idle connection
+            raise ConnectionResetError()
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        will_close = headers.get('connection', '').lower() == 'close'
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if not size:
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            # trailers, if any
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            body = b''.join(chunks)
+        elif 'content-length' in headers:
+            body = await reader.readexactly(int(headers['content-length']))
+        else:
+            body = await reader.read()
+            will_close = True
+
+        return status, body, will_close
+
+    async def get(self, path):
+        '''
+        GET path and return status and body. Raises OSError, EOFError,
+        ValueError or asyncio.TimeoutError on network trouble.
+        '''
+        reader, writer = await self._acquire()
+
+        try:
+            status, body, will_close = await asyncio.wait_for(
+                self._exchange(reader, writer, path), self.timeout)
+        except BaseException:
+            writer.close()
+            raise
+
+        if will_close:
+            writer.close()
+        else:
+            self._release((reader, writer))
+
+        return status, body
+
+
+class TTLCache:
+    '''
+    small thread-safe cache whose entries expire after a per-entry
+    time to live. Beyond max_entries, the oldest entries are dropped.
+    '''
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()   # key -> (expiry, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        '''
+        return (True, value) for live entries, (False, None) otherwise
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return False, None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return False, None
+
+            return True, entry[1]
+
+    def put(self, key, value, ttl):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + ttl, value)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class PubChemClient:
+    '''
+    resolves compound names and CIDs. Hits are cached for ttl seconds,
+    misses for the shorter negative_ttl, so that typos don't stick.
+    A cache may be passed in to share it with another client. The
+    counters, like the cache, may be updated from many threads.
+    '''
+    pool_class = ConnectionPool
+
+    def __init__(self, base_url=PUBCHEM_URL, pool_size=4, timeout=5.0,
+                 retries=2, backoff=0.25, ttl=24 * 3600, negative_ttl=600,
+                 cache=None):
+        self.pool = self.pool_class(base_url, pool_size, timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+        self.cache = TTLCache() if cache is None else cache
+
+        self._lock = threading.Lock()   # for the counters
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.requests = 0
+        self.retried = 0
+        self.errors = 0
+
+    def _fetch(self, path):
+        '''
+        GET path, retrying with jittered exponential backoff. Returns
+        the body, or None if PubChem says there is no such thing.
+        '''
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self._backoff(attempt))
+
+            with self._lock:
+                self.requests += 1
+
+            try:
+                status, body = self.pool.get(path)
+            except (OSError, http.client.HTTPException):
+                continue
+
+            if status == 200:
+                return body
+            if status in MISS_STATUS:
+                return None
+            if status not in RETRY_STATUS:
+                break
+
+        with self._lock:
+            self.errors += 1
+        raise PubChemError('PubChem lookup failed: %s' % path)
+
+    def _backoff(self, attempt):
+        '''
+        seconds to wait before a retry, with jitter so that clients
+        that failed together don't retry together
+        '''
+        with self._lock:
+            self.retried += 1
+        delay = self.backoff * 2 ** (attempt - 1)
+        return delay * random.uniform(0.5, 1.5)
+
+    def _cached(self, key):
+        found, value = self.cache.get(key)
+
+        with self._lock:
+            if not found:
+                self.misses += 1
+            elif value is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+
+        return found, value
+
+    def _store(self, key, value):
+        if value is None:
+            self.cache.put(key, None, self.negative_ttl)
+        else:
+            self.cache.put(key, value, self.ttl)
+
+    def _lookup(self, key, path):
+        found, value = self._cached(key)
+        if found:
+            return value
+
+        value = self._fetch(path)
+        self._store(key, value)
+        return value
+
+    def get_sdf(self, cid):
+        '''
+        the SD file of a compound, or None if there's no such CID
+        '''
+        cid = int(cid)
+        return self._lookup(('sdf', cid), SDF_PATH % cid)
+
+    def name_to_smiles(self, name):
+        '''
+        isomeric smiles of the first compound matching name, or None
+        '''
+        name = name.strip()
+        if not name:
+            return None
+
+        return _first_word(self._lookup(*_name_query(name)))
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                cached=len(self.cache),
+                hits=self.hits,
+                negative_hits=self.negative_hits,
+                misses=self.misses,
+                requests=self.requests,
+                retried=self.retried,
+                errors=self.errors,
+                connections_opened=self.pool.opened)
+
+
+def _name_query(name):
+    path = SMILES_PATH % urllib.parse.quote(name, safe='')
+    return ('name', name.lower()), path
+
+
+def _first_word(body):
+    if body is None:
+        return None
+
+    words = body.decode('utf-8', 'replace').split()
+    return words[0] if words else None
+
+
+class AsyncPubChemClient(PubChemClient):
+    '''
+    PubChemClient for event loops
+    '''
+    pool_class = AsyncConnectionPool
+
+    async def _fetch(self, path):
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self._backoff(attempt))
+
+            with self._lock:
+                self.requests += 1
+
+            try:
+                status, body = await self.pool.get(path)
+            except (OSError, EOFError, ValueError, asyncio.TimeoutError):
+                continue
+
+            if status == 200:
+                return body
+            if status in MISS_STATUS:
+                return None
+            if status not in RETRY_STATUS:
+                break
+
+        with self._lock:
+            self.errors += 1
+        raise PubChemError('PubChem lookup failed: %s' % path)
+
+    async def _lookup(self, key, path):
+        found, value = self._cached(key)
+        if found:
+            return value
+
+        value = await self._fetch(path)
+        self._store(key, value)
+        return value
+
+    async def get_sdf(self, cid):
+        cid = int(cid)
+        return await self._lookup(('sdf', cid), SDF_PATH % cid)
+
+    async def name_to_smiles(self, name):
+        name = name.strip()
+        if not name:
+            return None
+
+        return _first_word(await self._lookup(*_name_query(name)))
+
+
+class Resolver:
+    '''
+    answers lookups from the mirror, if there is one, and from the
+    remote client, if there is one, in that order.
+    '''
+    def __init__(self, mirror=None, remote=None):
+        self.mirror = mirror
+        self.remote = remote
+
+    def _resolve(self, method, key):
+        if self.mirror is not None:
+            value = getattr(self.mirror, method)(key)
+            if value is not None:
+                return value
+
+        if self.remote is None:
+            return None
+
+        return getattr(self.remote, method)(key)
+
+    def get_sdf(self, cid):
+        return self._resolve('get_sdf', cid)
+
+    def name_to_smiles(self, name):
+        return self._resolve('name_to_smiles', name)
+
+    def stats(self):
+        return dict(
+            mirror=self.mirror.stats() if self.mirror else None,
+            remote=self.remote.stats() if self.remote else None)
+
+
+class AsyncResolver(Resolver):
+    '''
+    Resolver with an AsyncPubChemClient as the remote. Mirror
+    lookups take microseconds and are done in place.
+    '''
+    async def _resolve(self, method, key):
+        if self.mirror is not None:
+            value = getattr(self.mirror, method)(key)
+            if value is not None:
+                return value
+
+        if self.remote is None:
+            return None
+
+        return await getattr(self.remote, method)(key)
+
+    async def get_sdf(self, cid):
+        return await self._resolve('get_sdf', cid)
+
+    async def name_to_smiles(self, name):
+        return await self._resolve('name_to_smiles', name)
+
+
+# shared by everything in this process; the async client, for the
+# asyncio app, shares the cache of the synchronous one
+client = PubChemClient()
+async_client = AsyncPubChemClient(cache=client.cache)
+
+if PUBCHEM_MIRROR:
+    mirror = PubChemMirror(PUBCHEM_MIRROR)
+    resolver = Resolver(mirror, client if PUBCHEM_FALLBACK else None)
+    async_resolver = AsyncResolver(
+        mirror, async_client if PUBCHEM_FALLBACK else None)
+else:
+    resolver = Resolver(remote=client)
+    async_resolver = AsyncResolver(remote=async_client)
@@ -0,0 +1,136 @@
+'''
+split multi-record input - SD files or lists of smiles - into single
+molecules. Input is consumed line by line, so that arbitrarily large
+files can be processed without reading them into memory.
+'''
+import itertools
+import re
+
+SDF_SEPARATOR = '$$$$'
+
+# atoms in smiles: bracket atoms, two-letter and one-letter organic atoms
+SMILES_ATOM = re.compile(r'\[[^\]]*\]|Br|Cl|[BCNOPSFI]|[bcnops]')
+# ring closures, outside of brackets: digits or %nn
+SMILES_RING = re.compile(r'\[[^\]]*\]|%\d\d|\d')
+
+
+def iter_sdf_records(lines):
+    '''
+    yield the molblock of each record in an SD file. Data items
+    following the molblock are kept; indigo ignores them.
+    '''
+    record = []
+
+    for line in lines:
+        if line.rstrip() == SDF_SEPARATOR:
+            yield ''.join(record)
+            record = []
+        else:
+            record.append(line)
+
+    # last record may lack the separator
+    if ''.join(record).strip():
+        yield ''.join(record)
+
+
+def iter_smiles_records(lines):
+    '''
+    yield the smiles of each line in a smiles file, skipping blank
+    lines. Anything after the smiles string, usually a name, is dropped.
+    '''
+    for line in lines:
+        fields = line.split()
+        if fields:
+            yield fields[0]
+
+
+def is_molblock_header(head):
+    '''
+    the counts line, the fourth line of a molblock, carries
+    the format version at its end.
+    '''
+    if len(head) < 4:
+        return False
+    return head[3].rstrip().endswith(('V2000', 'V3000'))
+
+
+def iter_records(lines):
+    '''
+    yield the records of SD or smiles input, telling them apart
+    by the first four lines.
+    '''
+    lines = iter(lines)
+    head = list(itertools.islice(lines, 4))
+    lines = itertools.chain(head, lines)
+
+    if is_molblock_header(head):
+        return iter_sdf_records(lines)
+
+    return iter_smiles_records(lines)
+
+
+def read_molecule(lines):
+    '''
+    read a single molecule from input lines, telling its format apart
+    on the way. Returns the format - 'cid', 'smiles', 'molblock' or
+    'sdf' - and the data, or None and None if there is no molecule.
+
+    Molblocks are read up to the end of the first record only, so the
+    remainder of a large SD file is never consumed.
+    '''
+    lines = iter(lines)
+    head = list(itertools.islice(lines, 4))
+
+    if is_molblock_header(head):
+        record = head
+        for line in lines:
+            if line.rstrip() == SDF_SEPARATOR:
+                return 'sdf', ''.join(record)
+            record.append(line)
+        return 'molblock', ''.join(record)
+
+    for line in itertools.chain(head, lines):
+        fields = line.split()
+        if fields:
+            if fields[0].isdigit():
+                return 'cid', fields[0]
+            return 'smiles', fields[0]
+
+    return None, None
+
+
+def molecule_size(data):
+    '''
+    rough atom, bond and ring counts of a smiles string or molblock,
+    read off the text without parsing the molecule.
+    '''
+    if isinstance(data, bytes):
+        data = data.decode('latin-1')
+
+    lines = data.splitlines()
+
+    if is_molblock_header(lines):
+        atoms = bonds = 0
+        counts = lines[3]
+
+        try:
+            if counts.rstrip().endswith('V3000'):
+                for line in lines:
+                    if line.startswith('M  V30 COUNTS'):
+                        counts = line.split()
+                        atoms, bonds = int(counts[3]), int(counts[4])
+                        break
+            else:
+                atoms, bonds = int(counts[0:3]), int(counts[3:6])
+        except (ValueError, IndexError):
+            pass    # garbled; indigo will complain later
+
+        return atoms, bonds, max(bonds - atoms + 1, 0)
+
+    smiles = data.split()[0] if data.split() else ''
+    atoms = len(SMILES_ATOM.findall(smiles))
+    closures = [m for m in SMILES_RING.findall(smiles)
+                if not m.startswith('[')]
+    rings = len(closures) // 2
+
+    return atoms, max(atoms - 1, 0) + rings, rings
@@ -0,0 +1,274 @@
+'''
+render a parsed molecule as SVG, directly from the bond tree.
+
+This is meant for instant previews that don't need pdflatex. Bonds are
+drawn the way chemfig draws them: each one starts where its parent
+ended and follows its own angle and length, so that the preview has
+the same layout as the PDF. Atom labels are approximated with plain
+SVG text.
+'''
+import math
+
+from mol2chemfig import metrics
+from mol2chemfig.bond import AromaticRingBond
+
+SCALE = 30.0            # pixels per bond length
+MARGIN = 20.0           # pixels around the molecule
+FONT_SIZE = 13.0
+LABEL_RADIUS = 0.3      # bonds stop short of labeled atoms, in bond lengths
+STROKE_SEP = 0.12       # distance between strokes of multiple bonds
+WEDGE_WIDTH = 0.14      # width of stereo wedges at their wide end
+HASHES = 6              # number of hashes in a hashed wedge
+WAVES = 5               # number of waves in an 'either' bond
+
+# the PDF draws the aromatic circle with 0.75 of the ring's inner
+# radius. AromaticRingBond.radius is 1.5 times the inner radius, so
+# that is 0.5 of it
+CRINGLE_FACTOR = 0.5
+
+
+def atom_label(options, atom):
+    '''
+    return the label of an atom as a list of (text, shift) pieces,
+    where shift is 'sub', 'super' or None. Empty for plain carbons.
+    '''
+    if options.atom_numbers:
+        if atom.element == 'C' and not options.show_carbons:
+            return [(str(atom.idx + 1), 'sub')]
+        return [(atom.element, None), (str(atom.idx + 1), 'sub')]
+
+    if (atom.element == 'C' and atom.charge == 0
+            and not options.show_carbons
+            and (not options.show_methyls or atom.hydrogens < 3)):
+        return []
+
+    element = [(atom.element, None)]
+
+    hydrogens = []
+    if atom.hydrogens:
+        hydrogens.append(('H', None))
+        if atom.hydrogens > 1:
+            hydrogens.append((str(atom.hydrogens), 'sub'))
+
+    charge = []
+    if atom.charge:
+        sign = '+' if atom.charge > 0 else '−'
+        amount = str(abs(atom.charge)) if abs(atom.charge) > 1 else ''
+        charge.append((amount + sign, 'super'))
+
+    if atom.hydrogens and atom.first_quadrant == 'west':
+        return hydrogens + element + charge
+
+    return element + hydrogens + charge
+
+
+def _point(x, y):
+    return '%.2f,%.2f' % (x * SCALE, -y * SCALE)
+
+
+def _line(x1, y1, x2, y2):
+    return '<line x1="%.2f" y1="%.2f" x2="%.2f" y2="%.2f"/>' % (
+        x1 * SCALE, -y1 * SCALE, x2 * SCALE, -y2 * SCALE)
+
+
+def _polygon(points, css_class):
+    return '<polygon class="%s" points="%s"/>' % (
+        css_class, ' '.join(_point(x, y) for x, y in points))
+
+
+def _bond_shapes(bond, x1, y1, x2, y2):
+    '''
+    SVG elements for one bond between two points
+    '''
+    dx, dy = x2 - x1, y2 - y1
+    length = math.hypot(dx, dy) or 1.0
+    # unit normal, pointing to the left of the bond direction
+    nx, ny = -dy / length, dx / length
+
+    bond_type = bond.bond_type
+    styles = bond.tikz_styles
+
+    if bond_type == 'link':
+        return []
+
+    if bond_type in ('upto', 'upfrom', 'downto', 'downfrom'):
+        if bond_type in ('upfrom', 'downfrom'):    # wide end at start
+            x1, y1, x2, y2 = x2, y2, x1, y1
+            nx, ny = -nx, -ny
+        w = WEDGE_WIDTH / 2
+
+        if bond_type in ('upto', 'upfrom'):
+            return [_polygon(
+                [(x1, y1), (x2 + nx * w, y2 + ny * w),
+                 (x2 - nx * w, y2 - ny * w)], 'wedge')]
+
+        hashes = []
+        for i in range(1, HASHES + 1):
+            f = i / HASHES
+            hx, hy = x1 + (x2 - x1) * f, y1 + (y2 - y1) * f
+            hashes.append(_line(hx + nx * w * f, hy + ny * w * f,
+                                hx - nx * w * f, hy - ny * w * f))
+        return hashes
+
+    if bond_type == 'either':
+        points = [(x1, y1)]
+        steps = WAVES * 2
+        for i in range(1, steps):
+            f = i / steps
+            side = 1 if i % 2 else -1
+            points.append((x1 + dx * f + nx * side * WEDGE_WIDTH / 2,
+                           y1 + dy * f + ny * side * WEDGE_WIDTH / 2))
+        points.append((x2, y2))
+        return ['<polyline points="%s"/>' % ' '.join(
+            _point(x, y) for x, y in points)]
+
+    if bond_type == 'triple' or 'triple' in styles:
+        s = STROKE_SEP
+        return [_line(x1, y1, x2, y2),
+                _line(x1 + nx * s, y1 + ny * s, x2 + nx * s, y2 + ny * s),
+                _line(x1 - nx * s, y1 - ny * s, x2 - nx * s, y2 - ny * s)]
+
+    if bond_type == 'double' or 'double' in styles:
+        # second stroke inside rings, or on the side picked for
+        # fancy bonds; otherwise, a symmetric pair of strokes
+        if 'left' in styles or bond.clockwise == -1:
+            side = 1
+        elif 'right' in styles or bond.clockwise == 1:
+            side = -1
+        else:
+            s = STROKE_SEP / 2
+            return [
+                _line(x1 + nx * s, y1 + ny * s, x2 + nx * s, y2 + ny * s),
+                _line(x1 - nx * s, y1 - ny * s, x2 - nx * s, y2 - ny * s)]
+
+        s = STROKE_SEP * side
+        inset = 0.15
+        return [
+            _line(x1, y1, x2, y2),
+            _line(x1 + dx * inset + nx * s, y1 + dy * inset + ny * s,
+                  x2 - dx * inset + nx * s, y2 - dy * inset + ny * s)]
+
+    return [_line(x1, y1, x2, y2)]
+
+
+def _label_text(x, y, pieces):
+    spans = []
+    for text, shift in pieces:
+        if shift is None:
+            spans.append('<tspan>%s</tspan>' % text)
+        else:
+            spans.append('<tspan class="%s" baseline-shift="%s">%s</tspan>'
+                         % (shift, shift, text))
+
+    return '<text x="%.2f" y="%.2f">%s</text>' % (
+        x * SCALE, -y * SCALE, ''.join(spans))
+
+
+@metrics.timed('svg')
+def render_svg(mol):
+    '''
+    render a Molecule to an SVG document
+    '''
+    options = mol.options
+
+    bond_shapes = []
+    label_shapes = []
+    circles = []
+
+    xs, ys = [0.0], [0.0]
+    labels = {}     # atom index -> label pieces
+
+    # iterative walk over the bond tree; entries are (bond, x, y),
+    # with x and y the position of the bond's start atom
+    root = mol.root
+    stack = [(root, 0.0, 0.0)]
+
+    while stack:
+        bond, x, y = stack.pop()
+
+        if isinstance(bond, AromaticRingBond):
+            angle = math.radians(bond.angle)
+            cx = x + bond.length * math.cos(angle)
+            cy = y + bond.length * math.sin(angle)
+            r = bond.radius * CRINGLE_FACTOR
+            circles.append('<circle cx="%.2f" cy="%.2f" r="%.2f"/>' % (
+                cx * SCALE, -cy * SCALE, r * SCALE))
+            continue
+
+        if bond.to_phantom:    # ring closure; the atom is already drawn
+            label = None
+        else:
+            label = atom_label(options, bond.end_atom)
+
+        if bond is root:
+            end_x, end_y = x, y
+        else:
+            angle = math.radians(bond.angle)
+            end_x = x + bond.length * math.cos(angle)
+            end_y = y + bond.length * math.sin(angle)
+
+            if bond.to_phantom:
+                end_label = labels.get(bond.end_atom.idx)
+            else:
+                end_label = label
+
+            x1, y1, x2, y2 = x, y, end_x, end_y
+            dx, dy = x2 - x1, y2 - y1
+            length = math.hypot(dx, dy) or 1.0
+
+            if labels.get(bond.start_atom.idx):
+                x1 += dx / length * LABEL_RADIUS
+                y1 += dy / length * LABEL_RADIUS
+            if end_label:
+                x2 -= dx / length * LABEL_RADIUS
+                y2 -= dy / length * LABEL_RADIUS
+
+            bond_shapes.extend(_bond_shapes(bond, x1, y1, x2, y2))
+
+        xs.append(end_x)
+        ys.append(end_y)
+
+        if label is not None:
+            labels[bond.end_atom.idx] = label
+            if label:
+                label_shapes.append(_label_text(end_x, end_y, label))
+
+        for descendant in reversed(bond.descendants):
+            stack.append((descendant, end_x, end_y))
+
+    min_x, max_x = min(xs) * SCALE, max(xs) * SCALE
+    min_y, max_y = -max(ys) * SCALE, -min(ys) * SCALE
+
+    width = max_x - min_x + 2 * MARGIN
+    height = max_y - min_y + 2 * MARGIN
+
+    return svg_template % dict(
+        x=min_x - MARGIN,
+        y=min_y - MARGIN,
+        width=width,
+        height=height,
+        font_size=FONT_SIZE,
+        bonds='\n'.join(bond_shapes),
+        circles='\n'.join(circles),
+        labels='\n'.join(label_shapes))
+
+
+svg_template = '''<svg xmlns="http://www.w3.org/2000/svg" \
+width="%(width).0f" height="%(height).0f" \
+viewBox="%(x).2f %(y).2f %(width).2f %(height).2f">
+<style>
+line, polyline, circle { stroke: black; stroke-width: 1.2; fill: none; }
+polygon.wedge { fill: black; stroke: none; }
+text { font-family: Helvetica, Arial, sans-serif; font-size: %(font_size)spx;
+       text-anchor: middle; dominant-baseline: central; }
+tspan.sub, tspan.super { font-size: 70%%; }
+</style>
+<g class="bonds">
+%(bonds)s
+%(circles)s
+</g>
+<g class="atoms">
+%(labels)s
+</g>
+</svg>
+'''
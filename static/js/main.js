@@ -5,6 +5,63 @@ $(document).ready(function(){
     $('#check_reset').hide();
     var last_content = "";
 
+    // Show the svg preview until the pdf is ready.
+    function show_preview(svg)
+    {
+	if (svg)
+	  {
+	    $("#svg_preview").html(svg).show();
+	    $("#pdf").hide();
+	  }
+    }
+
+    function show_pdf(src)
+    {
+	$("#svg_preview").hide();
+	$("#pdf").attr('src', src).show();
+    }
+
+    // The pdf is compiled in the background; poll for it until it is done.
+    // If given, is_current is asked before showing the result.
+    function load_pdf(data, is_current)
+    {
+	is_current = is_current || function() { return true; };
+	if (!data.pdf_url)
+	  {
+	    if (data.pdf_link == 'pdf generation foobared')
+	      {
+		show_pdf("static/files/broken.pdf");
+	      }
+	    return;
+	  }
+	$.ajax ({
+	    type: "GET",
+	    url: data.pdf_url,
+	    data: {"wait": 20},
+	    success: function(job){
+		if (!is_current() || job.status == 'superseded')
+		  {
+		    return;
+		  }
+		if (job.status == 'pending')
+		  {
+		    load_pdf(data, is_current);
+		  }
+		else if (job.status == 'done')
+		  {
+		    show_pdf(job.pdf_link);
+		  }
+		else
+		  {
+		    show_pdf("static/files/broken.pdf");
+		  }
+	    },
+	    error: function(error) {
+		console.log(error)
+	    }
+	})
+    }
+
     $('#search').on('click', function() 
       {  
 	chemical = $('#chemical').val();
@@ -53,9 +110,11 @@ $(document).ready(function(){
             last_content = smiles_mol;
 	    angle = $('input[name="angle"]').val();		
 	    $.ajax ({
-		type: "GET",
-		url: "/mol_2_chemfig/smiles_to_chemfig",
-		data: {"smiles_mol": smiles_mol, "check": get_check_value(), "angle": angle, 'hydrogens': hydrogens},			    
+		type: "POST",
+		url: "/mol_2_chemfig/smiles_to_chemfig?" + $.param({"check": get_check_value(), "angle": angle, 'hydrogens': hydrogens}),
+		data: smiles_mol,
+		contentType: "text/plain; charset=utf-8",
+		processData: false,
 		success: function(data2){
 		    if (data2.pdf_link == 'Chemfig cannot be generated')
 			{
@@ -63,7 +122,8 @@ $(document).ready(function(){
 			}
 		    else{
 			   $("#txt_area").val(data2.chem_fig);	
-			    $("#pdf").attr('src', data2.pdf_link);
+			    show_preview(data2.svg);
+			    load_pdf(data2);
 			    $('#check_update').show();
 			    $('#check_reset').show();
 		        }
@@ -95,12 +155,15 @@ $(document).ready(function(){
 	angle = $('input[name="angle"]').val();
 	hydrogens = $('#H2 :selected').text();		
 	$.ajax ({
-	    type: "GET",
-	    url: "/mol_2_chemfig/update",
-	    data: {"smiles_mol": smiles_mol, "check": get_check_value(), "angle": angle, 'hydrogens': hydrogens},			    
+	    type: "POST",
+	    url: "/mol_2_chemfig/update?" + $.param({"check": get_check_value(), "angle": angle, 'hydrogens': hydrogens}),
+	    data: smiles_mol,
+	    contentType: "text/plain; charset=utf-8",
+	    processData: false,
 	    success: function(data4){				
 		$("#txt_area").val(data4.chem_fig);
-		$("#pdf").attr('src', data4.pdf_link);
+		show_preview(data4.svg);
+		load_pdf(data4);
 	    },
 	    error: function(Error) {
 		console.log(error)
@@ -114,6 +177,37 @@ $(document).ready(function(){
         $('#H2').val('keep');
     });
     
+    // Live updates: wait until typing pauses, and number each request so
+    // that responses to older revisions can be dropped. Revisions start
+    // over on every page load, so the server tells pages apart by an id.
+    var live_page = Math.random().toString(36).slice(2) + Date.now().toString(36);
+    var live_revision = 0;
+    var live_timer = null;
+    var live_delay = 300;
+
+    function live_update()
+    {
+	var revision = ++live_revision;
+	smiles_mol = $("#txt_area").val();
+	$.ajax ({
+	    type: "GET",
+	    url: "/mol_2_chemfig/update_chemfig",
+	    data: {"smiles_mol": smiles_mol, "revision": revision, "page": live_page},
+	    success: function(data5){
+		if (data5.superseded || revision != live_revision)
+		  {
+		    return;
+		  }
+		load_pdf(data5, function() {
+		    return revision == live_revision;
+		});
+	    },
+	    error: function(Error) {
+		console.log(error)
+	    }
+	})
+    }
+
     $("#txt_area").keyup(function(e){
 	
 	// Making sure it applies to chemfig format only, not to smiles or mol format.
@@ -124,23 +218,8 @@ $(document).ready(function(){
 		if(code == 16 || code == 32 || code == 37 || code == 38 || code == 39 || code == 40 ) {
 		    return;
 		}
-		smiles_mol = $("#txt_area").val();
-		$.ajax ({
-		    type: "GET",
-		    url: "/mol_2_chemfig/update_chemfig",
-		    data: {"smiles_mol": smiles_mol},		    
-		    success: function(data5){
-			if (data5.pdf_link == 'pdf generation foobared')
-			  {
-			     $("#pdf").attr('src', "static/files/broken.pdf"); 
-			  }
-		      else{ $("#pdf").attr('src', data5.pdf_link);}
-			
-		    },
-		    error: function(Error) {
-			console.log(error)
-		    }
-		})
+		clearTimeout(live_timer);
+		live_timer = setTimeout(live_update, live_delay);
 	   }
 
     });
@@ -0,0 +1,108 @@
+'''
+small laid-out molecules for the tests, built with the synthetic
+toolkit of the benchmarks, so that no toolkit needs to be installed
+'''
+import math
+
+from mol2chemfig.indigo import Indigo
+
+from synthetic import SyntheticMolecule, SyntheticRing
+
+
+def _hexagon(mol, center_x=0.0, center_y=0.0, hydrogens=1):
+    return [mol.add_atom('C',
+                         center_x + math.cos(math.pi / 2 + k * math.pi / 3),
+                         center_y + math.sin(math.pi / 2 + k * math.pi / 3),
+                         hydrogens)
+            for k in range(6)]
+
+
+def benzene():
+    '''
+    benzene with aromatic bonds, as the toolkit leaves them when
+    asked to aromatize
+    '''
+    mol = SyntheticMolecule()
+    ring = _hexagon(mol)
+    mol.rings.append(SyntheticRing([
+        mol.add_bond(ring[k], ring[(k + 1) % 6], 4) for k in range(6)]))
+    return mol
+
+
+def benzoic_acid():
+    '''
+    Kekulé benzene with a carboxyl group, which has a double bond to
+    a heteroatom outside the ring
+    '''
+    mol = SyntheticMolecule()
+    ring = _hexagon(mol)
+    mol.atoms[ring[0]].hydrogens = 0
+    mol.rings.append(SyntheticRing([
+        mol.add_bond(ring[k], ring[(k + 1) % 6], 2 - k % 2)
+        for k in range(6)]))
+
+    carbon = mol.add_atom('C', 0.0, 2.0)
+    oxo = mol.add_atom('O', 0.87, 2.5)
+    hydroxy = mol.add_atom('O', -0.87, 2.5, 1)
+    mol.add_bond(ring[0], carbon)
+    mol.add_bond(carbon, oxo, 2)
+    mol.add_bond(carbon, hydroxy)
+    return mol
+
+
+def wedges():
+    '''
+    a stereocenter with an up and a down wedge: (R)-2-butanol
+    '''
+    mol = SyntheticMolecule()
+    dx = math.cos(math.pi / 6)
+    dy = math.sin(math.pi / 6)
+
+    center = mol.add_atom('C', 0.0, 0.0, 1)
+    methyl = mol.add_atom('C', -dx, -dy, 3)
+    ethyl = mol.add_atom('C', dx, -dy, 2)
+    terminal = mol.add_atom('C', 2 * dx, 0.0, 3)
+    hydroxy = mol.add_atom('O', 0.0, 1.0, 1)
+    hydrogen = mol.add_atom('H', -dx, dy)
+
+    mol.add_bond(center, methyl)
+    mol.add_bond(center, ethyl)
+    mol.add_bond(ethyl, terminal)
+    mol.add_bond(center, hydroxy, stereo=Indigo.UP)
+    mol.add_bond(center, hydrogen, stereo=Indigo.DOWN)
+    return mol
+
+
+def glycine_zwitterion():
+    '''
+    charged atoms: H3N(+)-CH2-C(=O)O(-)
+    '''
+    mol = SyntheticMolecule()
+    dx = math.cos(math.pi / 6)
+    dy = math.sin(math.pi / 6)
+
+    nitrogen = mol.add_atom('N', 0.0, 0.0, 3, charge=1)
+    alpha = mol.add_atom('C', dx, dy, 2)
+    carboxyl = mol.add_atom('C', 2 * dx, 0.0)
+    oxo = mol.add_atom('O', 2 * dx, -1.0)
+    oxide = mol.add_atom('O', 3 * dx, dy, charge=-1)
+
+    mol.add_bond(nitrogen, alpha)
+    mol.add_bond(alpha, carboxyl)
+    mol.add_bond(carboxyl, oxo, 2)
+    mol.add_bond(carboxyl, oxide)
+    return mol
+
+
+def acetonitrile():
+    '''
+    a triple bond between an implicit carbon and an explicit nitrogen
+    '''
+    mol = SyntheticMolecule()
+    methyl = mol.add_atom('C', 0.0, 0.0, 3)
+    carbon = mol.add_atom('C', 1.0, 0.0)
+    nitrogen = mol.add_atom('N', 2.0, 0.0)
+
+    mol.add_bond(methyl, carbon)
+    mol.add_bond(carbon, nitrogen, 3)
+    return mol
@@ -0,0 +1,117 @@
+'''
+batch conversion on an executor, with the toolkit's loading replaced
+by the test molecules: records are their names
+'''
+import concurrent.futures
+import threading
+import time
+
+import pytest
+
+from mol2chemfig import batch
+from mol2chemfig.molecule import Molecule
+from mol2chemfig.options import Options
+
+import molecules
+
+BUILDERS = dict(
+    benzene=molecules.benzene,
+    wedges=molecules.wedges,
+    glycine=molecules.glycine_zwitterion,
+    acetonitrile=molecules.acetonitrile,
+)
+
+
+@pytest.fixture
+def finished(monkeypatch):
+    '''
+    the records in the order their conversions finished. A record
+    named slow-NAME takes a while; a name not known fails.
+    '''
+    order = []
+    lock = threading.Lock()
+
+    def convert(record, options):
+        name = record
+        if name.startswith('slow-'):
+            time.sleep(0.2)
+            name = name[len('slow-'):]
+
+        try:
+            return Molecule(options, BUILDERS[name]())
+        finally:
+            with lock:
+                order.append(record)
+
+    monkeypatch.setattr(batch, 'convert', convert)
+    return order
+
+
+def expected_code(name, options):
+    return Molecule(options, BUILDERS[name]()).render_user()
+
+
+def test_output_in_input_order(finished):
+    # the first chunk is slow, so later ones finish before it
+    records = ['slow-benzene', 'slow-wedges', 'glycine',
+               'acetonitrile', 'benzene', 'wedges', 'glycine']
+    options = Options()
+
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        results = list(batch.convert_ordered(
+            executor, records, options, chunksize=2, window=4))
+
+    assert finished.index('slow-benzene') > finished.index('acetonitrile')
+
+    assert [index for index, _, _ in results] == list(range(len(records)))
+    for record, (_, code, error) in zip(records, results):
+        name = record.replace('slow-', '')
+        assert (code, error) == (expected_code(name, options), None)
+
+
+def test_failed_record_does_not_stop_batch(finished):
+    records = ['benzene', 'unobtainium', 'wedges', 'slow-glycine',
+               'unobtainium', 'acetonitrile']
+
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        results = list(batch.convert_ordered(
+            executor, records, Options(), chunksize=2, window=2))
+
+    assert [index for index, _, _ in results] == list(range(len(records)))
+    for index in (1, 4):
+        assert results[index] == (index, None, "KeyError: 'unobtainium'")
+
+    converted = [index for index, code, _ in results if code is not None]
+    assert converted == [0, 2, 3, 5]
+
+
+def test_submol_names_follow_input(finished):
+    records = ['slow-wedges', 'benzene', 'glycine']
+    options = Options()
+
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        results = list(batch.convert_ordered(
+            executor, records, options, submol_prefix='mol', chunksize=1))
+
+    for (index, code, _), name in zip(results, ['wedges', 'benzene',
+                                                'glycine']):
+        submol = options.replace(submol_name='mol%d' % (index + 1))
+        assert code == expected_code(name, submol)
+
+
+def test_window_bounds_records_read(finished):
+    read = []
+
+    def records():
+        for count in range(100):
+            read.append(count)
+            yield 'benzene'
+
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        results = batch.convert_ordered(
+            executor, records(), Options(), chunksize=3, window=2)
+
+        assert next(results)[0] == 0
+        assert len(read) <= 2 * 3
+
+        assert len(list(results)) == 99
@@ -0,0 +1,92 @@
+'''
+the reverse direction of a bond is a view of it, but linking,
+scaling or decorating one direction must leave the other alone
+'''
+from mol2chemfig.atom import Atom
+from mol2chemfig.bond import Bond, InvertedBond
+from mol2chemfig.indigo import Indigo
+from mol2chemfig.molecule import Molecule
+from mol2chemfig.options import Options
+
+import molecules
+
+
+def atom_pair(options):
+    start = Atom(options, 0, 0.0, 0.0, 'C', 3, 0, 0, [1])
+    end = Atom(options, 1, 1.0, 1.0, 'O', 1, 0, 0, [0])
+    return start, end
+
+
+def test_view_of_wedge():
+    options = Options(markers='b')
+    bond = Bond(options, *atom_pair(options), stereo=Indigo.UP)
+    view = bond.invert()
+
+    assert isinstance(view, InvertedBond)
+    assert view.invert() is bond
+    assert (view.start_atom, view.end_atom) == (bond.end_atom, bond.start_atom)
+    assert view.angle == bond.reverse_angle == 225
+    assert view.bond_type == 'upfrom'
+    assert (view.length, view.marker) == (bond.length, bond.marker) == \
+        (2 ** 0.5, 'b1-2')
+
+
+def test_link_view_leaves_bond():
+    options = Options(markers='b')
+    bond = Bond(options, *atom_pair(options), stereo=Indigo.UP)
+    view = bond.invert()
+
+    view.set_link()
+    view.length = 2.0
+
+    assert (view.bond_type, view.marker, view.length) == ('link', '', 2.0)
+    assert (bond.bond_type, bond.marker, bond.length) == \
+        ('upto', 'b1-2', 2 ** 0.5)
+
+
+def test_link_bond_leaves_view():
+    options = Options(markers='b')
+    bond = Bond(options, *atom_pair(options), bond_type=2)
+    view = bond.invert()
+
+    bond.set_link()
+    bond.length = 2.0
+
+    assert (bond.bond_type, bond.marker) == ('link', '')
+    assert (view.bond_type, view.marker, view.length) == \
+        ('double', 'b1-2', 2 ** 0.5)
+
+
+def test_clone_of_view():
+    options = Options()
+    bond = Bond(options, *atom_pair(options), stereo=Indigo.DOWN)
+    view = bond.invert()
+    view.to_phantom = True
+
+    clone = view.clone()
+    clone.set_link()
+
+    assert type(clone) is Bond
+    assert clone.start_atom is bond.end_atom
+    assert (clone.angle, clone.to_phantom) == (225, True)
+    assert (bond.bond_type, view.bond_type) == ('downto', 'downfrom')
+
+
+def test_decorated_view_leaves_bond():
+    # entering at the second ring atom walks the ring against the
+    # direction of its bonds, so the tree holds views of them
+    mol = Molecule(Options(fancy_bonds=True, entry_atom=2),
+                   molecules.benzoic_acid())
+
+    decorated = [bond for bond in mol.treebonds()
+                 if bond.bond_type == 'decorated']
+    assert len(decorated) == 3
+
+    for view in decorated:
+        assert isinstance(view, InvertedBond)
+        assert 'double' in view.tikz_styles
+
+        bond = view.invert()
+        assert bond.bond_type == 'double'
+        assert bond.tikz_styles == set()
+        assert bond.undecorated is None
@@ -0,0 +1,153 @@
+'''
+the PubChem mirror: importing dumps, looking compounds up, and the
+resolver that falls back to PubChem itself for what the mirror lacks
+'''
+import asyncio
+import gzip
+import threading
+
+import pytest
+
+from mol2chemfig import mirror, pubchem
+
+from loadtest import COMPOUNDS, sdf_record, start_stand_in
+
+# in the mirror; the rest of COMPOUNDS only on the stand-in
+MIRRORED = ('benzene', 'aspirin', 'caffeine')
+
+
+def write_gz(path, text):
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        f.write(text)
+    return str(path)
+
+
+@pytest.fixture
+def dump_files(tmp_path):
+    '''
+    small PubChem dumps: an SD file, a CID-SMILES file that
+    overrides one smiles, and synonyms with a name used twice
+    '''
+    records = ''.join(sdf_record(*COMPOUNDS[name]) for name in MIRRORED)
+
+    aspirin_cid = COMPOUNDS['aspirin'][0]
+    smiles = '%d\tCC(=O)Oc1ccccc1C(=O)O\n' % aspirin_cid
+
+    synonyms = ''.join('%d\t%s\n' % (COMPOUNDS[name][0], name.title())
+                       for name in MIRRORED)
+    synonyms += '%d\tAcetylsalicylic acid\n' % aspirin_cid
+    # a name that belongs to several compounds keeps the first one
+    synonyms += '%d\tacetylsalicylic acid\n' % COMPOUNDS['caffeine'][0]
+
+    return dict(
+        sdf=write_gz(tmp_path / 'Compound.sdf.gz', records),
+        smiles=write_gz(tmp_path / 'CID-SMILES.gz', smiles),
+        synonyms=write_gz(tmp_path / 'CID-Synonym-filtered.gz', synonyms),
+        database=str(tmp_path / 'pubchem.db'))
+
+
+@pytest.fixture
+def mirrored(dump_files):
+    mirror.main([dump_files['database'],
+                 '--sdf', dump_files['sdf'],
+                 '--smiles', dump_files['smiles'],
+                 '--synonyms', dump_files['synonyms']])
+    return mirror.PubChemMirror(dump_files['database'])
+
+
+def test_lookup_by_name(mirrored):
+    assert mirrored.name_to_smiles('Benzene') == COMPOUNDS['benzene'][1]
+    assert mirrored.name_to_smiles(' CAFFEINE ') == COMPOUNDS['caffeine'][1]
+
+    # from the CID-SMILES dump, which was imported after the SD file
+    assert mirrored.name_to_smiles('acetylsalicylic acid') == \
+        'CC(=O)Oc1ccccc1C(=O)O'
+
+    assert mirrored.name_to_smiles('ibuprofen') is None
+    assert mirrored.stats() == dict(hits=3, misses=1)
+
+
+def test_lookup_by_cid(mirrored):
+    cid, smiles = COMPOUNDS['caffeine']
+
+    sdf = mirrored.get_sdf(cid).decode()
+    assert sdf.startswith(str(cid))
+    assert sdf.endswith('M  END\n')
+
+    assert mirrored.get_sdf(str(cid)) is not None
+    assert mirrored.get_sdf(COMPOUNDS['ibuprofen'][0]) is None
+
+
+def test_import_again_updates(mirrored, dump_files):
+    mirrored.import_smiles(['%d\tC1CCCCC1\n' % COMPOUNDS['benzene'][0]])
+    assert mirrored.name_to_smiles('benzene') == 'C1CCCCC1'
+
+    # a new import of the SD file replaces it again
+    with mirror.open_dump(dump_files['sdf']) as f:
+        assert mirrored.import_sdf(f) == len(MIRRORED)
+    assert mirrored.name_to_smiles('benzene') == COMPOUNDS['benzene'][1]
+
+
+def test_counters_across_threads(mirrored):
+    threads, lookups = 8, 200
+
+    def look_up():
+        for _ in range(lookups):
+            mirrored.name_to_smiles('benzene')
+            mirrored.name_to_smiles('ibuprofen')
+
+    workers = [threading.Thread(target=look_up) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert mirrored.stats() == dict(hits=threads * lookups,
+                                    misses=threads * lookups)
+
+
+@pytest.fixture
+def stand_in():
+    server = start_stand_in(0)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_resolver_falls_back_to_client(mirrored, stand_in):
+    client = pubchem.PubChemClient(stand_in.url)
+    resolver = pubchem.Resolver(mirrored, client)
+
+    assert resolver.name_to_smiles('aspirin') == 'CC(=O)Oc1ccccc1C(=O)O'
+    assert stand_in.requests == 0
+
+    assert resolver.name_to_smiles('ibuprofen') == COMPOUNDS['ibuprofen'][1]
+    cid, smiles = COMPOUNDS['nicotine']
+    assert smiles in resolver.get_sdf(cid).decode()
+    assert resolver.name_to_smiles('unobtainium') is None
+    assert stand_in.requests == 3
+
+    stats = resolver.stats()
+    assert stats['mirror'] == dict(hits=1, misses=3)
+    assert stats['remote']['misses'] == 3
+
+
+def test_resolver_without_fallback(mirrored):
+    resolver = pubchem.Resolver(mirrored)
+
+    assert resolver.name_to_smiles('caffeine') == COMPOUNDS['caffeine'][1]
+    assert resolver.name_to_smiles('ibuprofen') is None
+    assert resolver.stats()['remote'] is None
+
+
+def test_async_resolver_falls_back_to_client(mirrored, stand_in):
+    client = pubchem.AsyncPubChemClient(stand_in.url)
+    resolver = pubchem.AsyncResolver(mirrored, client)
+
+    async def look_up():
+        return (await resolver.name_to_smiles('benzene'),
+                await resolver.name_to_smiles('dopamine'))
+
+    assert asyncio.run(look_up()) == (COMPOUNDS['benzene'][1],
+                                      COMPOUNDS['dopamine'][1])
+    assert stand_in.requests == 1
@@ -0,0 +1,133 @@
+'''
+building and rendering the molecule tree without recursion, the
+coordinate array, and the vectorized bond and ring geometry
+'''
+import os
+import random
+import sys
+
+import numpy
+import pytest
+
+from mol2chemfig import bond, geometry
+from mol2chemfig.molecule import Molecule
+from mol2chemfig.options import Options
+
+import molecules
+from synthetic import polymer
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'snapshots')
+
+# the snapshots were written by the recursive tree code this replaced
+POLYMER_CASES = [
+    ('polymer', {}),
+    ('polymer_fancy', dict(fancy_bonds=True, to_exit=True)),
+    ('polymer_cross', dict(entry_atom=5, cross_bond=[(3, 4)])),
+]
+
+
+@pytest.mark.parametrize('name, structure', POLYMER_CASES,
+                         ids=[case[0] for case in POLYMER_CASES])
+def test_render_matches_recursive_tree(name, structure):
+    mol, exit_atom = polymer(40, ring_every=4)
+    options = dict(structure)
+    if options.pop('to_exit', False):
+        options['exit_atom'] = exit_atom
+
+    with open(os.path.join(SNAPSHOT_DIR, name + '.tex'),
+              encoding='utf-8') as f:
+        assert Molecule(Options(**options), mol).render_user() == f.read()
+
+
+def test_tree_deeper_than_recursion_limit():
+    tkmol, exit_atom = polymer(2 * sys.getrecursionlimit())
+    mol = Molecule(Options(exit_atom=exit_atom), tkmol)
+
+    # each bond joins the tree once, ring closures included
+    assert len(mol.treebonds()) == len(mol.atom_pairs)
+    assert mol.exit_atom.idx == exit_atom - 1
+    assert mol.render_user().rstrip().endswith('%% %d' % exit_atom)
+
+
+def test_treebonds_in_pre_order():
+    mol = Molecule(Options(), polymer(60, ring_every=4)[0])
+
+    def walk(node):
+        yield node
+        for descendant in node.descendants:
+            yield from walk(descendant)
+
+    assert mol.treebonds(root=True) == list(walk(mol.root))
+    assert mol.treebonds() == list(walk(mol.root))[1:]
+
+
+def test_atoms_and_bonds_have_no_dict():
+    mol = Molecule(Options(), molecules.benzoic_acid())
+
+    for item in list(mol.atoms.values()) + mol.treebonds(root=True):
+        assert not hasattr(item, '__dict__')
+
+
+@pytest.mark.parametrize('flips', [{}, dict(flip_horizontal=True),
+                                   dict(flip_vertical=True)])
+def test_coordinates_match_atoms(flips):
+    tkmol = molecules.benzoic_acid()
+    mol = Molecule(Options(**flips), tkmol)
+
+    assert mol.coordinates.shape == (len(mol.atoms), 2)
+
+    sign_x = -1 if flips.get('flip_horizontal') else 1
+    sign_y = -1 if flips.get('flip_vertical') else 1
+
+    for row, atom in enumerate(mol.atoms.values()):
+        x, y, _z = tkmol.atoms[atom.idx].xyz()
+        assert tuple(mol.coordinates[row]) == (atom.x, atom.y) == \
+            (sign_x * x, sign_y * y)
+
+
+def random_points(count, rng):
+    '''
+    points on a small grid, so that some pairs are axis-aligned or
+    coincide, and some anywhere
+    '''
+    points = [(rng.randint(-2, 2) / 2, rng.randint(-2, 2) / 2)
+              for _ in range(count // 2)]
+    points += [(rng.uniform(-5, 5), rng.uniform(-5, 5))
+               for _ in range(count - len(points))]
+    rng.shuffle(points)
+    return numpy.array(points)
+
+
+def test_bond_geometry_matches_compare_positions():
+    rng = random.Random(3)
+    coordinates = random_points(200, rng)
+    starts = [rng.randrange(200) for _ in range(1000)]
+    ends = [rng.randrange(200) for _ in range(1000)]
+
+    lengths, angles = geometry.bond_geometry(coordinates, starts, ends)
+
+    for start, end, length, angle in zip(starts, ends, lengths, angles):
+        expected = bond.compare_positions(*coordinates[start],
+                                          *coordinates[end])
+        assert (length, angle) == pytest.approx(expected, abs=1e-9)
+
+
+def test_ring_geometry_matches_compare_positions():
+    rng = random.Random(5)
+    coordinates = random_points(60, rng)
+    rings = [rng.sample(range(60), rng.randint(3, 8)) for _ in range(20)]
+
+    measured = geometry.ring_geometry(coordinates, rings)
+    assert len(measured) == len(rings)
+
+    for ring, (center_x, center_y, distances, angles) in zip(rings, measured):
+        assert (center_x, center_y) == pytest.approx(
+            tuple(coordinates[ring].mean(axis=0)), abs=1e-12)
+
+        for row, distance, angle in zip(ring, distances, angles):
+            expected = bond.compare_positions(*coordinates[row],
+                                              center_x, center_y)
+            assert (distance, angle) == pytest.approx(expected, abs=1e-9)
+
+    assert geometry.ring_geometry(coordinates, []) == []
@@ -0,0 +1,68 @@
+'''
+pdf jobs of the web apps, with pdflatex replaced by a stub
+'''
+import pytest
+
+from chemistry import chemfig
+from chemistry.cache import Conversion
+from mol2chemfig import pdfgen
+
+
+@pytest.fixture
+def compiles(monkeypatch):
+    '''
+    the chemfig code of each compilation, in order
+    '''
+    calls = []
+
+    def render_pdf(code, width, height, ticket=None):
+        calls.append(code)
+        return b'%PDF-' + code.encode()
+
+    monkeypatch.setattr(pdfgen, 'render_pdf', render_pdf)
+    chemfig.pdf_store.clear()
+    return calls
+
+
+def wait_done(job):
+    status, digest = chemfig.pdf_job_result(job, timeout=5)
+    assert status == 'done'
+    return digest
+
+
+def test_cached_pdf_is_reused(compiles):
+    conversion = Conversion('c', r'\chemfig{C}', 1.0, 1.0)
+
+    digest = wait_done(chemfig.conversion_pdf_job(conversion))
+    job = chemfig.conversion_pdf_job(conversion)
+
+    assert wait_done(job) == digest
+    assert len(compiles) == 1
+
+
+def test_evicted_pdf_is_compiled_again(compiles):
+    conversion = Conversion('c', r'\chemfig{O}', 1.0, 1.0)
+
+    job = chemfig.conversion_pdf_job(conversion)
+    digest = wait_done(job)
+
+    chemfig.pdf_store.clear()
+    assert chemfig.pdf_job_result(job) == ('failed', None)
+
+    # the same molecule again, with the same job id
+    assert chemfig.conversion_pdf_job(conversion) == job
+    assert wait_done(job) == digest
+    assert digest in chemfig.pdf_store
+    assert len(compiles) == 2
+
+
+def test_evicted_edited_pdf_is_compiled_again(compiles):
+    code = r'\chemfig{N}'
+
+    job = chemfig.update_chemfig(code)
+    wait_done(job)
+    chemfig.pdf_store.clear()
+
+    assert chemfig.update_chemfig(code) == job
+    wait_done(job)
+    assert compiles == [code, code]
@@ -0,0 +1,40 @@
+'''
+compiling outside of the pool, with pdflatex replaced by a script
+that never finishes
+'''
+import asyncio
+import os
+import subprocess
+import time
+
+import pytest
+
+from mol2chemfig import pdfgen
+
+
+@pytest.fixture
+def stuck_latex(tmp_path, monkeypatch):
+    script = tmp_path / 'pdflatex'
+    script.write_text('#!/bin/sh\nexec sleep 60\n')
+    script.chmod(0o755)
+
+    monkeypatch.setenv('PATH', str(tmp_path) + os.pathsep + os.environ['PATH'])
+    monkeypatch.setattr(pdfgen, 'FORMAT', None)
+
+
+def test_call_latex_times_out(stuck_latex):
+    started = time.monotonic()
+
+    with pytest.raises(subprocess.CalledProcessError) as raised:
+        pdfgen.call_latex('x.tex', {'x.tex': ''}, timeout=0.5)
+
+    assert raised.value.output == b'timed out'
+    assert time.monotonic() - started < 10
+
+
+def test_call_latex_async_times_out(stuck_latex):
+    with pytest.raises(subprocess.CalledProcessError) as raised:
+        asyncio.run(pdfgen.call_latex_async('x.tex', {'x.tex': ''},
+                                            timeout=0.5))
+
+    assert raised.value.output == b'timed out'
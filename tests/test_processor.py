@@ -0,0 +1,11 @@
+'''
+the command line entry point
+'''
+import pytest
+
+from mol2chemfig.processor import process
+
+
+@pytest.mark.parametrize('rawargs', ['', '--i direct', '--f 1 --o 1'])
+def test_missing_target_is_an_error(rawargs):
+    assert process(rawargs) == (False, 'no input given')
@@ -0,0 +1,151 @@
+'''
+the PubChem client against the local stand-in of the load generator
+'''
+import asyncio
+import threading
+
+import pytest
+
+from mol2chemfig import pubchem
+
+from loadtest import COMPOUNDS, start_stand_in
+
+
+@pytest.fixture
+def stand_in():
+    server = start_stand_in(0)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    '''
+    the backoff delays, recorded instead of slept
+    '''
+    delays = []
+    monkeypatch.setattr(pubchem.time, 'sleep', delays.append)
+    return delays
+
+
+def make_client(server, **kwargs):
+    return pubchem.PubChemClient(server.url, **kwargs)
+
+
+def test_cache_hits(stand_in):
+    client = make_client(stand_in)
+    smiles = COMPOUNDS['aspirin'][1]
+
+    assert client.name_to_smiles('aspirin') == smiles
+    assert client.name_to_smiles('Aspirin ') == smiles
+    assert client.name_to_smiles('unobtainium') is None
+    assert client.name_to_smiles('unobtainium') is None
+
+    stats = client.stats()
+    assert stats['misses'] == 2
+    assert stats['hits'] == 1
+    assert stats['negative_hits'] == 1
+    assert stats['requests'] == stand_in.requests == 2
+
+
+def test_sdf_lookup(stand_in):
+    client = make_client(stand_in)
+    cid, smiles = COMPOUNDS['caffeine']
+
+    assert smiles in client.get_sdf(cid).decode()
+    assert client.get_sdf(1) is None
+    assert stand_in.requests == 2
+
+
+def test_backoff_on_503(stand_in, sleeps):
+    client = make_client(stand_in, retries=2, backoff=0.25)
+    stand_in.throttled = 2
+
+    assert client.name_to_smiles('benzene') == COMPOUNDS['benzene'][1]
+    assert stand_in.requests == 3
+
+    # jittered exponential backoff: 0.25 s, then 0.5 s, give or take half
+    assert len(sleeps) == 2
+    assert 0.125 <= sleeps[0] <= 0.375
+    assert 0.25 <= sleeps[1] <= 0.75
+
+    stats = client.stats()
+    assert stats['retried'] == 2
+    assert stats['errors'] == 0
+
+
+def test_gives_up_after_retries(stand_in, sleeps):
+    client = make_client(stand_in, retries=2)
+    stand_in.throttled = 3
+
+    with pytest.raises(pubchem.PubChemError):
+        client.name_to_smiles('benzene')
+
+    assert stand_in.requests == 3
+    assert client.stats()['errors'] == 1
+
+    # failures aren't cached
+    assert client.name_to_smiles('benzene') == COMPOUNDS['benzene'][1]
+
+
+def test_keep_alive(stand_in):
+    client = make_client(stand_in)
+
+    for name in COMPOUNDS:
+        assert client.name_to_smiles(name) == COMPOUNDS[name][1]
+
+    assert stand_in.requests == len(COMPOUNDS)
+    assert stand_in.connections == 1
+    assert client.stats()['connections_opened'] == 1
+
+
+def test_keep_alive_async(stand_in):
+    client = pubchem.AsyncPubChemClient(stand_in.url)
+
+    async def look_up_all():
+        return [await client.name_to_smiles(name) for name in COMPOUNDS]
+
+    results = asyncio.run(look_up_all())
+
+    assert results == [smiles for _cid, smiles in COMPOUNDS.values()]
+    assert stand_in.connections == 1
+    assert client.stats()['connections_opened'] == 1
+
+
+def test_counters_across_threads(stand_in):
+    client = make_client(stand_in)
+    client.name_to_smiles('glucose')
+
+    threads, lookups = 8, 500
+
+    def look_up():
+        for _ in range(lookups):
+            client.name_to_smiles('glucose')
+
+    workers = [threading.Thread(target=look_up) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    stats = client.stats()
+    assert stats['misses'] == 1
+    assert stats['hits'] == threads * lookups
+
+
+def test_connect_timeout_async(monkeypatch):
+    async def stalled_connect(*args, **kwargs):
+        await asyncio.sleep(3600)
+
+    monkeypatch.setattr(pubchem.asyncio, 'open_connection', stalled_connect)
+
+    client = pubchem.AsyncPubChemClient(
+        'http://127.0.0.1:9', timeout=0.05, retries=1, backoff=0.01)
+
+    with pytest.raises(pubchem.PubChemError):
+        asyncio.run(asyncio.wait_for(client.name_to_smiles('benzene'), 5))
+
+    stats = client.stats()
+    assert stats['requests'] == 2
+    assert stats['errors'] == 1
@@ -0,0 +1,73 @@
+'''
+Molecule.rerender must give the same output as building the molecule
+anew with the new options, for every presentation option
+'''
+import pytest
+
+from mol2chemfig.molecule import Molecule
+from mol2chemfig.options import Options, PRESENTATION_OPTIONS
+from mol2chemfig.svg import render_svg
+
+import molecules
+
+MOLECULES = [
+    molecules.benzoic_acid,
+    molecules.acetonitrile,
+    molecules.wedges,
+    molecules.glycine_zwitterion,
+]
+
+# structure options to build with; fancy bonds depend on how atoms
+# are rendered
+STRUCTURES = [
+    {},
+    dict(fancy_bonds=True),
+    dict(fancy_bonds=True, aromatic_circles=True),
+]
+
+# a value other than the default for each presentation option
+PRESENTATION_VALUES = dict(
+    terse=True,
+    indent=2,
+    submol_name='mol',
+    chemfig_command=True,
+    relative_angles=True,
+    angle_round=0,
+    atom_numbers=True,
+    show_carbons=True,
+    show_methyls=True,
+)
+
+
+def test_every_presentation_option_is_covered():
+    assert set(PRESENTATION_VALUES) == set(PRESENTATION_OPTIONS)
+
+
+def outputs(mol):
+    return mol.render_user(), mol.render_server(), render_svg(mol)
+
+
+@pytest.mark.parametrize('build', MOLECULES,
+                         ids=[build.__name__ for build in MOLECULES])
+@pytest.mark.parametrize('structure', STRUCTURES,
+                         ids=['+'.join(s) or 'plain' for s in STRUCTURES])
+@pytest.mark.parametrize('name', sorted(PRESENTATION_VALUES))
+def test_rerender_matches_fresh_conversion(build, structure, name):
+    options = Options(**structure)
+    changed = options.replace(**{name: PRESENTATION_VALUES[name]})
+
+    mol = Molecule(options, build())
+
+    # there and back again
+    mol.rerender(changed)
+    assert outputs(mol) == outputs(Molecule(changed, build()))
+
+    mol.rerender(options)
+    assert outputs(mol) == outputs(Molecule(options, build()))
+
+
+def test_rerender_rejects_structure_changes():
+    mol = Molecule(Options(), molecules.benzoic_acid())
+
+    with pytest.raises(ValueError):
+        mol.rerender(Options(fancy_bonds=True))
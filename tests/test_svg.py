@@ -0,0 +1,127 @@
+'''
+visual regression tests for the SVG preview: each molecule is rendered
+and compared with a reviewed snapshot in tests/snapshots. After an
+intended change to the drawing, write new snapshots with
+
+    MOL2CHEMFIG_UPDATE_SNAPSHOTS=1 python -m pytest tests/test_svg.py
+
+and look at them before committing.
+
+The snapshots only catch changes, so the layout is also checked
+against the atom coordinates, which the PDF is sized from.
+'''
+import math
+import os
+import xml.etree.ElementTree as ElementTree
+
+import pytest
+
+from mol2chemfig.molecule import Molecule
+from mol2chemfig.options import Options
+from mol2chemfig.svg import MARGIN, SCALE, atom_label, render_svg
+
+import molecules
+from synthetic import polymer
+
+SVG = '{http://www.w3.org/2000/svg}'
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'snapshots')
+
+UPDATE = os.environ.get('MOL2CHEMFIG_UPDATE_SNAPSHOTS') == '1'
+
+CASES = [
+    ('benzene', molecules.benzene, dict(aromatic_circles=True)),
+    ('wedges', molecules.wedges, {}),
+    ('charges', molecules.glycine_zwitterion, {}),
+]
+
+
+@pytest.mark.parametrize('name, build, options', CASES,
+                         ids=[case[0] for case in CASES])
+def test_svg_snapshot(name, build, options):
+    svg = render_svg(Molecule(Options(**options), build()))
+    path = os.path.join(SNAPSHOT_DIR, name + '.svg')
+
+    if UPDATE:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(svg)
+
+    with open(path, encoding='utf-8') as f:
+        assert svg == f.read()
+
+
+GEOMETRY_CASES = [
+    ('benzene', molecules.benzene, dict(aromatic_circles=True)),
+    ('wedges', molecules.wedges, {}),
+    ('charges', molecules.glycine_zwitterion, {}),
+    ('rotated', molecules.benzoic_acid, dict(rotate=30.0)),
+    ('flipped', molecules.benzoic_acid, dict(flip_horizontal=True,
+                                             show_carbons=True)),
+    ('scaled', molecules.acetonitrile, dict(bond_scale='scale',
+                                            bond_stretch=1.5)),
+    ('polymer', lambda: polymer(40, ring_every=4)[0], {}),
+]
+
+
+def atom_positions(mol):
+    '''
+    where each atom should be drawn, in SVG pixels: its coordinates
+    rotated and scaled as the PDF lays them out, relative to the
+    entry atom, which the drawing starts from
+    '''
+    alpha = math.radians(mol.options.rotate)
+    entry = mol.entry_atom
+    positions = {}
+
+    for atom in mol.atoms.values():
+        x, y = atom.x - entry.x, atom.y - entry.y
+        x, y = (x * math.cos(alpha) - y * math.sin(alpha),
+                x * math.sin(alpha) + y * math.cos(alpha))
+        positions[atom.idx] = (x * mol.bond_scale * SCALE,
+                               -y * mol.bond_scale * SCALE)
+
+    return positions
+
+
+@pytest.mark.parametrize('name, build, options', GEOMETRY_CASES,
+                         ids=[case[0] for case in GEOMETRY_CASES])
+def test_svg_matches_coordinates(name, build, options):
+    mol = Molecule(Options(**options), build())
+    root = ElementTree.fromstring(render_svg(mol))
+
+    # the drawing spans the size of the PDF, plus margins
+    width, height = mol.dimensions()
+    x, y, view_width, view_height = map(float, root.get('viewBox').split())
+
+    assert view_width == pytest.approx(width * SCALE + 2 * MARGIN, abs=0.5)
+    assert view_height == pytest.approx(height * SCALE + 2 * MARGIN, abs=0.5)
+
+    positions = atom_positions(mol)
+    xs = [px for px, _ in positions.values()]
+    ys = [py for _, py in positions.values()]
+    assert x == pytest.approx(min(xs) - MARGIN, abs=0.5)
+    assert y == pytest.approx(min(ys) - MARGIN, abs=0.5)
+
+    # each label sits on its atom
+    labels = [(float(text.get('x')), float(text.get('y')))
+              for text in root.iter(SVG + 'text')]
+    labeled = [positions[atom.idx] for atom in mol.atoms.values()
+               if atom_label(mol.options, atom)]
+
+    assert len(labels) == len(labeled)
+    for label in labels:
+        assert any(near(label, position) for position in labeled)
+
+    # and bonds start and end on the atoms without labels
+    ends = [(float(line.get('x' + end)), float(line.get('y' + end)))
+            for line in root.iter(SVG + 'line') for end in '12']
+    plain = [positions[atom.idx] for atom in mol.atoms.values()
+             if not atom_label(mol.options, atom)]
+
+    for position in plain:
+        assert any(near(end, position) for end in ends)
+
+
+def near(point, other):
+    return math.hypot(point[0] - other[0], point[1] - other[1]) < 0.5